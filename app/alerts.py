@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import uuid
+from collections import deque
+
+from riskmap import SEVERITY_LEVELS, severity_of
+
+# Severities from lowest to highest, for min_severity filters
+SEVERITY_ORDER = {level: rank for rank, (_, level) in enumerate(reversed(SEVERITY_LEVELS))}
+
+# Events kept for /ws/alerts clients resuming after a disconnect
+ALERT_HISTORY_SIZE = int(os.environ.get("ALERT_HISTORY_SIZE", "10000"))
+
+# Regions followed as hotspots (the top of the risk ranking)
+HOTSPOT_COUNT = 10
+
+# Fields whose change makes an alert or hotspot "updated"
+ALERT_FIELDS = ("severity", "trend", "days_to_impact")
+HOTSPOT_FIELDS = ("rank", "trend")
+
+# What filters look at; updates carry these fields of the previous state too
+FILTER_FIELDS = ("countries", "region", "type", "severity")
+
+
+def _fingerprint(item, fields):
+    # Risk is compared at two decimals so rescoring noise is not an update
+    return tuple(item.get(field) for field in fields) + (round(item["risk"], 2),)
+
+
+def hotspot_items(table, count=HOTSPOT_COUNT):
+    items = {}
+    for rank, hotspot in enumerate(table.hotspots(count), start=1):
+        item = {
+            **hotspot,
+            "id": f"hotspot-{hotspot['country']}-{hotspot['region']}".replace(" ", "_"),
+            "type": "hotspot",
+            "countries": [hotspot["country"]],
+            "severity": severity_of(hotspot["risk"]),
+            "rank": rank
+        }
+        items[item["id"]] = item
+    return items
+
+
+# Server-side subscription filter; every field is optional
+class AlertFilter:
+    def __init__(self, countries=None, regions=None, types=None, min_severity=None):
+        if min_severity is not None and min_severity not in SEVERITY_ORDER:
+            raise ValueError(f"min_severity must be one of {', '.join(SEVERITY_ORDER)}")
+        self.countries = set(countries) if countries else None
+        self.regions = set(regions) if regions else None
+        self.types = set(types) if types else None
+        self.min_rank = SEVERITY_ORDER[min_severity] if min_severity else None
+
+    @classmethod
+    def from_query(cls, country=None, region=None, type=None, min_severity=None):
+        # Comma-separated lists, as they arrive in query parameters
+        split = lambda value: [part.strip() for part in value.split(",") if part.strip()] if value else None
+        return cls(split(country), split(region), split(type), min_severity or None)
+
+    def matches_item(self, item):
+        if self.countries is not None and not self.countries.intersection(item.get("countries", [])):
+            return False
+        if self.regions is not None and item.get("region") not in self.regions:
+            return False
+        if self.types is not None and item.get("type") not in self.types:
+            return False
+        if self.min_rank is not None and SEVERITY_ORDER.get(item.get("severity"), -1) < self.min_rank:
+            return False
+        return True
+
+    def variant(self, event):
+        """How this subscriber sees an event: its own kind, entered_filter, left_filter or None
+
+        An update that moves an alert out of the filter (lower severity, other
+        country...) becomes left_filter so the client drops it; one that moves
+        it in becomes entered_filter.
+        """
+        now = self.matches_item(event["item"])
+        previous = event.get("previous")
+        before = now if previous is None else self.matches_item(previous)
+        if now and before:
+            return event["event"]
+        if now:
+            return "entered_filter"
+        if before:
+            return "left_filter"
+        return None
+
+    def view(self, event):
+        # The event as sent to this subscriber, or None
+        kind = self.variant(event)
+        if kind is None:
+            return None
+        return event if kind == event["event"] else {**event, "event": kind}
+
+
+# Alerts and hotspots as a sequenced event log: each risk-map run is diffed
+# against the previous one and only new, changed and resolved items become
+# events. Sequence numbers are unique per stream (one per process start).
+class AlertFeed:
+    def __init__(self, history_size=ALERT_HISTORY_SIZE, hotspot_count=HOTSPOT_COUNT):
+        self.stream = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.history = deque(maxlen=history_size)
+        self.hotspot_count = hotspot_count
+        self.items = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def _current_items(self, table):
+        items = {alert["id"]: {**alert, "kind": "alert"} for alert in table.alerts}
+        for key, item in hotspot_items(table, self.hotspot_count).items():
+            items[key] = {**item, "kind": "hotspot"}
+        return items
+
+    def update(self, table, announce=True):
+        """Diff a new risk table against the current items and return the new events
+
+        With announce=False the table only becomes the baseline (e.g. the
+        table restored at startup, which clients get through snapshots).
+        """
+        items = self._current_items(table)
+        fingerprints = {
+            key: _fingerprint(item, ALERT_FIELDS if item["kind"] == "alert" else HOTSPOT_FIELDS)
+            for key, item in items.items()
+        }
+        events = []
+        with self._lock:
+            if announce:
+                for key, item in items.items():
+                    previous = self._fingerprints.get(key)
+                    if previous is None:
+                        events.append(("created", item, None))
+                    elif previous != fingerprints[key]:
+                        events.append(("updated", item, self.items[key]))
+                for key, item in self.items.items():
+                    if key not in items:
+                        events.append(("resolved", item, None))
+                # Most urgent first within one run
+                events.sort(key=lambda event: -event[1]["risk"])
+                events = [self._record(*event) for event in events]
+            self.items = items
+            self._fingerprints = fingerprints
+        return events
+
+    def _record(self, kind, item, previous=None):
+        self.seq += 1
+        event = {
+            "type": "alert_event",
+            "stream": self.stream,
+            "seq": self.seq,
+            "event": kind,
+            "kind": item["kind"],
+            "id": item["id"],
+            "item": item
+        }
+        if previous is not None:
+            event["previous"] = {field: previous.get(field) for field in FILTER_FIELDS}
+        self.history.append(event)
+        return event
+
+    def replay(self, since, alert_filter):
+        """Events after since that match, or None if they are no longer all retained"""
+        with self._lock:
+            if since > self.seq:
+                return None
+            oldest = self.history[0]["seq"] if self.history else self.seq + 1
+            if since < oldest - 1:
+                return None
+            views = (alert_filter.view(event) for event in self.history if event["seq"] > since)
+            return [event for event in views if event is not None]
+
+    def snapshot(self, alert_filter, limit=200):
+        """Current matching items, highest risk first"""
+        with self._lock:
+            matching = [item for item in self.items.values() if alert_filter.matches_item(item)]
+            seq = self.seq
+        matching.sort(key=lambda item: -item["risk"])
+        return {
+            "type": "alerts_snapshot",
+            "stream": self.stream,
+            "seq": seq,
+            "total": len(matching),
+            "items": matching[:limit]
+        }
+
+    def snapshot_message(self, alert_filter, limit=200):
+        return json.dumps(self.snapshot(alert_filter, limit))
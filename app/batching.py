@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+from metrics import BATCH_SIZE, PREDICTION_STAGE_LATENCY
+
+
+# Raised to callers whose record was still waiting when the batcher stopped
+class BatcherStopped(RuntimeError):
+    pass
+
+
+# Coalesce concurrent single-record predictions into one vectorized call
+class PredictionBatcher:
+    def __init__(self, score_batch, window_ms=3.0, max_batch_size=64):
+        # score_batch(records) -> (predictions, probabilities), run in the threadpool
+        self.score_batch = score_batch
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._worker = None
+        self.stats = {
+            "requests": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "last_batch_size": 0,
+            "max_batch_size_seen": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+        }
+
+    def _ensure_worker(self):
+        # Started lazily so the queue and task belong to the serving event loop
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, record):
+        """Queue one record and wait for its (prediction, probability)"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((record, future, time.perf_counter()))
+        return await future
+
+    async def stop(self):
+        """Stop the worker and fail every record it had not scored yet"""
+        worker, self._worker = self._worker, None
+        if worker is None:
+            return
+        worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+        # Nobody is left to score what is still queued
+        while not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            self._fail(future)
+
+    def _fail(self, future):
+        if not future.done():
+            future.set_exception(BatcherStopped("Prediction batcher stopped"))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.window
+
+                # Keep collecting until the window closes or the batch is full
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._dispatch(loop, batch)
+                batch = []
+        except asyncio.CancelledError:
+            # Records already taken off the queue would otherwise wait forever
+            for _, future, _ in batch:
+                self._fail(future)
+            raise
+
+    async def _dispatch(self, loop, batch):
+        now = time.perf_counter()
+        waits = [(now - enqueued) * 1000 for _, _, enqueued in batch]
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["last_batch_size"] = len(batch)
+        self.stats["max_batch_size_seen"] = max(self.stats["max_batch_size_seen"], len(batch))
+        self.stats["total_wait_ms"] += sum(waits)
+        self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], max(waits))
+        BATCH_SIZE.observe(len(batch), source="micro_batch")
+        for wait in waits:
+            PREDICTION_STAGE_LATENCY.observe(wait / 1000, stage="queue_wait")
+
+        records = [record for record, _, _ in batch]
+        try:
+            preds, probs = await loop.run_in_executor(None, self.score_batch, records)
+            results = [(pred, prob, None) for pred, prob in zip(preds, probs)]
+        except Exception:
+            # One bad record (e.g. a missing field) must not fail its neighbours:
+            # rescore individually so each caller gets its own result or error
+            self.stats["failed_batches"] += 1
+            results = []
+            for record in records:
+                try:
+                    preds, probs = await loop.run_in_executor(None, self.score_batch, [record])
+                    results.append((preds[0], probs[0], None))
+                except Exception as e:
+                    results.append((None, None, e))
+
+        for (_, future, _), (pred, prob, error) in zip(batch, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result((pred, prob))
+
+    def get_stats(self):
+        requests = self.stats["requests"]
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "avg_batch_size": requests / batches if batches else 0.0,
+            "avg_wait_ms": self.stats["total_wait_ms"] / requests if requests else 0.0,
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+        }
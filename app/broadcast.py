@@ -0,0 +1,200 @@
+import asyncio
+import copy
+import json
+from collections import OrderedDict
+
+from metrics import WEBSOCKET_DROPPED, WEBSOCKET_EVICTIONS
+
+# Marker queued in place of dropped messages: the sender replaces it with a
+# fresh snapshot of the state at send time
+RESYNC = object()
+
+# What happens when a subscriber's queue is full: "resync" drops the backlog
+# and sends one snapshot instead (needs a snapshot function), "drop" drops the
+# oldest queued message
+OVERFLOW_POLICIES = ["resync", "drop"]
+
+
+# One connected socket with its own bounded send queue and sender task, so a
+# slow client only ever delays itself
+class Subscriber:
+    def __init__(self, websocket, max_queue=256, snapshot=None, accepts=None, overflow="resync"):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.snapshot = snapshot
+        self.accepts = accepts
+        self.overflow = overflow if snapshot is not None else "drop"
+        # key -> message; unkeyed messages get a unique key so they never coalesce
+        self.queue = OrderedDict()
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        self.task = None
+        self._serial = 0
+
+    def offer(self, message, key=None):
+        """Queue a serialized message; a pending message with the same key is replaced"""
+        if key is not None and key in self.queue:
+            self.queue[key] = message
+            WEBSOCKET_DROPPED.inc(reason="coalesced")
+            return
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            WEBSOCKET_DROPPED.inc(reason="overflow")
+            if self.overflow == "resync":
+                self.queue.clear()
+                self.queue[RESYNC] = RESYNC
+                self.ready.set()
+                return
+            self.queue.popitem(last=False)
+        if key is None:
+            self._serial += 1
+            key = ("message", self._serial)
+        self.queue[key] = message
+        self.ready.set()
+
+    def resync(self):
+        self.queue.clear()
+        self.queue[RESYNC] = RESYNC
+        self.ready.set()
+
+
+# Pub/sub fan-out: publish() serializes once and only enqueues; every
+# subscriber's sender task drains its own queue concurrently
+class ConnectionManager:
+    def __init__(self, max_queue=256, send_timeout=10.0):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.subscribers = set()
+
+    @property
+    def active_connections(self):
+        return [subscriber.websocket for subscriber in self.subscribers]
+
+    async def connect(self, websocket, snapshot=None, accepts=None, overflow="resync", send_snapshot=True):
+        """Accept the socket and start its sender; the first message is the snapshot, if any
+
+        With send_snapshot=False the snapshot is only used for resyncs and the
+        caller queues the first messages itself (e.g. a replay).
+        """
+        await websocket.accept()
+        subscriber = Subscriber(websocket, self.max_queue, snapshot=snapshot, accepts=accepts, overflow=overflow)
+        if snapshot is not None and send_snapshot:
+            subscriber.resync()
+        self.subscribers.add(subscriber)
+        subscriber.task = asyncio.get_running_loop().create_task(self._sender(subscriber))
+        return subscriber
+
+    def disconnect(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+
+    def publish(self, message, key=None, data=None):
+        """Enqueue a message (str, or a dict serialized once) for every subscriber
+
+        data is what subscriber filters see (defaults to the dict message).
+        """
+        if not isinstance(message, str):
+            data = message if data is None else data
+            message = json.dumps(message)
+        for subscriber in list(self.subscribers):
+            if subscriber.accepts is not None and not subscriber.accepts(data):
+                continue
+            subscriber.offer(message, key)
+
+    async def broadcast(self, message):
+        self.publish(message)
+
+    async def _sender(self, subscriber):
+        try:
+            while True:
+                await subscriber.ready.wait()
+                subscriber.ready.clear()
+                while subscriber.queue:
+                    _, message = subscriber.queue.popitem(last=False)
+                    if message is RESYNC:
+                        message = subscriber.snapshot()
+                    await asyncio.wait_for(subscriber.websocket.send_text(message), timeout=self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Dead or stuck socket: drop it without affecting anyone else
+            WEBSOCKET_EVICTIONS.inc()
+            self.disconnect(subscriber)
+            try:
+                await subscriber.websocket.close()
+            except Exception:
+                pass
+
+
+def _tail_lengths(state):
+    # Lengths of list fields (and of lists inside dict fields) already sent
+    lengths = {}
+    for key, value in state.items():
+        if isinstance(value, list):
+            lengths[key] = len(value)
+        elif isinstance(value, dict) and value and all(isinstance(item, list) for item in value.values()):
+            lengths[key] = {name: len(item) for name, item in value.items()}
+    return lengths
+
+
+# A dict state sent whole on connect (and after a resync) and as deltas after
+# that: changed fields under "set", only the new items of list fields under
+# "append". Every message carries a sequence number; a client applies a delta
+# only if its seq is above the one of the state it holds.
+class StateStream:
+    def __init__(self, manager, name, state):
+        self.manager = manager
+        self.name = name
+        self.seq = 0
+        self.reset(state, publish=False)
+
+    def reset(self, state, publish=True):
+        """Replace the whole state (a new run) and send it as a snapshot"""
+        self.state = state
+        self.seq += 1
+        self._sent = self._mark()
+        if publish:
+            for subscriber in list(self.manager.subscribers):
+                if subscriber.snapshot == self.snapshot:
+                    subscriber.resync()
+
+    def _mark(self):
+        lengths = _tail_lengths(self.state)
+        values = {key: copy.deepcopy(value) for key, value in self.state.items() if key not in lengths}
+        return lengths, values
+
+    def snapshot(self):
+        return json.dumps({"type": f"{self.name}_snapshot", "seq": self.seq, "state": self.state})
+
+    def delta(self):
+        lengths, values = self._sent
+        changed, appended = {}, {}
+        for key, value in self.state.items():
+            sent = lengths.get(key)
+            if isinstance(sent, int) and isinstance(value, list) and len(value) >= sent:
+                if len(value) > sent:
+                    appended[key] = value[sent:]
+            elif isinstance(sent, dict) and isinstance(value, dict) and set(sent) == set(value) \
+                    and all(len(value[name]) >= sent[name] for name in sent):
+                tails = {name: value[name][sent[name]:] for name in sent if len(value[name]) > sent[name]}
+                if tails:
+                    appended[key] = tails
+            elif key not in values or values[key] != value:
+                changed[key] = value
+        return changed, appended
+
+    def publish(self):
+        """Send what changed since the last publish; nothing if nothing changed"""
+        changed, appended = self.delta()
+        if not changed and not appended:
+            return None
+        self.seq += 1
+        self._sent = self._mark()
+        message = {"type": f"{self.name}_delta", "seq": self.seq}
+        if changed:
+            message["set"] = changed
+        if appended:
+            message["append"] = appended
+        self.manager.publish(message)
+        return message
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_ENTRIES, CACHE_LOOKUPS
+from prediction import CATEGORICAL_COLUMNS, FEATURES
+
+try:
+    import redis
+except ImportError:  # The shared backend is optional; the local one always works
+    redis = None
+
+
+def feature_key(record, version):
+    """Hash of the model version and the canonicalised feature vector"""
+    # Numbers compare as floats (3 == 3.0); labels are kept exactly as the
+    # encoders look them up, so " Nigeria " and "Nigeria" never share a key
+    parts = [version]
+    for col in FEATURES:
+        value = record[col]
+        parts.append(repr(value) if col in CATEGORICAL_COLUMNS else repr(float(value)))
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).hexdigest()
+
+
+# In-process LRU with a per-entry TTL
+class LocalBackend:
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.errors = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Redis-backed cache shared by every worker; eviction is the server's
+# maxmemory-policy (allkeys-lru) plus the TTL set on each key. Redis errors
+# and timeouts count as misses so an outage only costs the cache, not requests.
+class RedisBackend:
+    def __init__(self, url, ttl=3600, prefix="prediction:", timeout=0.25):
+        self.client = redis.Redis.from_url(url, socket_connect_timeout=timeout, socket_timeout=timeout)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0
+        self.errors = 0
+        self._failing = False
+
+    def _failed(self, e):
+        self.errors += 1
+        # Logged once per outage rather than once per request
+        if not self._failing:
+            self._failing = True
+            print(f"Shared prediction cache unavailable, scoring without it: {str(e)}")
+
+    def _recovered(self):
+        if self._failing:
+            self._failing = False
+            print("Shared prediction cache reachable again")
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except redis.RedisError as e:
+            self._failed(e)
+            return None
+        self._recovered()
+        return tuple(json.loads(value)) if value is not None else None
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except redis.RedisError as e:
+            self._failed(e)
+
+    def clear(self):
+        # Keys include the model version, so entries of a replaced model are
+        # never read again and simply expire
+        pass
+
+    def __len__(self):
+        return 0
+
+
+# Cached (prediction, probability) results in front of the model
+class PredictionCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        CACHE_ENTRIES.set_function(lambda: len(self.backend))
+
+    def get(self, record, version):
+        try:
+            key = feature_key(record, version)
+        except (KeyError, TypeError, ValueError):
+            # Incomplete or malformed records are left for the model to reject
+            return None, None
+        value = self.backend.get(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            CACHE_LOOKUPS.inc(result="hit")
+        else:
+            self.stats["misses"] += 1
+            CACHE_LOOKUPS.inc(result="miss")
+        return key, value
+
+    def put(self, key, pred, prob):
+        if key is not None:
+            self.backend.set(key, (int(pred), float(prob)))
+
+    def invalidate(self, bundle=None):
+        # Registered as a registry listener: a newly activated model starts cold
+        self.backend.clear()
+        self.stats["invalidations"] += 1
+
+    def get_stats(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "entries": len(self.backend),
+            "evictions": self.backend.evictions,
+            "errors": self.backend.errors,
+            "backend": type(self.backend).__name__
+        }
+
+
+def build_prediction_cache(max_entries=10000, ttl=3600, url=None):
+    """A shared cache when url is set and redis is installed, otherwise the local one"""
+    if url:
+        if redis is None:
+            print("PREDICTION_CACHE_URL is set but redis is not installed; using the local cache")
+        else:
+            try:
+                backend = RedisBackend(url, ttl=ttl)
+                backend.client.ping()
+                return PredictionCache(backend)
+            except Exception as e:
+                print(f"Could not connect to the shared prediction cache: {str(e)}")
+    return PredictionCache(LocalBackend(max_entries=max_entries, ttl=ttl))
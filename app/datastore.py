@@ -0,0 +1,94 @@
+import os
+import time
+import uuid
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+from prediction import pa
+
+# Partition files are Parquet when pyarrow is available, CSV otherwise
+PART_FORMAT = "parquet" if pa is not None else "csv"
+
+
+# Append-only training data, partitioned by month and country
+#
+#   <root>/month=2024-05/country=Nigeria/part-<timestamp>-<id>.parquet
+class DatasetStore:
+    def __init__(self, root, date_column="event_date"):
+        self.root = root
+        self.date_column = date_column
+
+    def _months_of(self, df):
+        # Prefer an event date, then YEAR/MONTH columns, then the ingestion month
+        if self.date_column in df.columns:
+            return pd.to_datetime(df[self.date_column]).dt.strftime("%Y-%m")
+        if "YEAR" in df.columns and "MONTH" in df.columns:
+            return df["YEAR"].astype(int).map("{:04d}".format) + "-" + df["MONTH"].astype(int).map("{:02d}".format)
+        return pd.Series(time.strftime("%Y-%m"), index=df.index)
+
+    def append(self, df):
+        """Write new rows into their month/country partitions; existing files are never touched"""
+        months = self._months_of(df)
+        written = []
+        stamp = time.strftime("%Y%m%d%H%M%S")
+        for (month, country), part in df.groupby([months, df["COUNTRY"]], sort=True):
+            part_dir = os.path.join(self.root, f"month={month}", f"country={quote(str(country), safe='')}")
+            os.makedirs(part_dir, exist_ok=True)
+            name = f"part-{stamp}-{uuid.uuid4().hex[:8]}.{PART_FORMAT}"
+
+            # Write under a hidden name first so readers never pick up half a file
+            tmp_path = os.path.join(part_dir, f".{name}.tmp")
+            if PART_FORMAT == "parquet":
+                part.to_parquet(tmp_path, index=False)
+            else:
+                part.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, os.path.join(part_dir, name))
+            written.append({"month": month, "country": country, "rows": len(part)})
+        return written
+
+    def partitions(self):
+        """All (month, country, path) partition files, oldest month first"""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for month_dir in sorted(os.listdir(self.root)):
+            if not month_dir.startswith("month="):
+                continue
+            month_path = os.path.join(self.root, month_dir)
+            for country_dir in sorted(os.listdir(month_path)):
+                if not country_dir.startswith("country="):
+                    continue
+                country_path = os.path.join(month_path, country_dir)
+                for name in sorted(os.listdir(country_path)):
+                    if name.startswith("part-"):
+                        found.append((month_dir[len("month="):], unquote(country_dir[len("country="):]),
+                                      os.path.join(country_path, name)))
+        return found
+
+    def months(self):
+        return sorted({month for month, _, _ in self.partitions()})
+
+    def read(self, months=None, countries=None, columns=None):
+        """Concatenate the selected partitions (all of them by default)"""
+        frames = []
+        for month, country, path in self.partitions():
+            if months is not None and month not in months:
+                continue
+            if countries is not None and country not in countries:
+                continue
+            if path.endswith(".parquet"):
+                frames.append(pd.read_parquet(path, columns=columns))
+            else:
+                frames.append(pd.read_csv(path, usecols=columns))
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def summary(self):
+        partitions = self.partitions()
+        return {
+            "months": self.months(),
+            "countries": sorted({country for _, country, _ in partitions}),
+            "partition_files": len(partitions)
+        }
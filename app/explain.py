@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from forest import FOREST_DIR, CompiledForest, HybridForest, has_compiled_forest
+from metrics import stage_timer
+from prediction import FEATURES, encode_and_scale
+
+# Rows per traversal pass (bounds the trees x rows x features gather)
+EXPLAIN_CHUNK_ROWS = 2048
+
+# Reference rows sampled for global importances
+GLOBAL_SAMPLE_ROWS = 5000
+
+# Global importances stored next to the (immutable) version artifacts
+GLOBAL_IMPORTANCE_FILE = "global_importance.json"
+
+
+def path_contributions(forest, positive, n_features):
+    """(n_nodes, n_features) sum of positive-class probability changes along the path to each node
+
+    Saabas decomposition: every split moves the tree's prediction from the
+    parent's value to the child's, and the move is credited to the split
+    feature. Filled breadth-first, one vectorised step per tree level.
+    """
+    value = forest.value[:, positive]
+    contributions = np.zeros((len(value), n_features))
+    frontier = forest.roots[~forest.is_leaf[forest.roots]]
+    while frontier.size:
+        feature = forest.feature[frontier]
+        children = []
+        for child in (forest.left[frontier], forest.right[frontier]):
+            contributions[child] = contributions[frontier]
+            contributions[child, feature] += value[child] - value[frontier]
+            children.append(child)
+        children = np.concatenate(children)
+        frontier = children[~forest.is_leaf[children]]
+    return contributions.astype(np.float32)
+
+
+def compiled_forest_of(bundle):
+    # The node arrays behind whichever inference backend the bundle uses
+    model = bundle.model
+    if isinstance(model, CompiledForest):
+        return model
+    if isinstance(model, HybridForest):
+        return model.compiled
+    if has_compiled_forest(bundle.path):
+        return CompiledForest.load(os.path.join(bundle.path, FOREST_DIR))
+    return CompiledForest.from_sklearn(model)
+
+
+# Per-feature contributions to the positive-class probability of a forest:
+# base_value + contributions.sum(axis=1) equals predict_proba exactly
+class ForestExplainer:
+    def __init__(self, forest, n_features=len(FEATURES)):
+        self.forest = forest
+        classes = list(forest.classes_)
+        self.positive = classes.index(1) if 1 in classes else len(classes) - 1
+        self.base_value = float(forest.value[forest.roots, self.positive].mean())
+        # Only the rows of leaves are ever read; a path's total is fixed once the leaf is known
+        self.node_contributions = path_contributions(forest, self.positive, n_features)
+
+    def contributions(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty((X.shape[0], self.node_contributions.shape[1]))
+        for start in range(0, X.shape[0], EXPLAIN_CHUNK_ROWS):
+            leaves = self.forest.apply(X[start:start + EXPLAIN_CHUNK_ROWS])
+            out[start:start + EXPLAIN_CHUNK_ROWS] = self.node_contributions[leaves].mean(axis=0)
+        return out
+
+
+def format_explanation(row, contributions, base_value, top_k=5):
+    """One row's explanation: risk, per-feature contributions and the strongest factors"""
+    risk = base_value + float(contributions.sum())
+    order = np.argsort(-np.abs(contributions))[:top_k]
+    return {
+        "prediction": int(risk >= 0.5),
+        "probability": round(risk, 4),
+        "base_value": round(base_value, 4),
+        "contributions": {feature: round(float(value), 4) for feature, value in zip(FEATURES, contributions)},
+        "top_factors": [
+            {
+                "feature": FEATURES[i],
+                "value": row.get(FEATURES[i]),
+                "contribution": round(float(contributions[i]), 4),
+                "direction": "increases risk" if contributions[i] > 0 else "decreases risk"
+            }
+            for i in order if contributions[i] != 0
+        ]
+    }
+
+
+# Explainers and global importances, built once per model version
+class Explanations:
+    def __init__(self, persist=True):
+        self.persist = persist
+        self._explainers = {}
+        self._global = {}
+        self._lock = threading.Lock()
+
+    def explainer(self, bundle):
+        explainer = self._explainers.get(bundle.version)
+        if explainer is None:
+            with self._lock:
+                explainer = self._explainers.get(bundle.version)
+                if explainer is None:
+                    explainer = self._explainers[bundle.version] = ForestExplainer(compiled_forest_of(bundle))
+        return explainer
+
+    def invalidate(self, bundle=None):
+        # Registered as a registry listener: keep only what the new version uses
+        with self._lock:
+            keep = bundle.version if bundle is not None else None
+            self._explainers = {k: v for k, v in self._explainers.items() if k == keep}
+            self._global = {k: v for k, v in self._global.items() if k == keep}
+
+    def explain_records(self, records, bundle, top_k=5):
+        df = pd.DataFrame.from_records(records)
+        missing = [col for col in FEATURES if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+        raw = df[FEATURES].to_dict(orient="records")
+        X = encode_and_scale(df, bundle.scaler, bundle.label_encoders)
+        explainer = self.explainer(bundle)
+        with stage_timer("explain"):
+            contributions = explainer.contributions(X)
+        return [format_explanation(row, c, explainer.base_value, top_k) for row, c in zip(raw, contributions)]
+
+    def global_importance(self, bundle, reference=None, refresh=False):
+        """Mean |contribution| per feature over reference rows, plus the forest's impurity importances"""
+        cache_path = os.path.join(bundle.path, GLOBAL_IMPORTANCE_FILE)
+        if not refresh:
+            cached = self._global.get(bundle.version)
+            if cached is not None:
+                return cached
+            if self.persist and os.path.exists(cache_path):
+                with open(cache_path) as f:
+                    cached = self._global[bundle.version] = json.load(f)
+                return cached
+
+        result = {"model_version": bundle.version, "reference_rows": 0, "mean_abs_contribution": None, "impurity": None}
+        model = getattr(bundle.model, "model", bundle.model)
+        if hasattr(model, "feature_importances_"):
+            result["impurity"] = dict(zip(FEATURES, np.round(model.feature_importances_, 4).tolist()))
+        if reference is not None and not reference.empty:
+            sample = reference.sample(n=min(GLOBAL_SAMPLE_ROWS, len(reference)), random_state=0)
+            X = encode_and_scale(sample, bundle.scaler, bundle.label_encoders)
+            with stage_timer("explain"):
+                contributions = self.explainer(bundle).contributions(X)
+            result["reference_rows"] = len(sample)
+            result["mean_abs_contribution"] = dict(zip(FEATURES, np.round(np.abs(contributions).mean(axis=0), 4).tolist()))
+
+        if result["mean_abs_contribution"] is None:
+            # Not cached: a reference set may be available on the next call
+            return result
+        self._global[bundle.version] = result
+        if self.persist:
+            # Versions are immutable, so the file stays valid for the version's lifetime
+            tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(result, f)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                print(f"Could not store global importances: {str(e)}")
+        return result
@@ -0,0 +1,177 @@
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+# Names accepted for the inference backend setting
+BACKENDS = ["sklearn", "compiled", "auto"]
+
+# Rows scored per traversal pass (bounds the trees x rows node matrix)
+CHUNK_ROWS = 8192
+
+# "auto" uses the compiled forest up to this batch size; sklearn's C
+# traversal wins on larger batches where its fixed overhead amortises
+AUTO_MAX_ROWS = 1024
+
+# Subdirectory of a model version holding the flat node arrays as .npy files
+FOREST_DIR = "forest"
+FOREST_ARRAYS = ["feature", "threshold", "left", "right", "value", "roots", "is_leaf"]
+
+
+# RandomForestClassifier flattened into NumPy node arrays
+class CompiledForest:
+    def __init__(self, feature, threshold, left, right, value, roots, classes, is_leaf=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.is_leaf = left < 0 if is_leaf is None else is_leaf
+        self.n_estimators = len(roots)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left < 0
+            roots.append(offset)
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            left.append(np.where(leaf, -1, tree.children_left + offset))
+            right.append(np.where(leaf, -1, tree.children_right + offset))
+
+            # Per-node class distribution, normalised like DecisionTreeClassifier.predict_proba
+            node_value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = node_value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            value.append(node_value / normalizer)
+            offset += tree.node_count
+
+        return cls(
+            feature=np.concatenate(feature).astype(np.intp),
+            threshold=np.concatenate(threshold).astype(np.float64),
+            left=np.concatenate(left).astype(np.intp),
+            right=np.concatenate(right).astype(np.intp),
+            value=np.concatenate(value),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes=np.asarray(model.classes_),
+        )
+
+    def save(self, directory):
+        """Write the node arrays as .npy files, replacing the directory atomically"""
+        parent = os.path.dirname(os.path.abspath(directory))
+        staging = os.path.join(parent, f".{FOREST_DIR}-{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        for name in FOREST_ARRAYS:
+            np.save(os.path.join(staging, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(staging, "classes.npy"), self.classes_)
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            # Another worker wrote the same arrays first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """Map the node arrays read-only; every worker shares one page-cache copy"""
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in FOREST_ARRAYS
+        }
+        classes = np.load(os.path.join(directory, "classes.npy"))
+        return cls(classes=classes, **arrays)
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_trees, n_rows)"""
+        n_rows = X.shape[0]
+        nodes = np.repeat(self.roots[:, None], n_rows, axis=1).ravel()
+        rows = np.tile(np.arange(n_rows), self.n_estimators)
+
+        # Only walk the (tree, row) pairs that have not reached a leaf yet
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            go_left = X[rows[active], self.feature[current]] <= self.threshold[current]
+            nodes[active] = np.where(go_left, self.left[current], self.right[current])
+            active = active[~self.is_leaf[nodes[active]]]
+
+        return nodes.reshape(self.n_estimators, n_rows)
+
+    def predict_proba(self, X):
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        proba = np.empty((X.shape[0], len(self.classes_)))
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            leaves = self.apply(X[start:start + CHUNK_ROWS])
+            proba[start:start + CHUNK_ROWS] = self.value[leaves].mean(axis=0)
+        return proba
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+# Route small batches to the compiled forest and large ones to sklearn
+class HybridForest:
+    def __init__(self, compiled, model, max_rows=AUTO_MAX_ROWS):
+        self.compiled = compiled
+        self.model = model
+        self.max_rows = max_rows
+        self.classes_ = compiled.classes_
+        self.n_estimators = compiled.n_estimators
+
+    def predict_proba(self, X):
+        if len(X) <= self.max_rows:
+            return self.compiled.predict_proba(X)
+        return self.model.predict_proba(X)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+# Check the compiled forest against sklearn on a deterministic probe batch
+def verify_parity(compiled, model, n_rows=512, atol=1e-9):
+    rng = np.random.default_rng(0)
+    # Scaled features are roughly standard normal; widen to reach tail splits
+    X = rng.normal(scale=2.0, size=(n_rows, model.n_features_in_))
+    expected = model.predict_proba(X)
+    actual = compiled.predict_proba(X)
+    max_error = float(np.abs(expected - actual).max())
+    if max_error > atol:
+        raise RuntimeError(f"Compiled forest differs from sklearn (max error {max_error:.3g})")
+    return max_error
+
+
+# Wrap a fitted forest in the requested inference backend
+def build_backend(model, backend="sklearn"):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+    if backend == "sklearn":
+        return model
+
+    try:
+        compiled = CompiledForest.from_sklearn(model)
+        verify_parity(compiled, model)
+    except Exception as e:
+        print(f"Falling back to sklearn inference: {str(e)}")
+        return model
+
+    if backend == "auto":
+        return HybridForest(compiled, model)
+    return compiled
+
+
+def has_compiled_forest(model_dir):
+    return os.path.exists(os.path.join(model_dir, FOREST_DIR, "roots.npy"))
+
+
+# Compile a fitted forest, check it against sklearn and store it next to the pickle
+def save_compiled_forest(model, model_dir):
+    compiled = CompiledForest.from_sklearn(model)
+    verify_parity(compiled, model)
+    compiled.save(os.path.join(model_dir, FOREST_DIR))
+    return compiled
@@ -0,0 +1,268 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+
+from metrics import RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_LOOKUPS
+
+try:
+    import orjson
+except ImportError:  # The standard library encoder is the fallback
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always offered
+    brotli = None
+
+# Bodies below this size are not worth compressing
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Response headers that describe one encoding of the body, set per response
+REPRESENTATION_HEADERS = {b"content-length", b"content-encoding", b"etag", b"cache-control", b"vary"}
+
+
+def dumps(content):
+    """JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+# JSONResponse rendered through dumps()
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def negotiate_encoding(accept_encoding):
+    """The best encoding the client accepts: br (if available), then gzip, else None"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match, digest):
+    # Any encoding of the same body counts as a match (weak comparison)
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-")[0] == digest:
+            return True
+    return False
+
+
+# One 200 response; encoded bodies are built on first request
+class CachedResponse:
+    def __init__(self, headers, body, expires, route=None):
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+        self.route = route
+        self.key = None
+        self.digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.encodings = {}
+
+    def etag(self, encoding=None):
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(body) for body in self.encodings.values())
+
+
+# LRU of responses with a per-route TTL, bounded by entries and by bytes
+# (encoded copies included). Keys are the path, the route's whitelisted query
+# parameters and a state token (model version, risk map run), so a new model
+# or a new run is never answered from an old entry and unknown parameters
+# cannot multiply entries.
+class ResponseCache:
+    def __init__(self, routes, state=None, max_entries=512, max_bytes=64 * 1024 * 1024, max_entry_bytes=2 * 1024 * 1024):
+        # path -> {"ttl": seconds, "params": [query parameters that change the response]}
+        self.routes = {path: {"ttl": config["ttl"], "params": frozenset(config.get("params", ()))}
+                       for path, config in routes.items()}
+        self.state = state or (lambda: None)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Larger bodies are served (with ETag and compression) but never stored
+        self.max_entry_bytes = max_entry_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        RESPONSE_CACHE_ENTRIES.set_function(lambda: len(self._entries))
+
+    def key(self, scope):
+        params = self.routes[scope["path"]]["params"]
+        query = parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+        return scope["path"], tuple(sorted(item for item in query if item[0] in params)), self.state()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        """Store an entry; returns False if it is too large to keep"""
+        if entry.size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            entry.key = key
+            self._entries[key] = entry
+            self.bytes += entry.size
+            self._evict()
+        return True
+
+    def encoded(self, entry, encoding, stored=True):
+        """The entry's body in an encoding, compressed once and counted in the byte budget"""
+        if encoding is None:
+            return entry.body
+        body = entry.encodings.get(encoding)
+        if body is None:
+            body = compress(entry.body, encoding)
+            if stored:
+                with self._lock:
+                    entry.encodings[encoding] = body
+                    if self._entries.get(entry.key) is entry:
+                        self.bytes += len(body)
+                        self._evict()
+        return body
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key).size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def clear(self, bundle=None):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ASGI middleware serving GETs of the cached routes: hits skip the endpoint
+# entirely, every response gets an ETag (If-None-Match answers 304) and large
+# bodies are sent gzip/brotli-encoded when the client accepts it
+class ResponseCacheMiddleware:
+    def __init__(self, app, cache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in self.cache.routes:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        key = self.cache.key(scope)
+        entry = self.cache.get(key)
+        result, stored = "hit", True
+        if entry is None:
+            result = "miss"
+            entry, stored = await self._fill(scope, receive, send, key)
+            if entry is None:
+                RESPONSE_CACHE_LOOKUPS.inc(route=path, result=result)
+                return
+        elif entry.route is not None:
+            # Lets the latency middleware label hits by route like any request
+            scope["route"] = entry.route
+
+        if await self._respond(entry, Headers(scope=scope), send, stored):
+            result = "not_modified"
+        RESPONSE_CACHE_LOOKUPS.inc(route=path, result=result)
+
+    async def _fill(self, scope, receive, send, key):
+        # Run the endpoint with its response buffered; only 200s are cached
+        start = None
+        chunks = []
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        body = b"".join(chunks)
+        if start is None or start["status"] != 200:
+            if start is not None:
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+            return None, False
+        headers = [(name, value) for name, value in start["headers"] if name.lower() not in REPRESENTATION_HEADERS]
+        ttl = self.cache.routes[scope["path"]]["ttl"]
+        entry = CachedResponse(headers, body, time.monotonic() + ttl, scope.get("route"))
+        return entry, self.cache.put(key, entry)
+
+    async def _respond(self, entry, request_headers, send, stored=True):
+        """Send the entry (or a 304); returns True for a 304"""
+        encoding = None
+        if len(entry.body) >= COMPRESS_MIN_BYTES:
+            encoding = negotiate_encoding(request_headers.get("accept-encoding", ""))
+        # Browsers may reuse the response until the server-side entry expires
+        max_age = max(0, int(entry.expires - time.monotonic()))
+        validators = [
+            (b"etag", entry.etag(encoding).encode()),
+            (b"cache-control", f"private, max-age={max_age}".encode()),
+            (b"vary", b"Accept-Encoding")
+        ]
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, entry.digest):
+            await send({"type": "http.response.start", "status": 304, "headers": validators})
+            await send({"type": "http.response.body", "body": b""})
+            return True
+
+        body = self.cache.encoded(entry, encoding, stored)
+        headers = entry.headers + validators + [(b"content-length", str(len(body)).encode())]
+        if encoding is not None:
+            headers.append((b"content-encoding", encoding.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+        return False
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import queue
+import shutil
+import time
+import uuid
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from prediction import load_model_components, predict_file_chunked
+from rasters import RasterStore
+
+# Model components cached inside each worker process, keyed by artifact path and mtime
+_worker_components = {}
+
+# Raster stores opened by each worker (layers reopen themselves on a new version)
+_worker_rasters = {}
+
+
+def _load_components(model_dir, unknown_category_code, backend):
+    model_path = os.path.join(model_dir, "conflict_model.pkl")
+    key = (os.path.abspath(model_dir), os.path.getmtime(model_path), unknown_category_code, backend)
+    if key not in _worker_components:
+        _worker_components.clear()
+        _worker_components[key] = load_model_components(
+            model_dir, unknown_category_code=unknown_category_code, backend=backend
+        )
+    return _worker_components[key]
+
+
+# Runs in a worker process: score one file and report progress per chunk
+def score_file_job(job_id, input_path, output_path, model_dir, options, progress_queue):
+    model, scaler, label_encoders = _load_components(
+        model_dir, options.get("unknown_category_code"), options.get("backend", "sklearn")
+    )
+
+    def report(rows_processed):
+        progress_queue.put((job_id, rows_processed, time.time()))
+
+    report(0)
+    # Environmental features missing from the file come from the raster store
+    raster_root = options.get("raster_root")
+    transform = None
+    if raster_root:
+        store = _worker_rasters.setdefault(raster_root, RasterStore(raster_root))
+        if store.layers():
+            transform = store.assemble_features
+
+    return predict_file_chunked(
+        input_path, output_path, model, scaler, label_encoders,
+        chunksize=options.get("chunksize", 50000),
+        sample_columns=options.get("sample_columns"),
+        progress_callback=report,
+        transform=transform
+    )
+
+
+# Batch-scoring jobs run in a process pool, tracked by job ID
+class JobManager:
+    def __init__(self, jobs_dir, max_workers=2, max_jobs=200, on_update=None):
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        # on_update(job) is awaited whenever a job changes state or reports progress
+        self.on_update = on_update
+        self.jobs = {}
+        self._executor = None
+        self._mp_manager = None
+        self._progress_queue = None
+        self._poller = None
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            # A manager queue can be passed to pool workers as an argument
+            self._mp_manager = multiprocessing.Manager()
+            self._progress_queue = self._mp_manager.Queue()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll_progress())
+
+    def job_paths(self, job_id, filename):
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        base, ext = os.path.splitext(os.path.basename(filename))
+        return os.path.join(job_dir, base + ext), os.path.join(job_dir, f"{base}_predicted{ext}")
+
+    def new_job_id(self):
+        return uuid.uuid4().hex[:12]
+
+    async def submit(self, job_id, input_path, output_path, model_dir, options):
+        self._ensure_started()
+        self._evict_finished()
+
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "input_file": os.path.basename(input_path),
+            "output_file": output_path,
+            "rows_processed": 0,
+            "rows_per_second": 0.0,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "summary": None,
+            "error": None
+        }
+        self.jobs[job_id] = job
+
+        future = self._executor.submit(
+            score_file_job, job_id, input_path, output_path, model_dir, options, self._progress_queue
+        )
+        asyncio.get_running_loop().create_task(self._watch(job_id, asyncio.wrap_future(future)))
+        await self._notify(job)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        return sorted(self.jobs.values(), key=lambda job: job["submitted_at"], reverse=True)
+
+    async def _watch(self, job_id, future):
+        job = self.jobs[job_id]
+        try:
+            summary = await future
+            self._drain_progress()
+            job["status"] = "complete"
+            job["summary"] = summary
+            job["rows_processed"] = summary["total_records"]
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            # Chunks written before the failure are not a usable result
+            if os.path.exists(job["output_file"]):
+                os.remove(job["output_file"])
+        job["finished_at"] = time.time()
+        if job["started_at"] is not None and job["finished_at"] > job["started_at"]:
+            job["rows_per_second"] = job["rows_processed"] / (job["finished_at"] - job["started_at"])
+        await self._notify(job)
+
+    def _drain_progress(self):
+        updated = {}
+        while True:
+            try:
+                job_id, rows_processed, reported_at = self._progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            if job["started_at"] is None:
+                # The worker reports zero rows when it picks the job up
+                job["started_at"] = reported_at
+            if job["status"] == "queued":
+                job["status"] = "running"
+            job["rows_processed"] = rows_processed
+            elapsed = reported_at - job["started_at"]
+            job["rows_per_second"] = rows_processed / elapsed if elapsed > 0 else 0.0
+            updated[job_id] = job
+        return list(updated.values())
+
+    async def _poll_progress(self, interval=0.5):
+        while any(job["status"] in ("queued", "running") for job in self.jobs.values()):
+            for job in self._drain_progress():
+                await self._notify(job)
+            await asyncio.sleep(interval)
+
+    async def _notify(self, job):
+        if self.on_update is not None:
+            try:
+                await self.on_update(job)
+            except Exception as e:
+                print(f"Error publishing job update: {str(e)}")
+
+    def _evict_finished(self):
+        finished = [job for job in self.list() if job["status"] in ("complete", "failed")]
+        for job in finished[self.max_jobs:]:
+            del self.jobs[job["job_id"]]
+            # The staged input and the scored output can no longer be fetched
+            shutil.rmtree(os.path.join(self.jobs_dir, job["job_id"]), ignore_errors=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._mp_manager.shutdown()
+            self._executor = None
@@ -1,19 +1,40 @@
-from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, UploadFile, File, Form, Body, Header, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime
 import pandas as pd
+import secrets
 import shutil
 import os
 import json
 import numpy as np
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Union
 import time
 import asyncio
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-from prediction import load_model_components, predict_single, predict_from_csv
-from model import train_and_evaluate_model
+from prediction import FILE_FORMATS, predict_batch, predict_file_chunked, predict_single, read_table
+from model import run_training_job, run_incremental_training_job
+from datastore import DatasetStore
+from explain import Explanations
+from httpcache import FastJSONResponse, ResponseCache, ResponseCacheMiddleware
+from batching import PredictionBatcher
+from alerts import ALERT_HISTORY_SIZE, AlertFeed, AlertFilter
+from broadcast import ConnectionManager, StateStream
+from cache import build_prediction_cache
+from jobs import JobManager
+from metrics import BATCH_SIZE, QUEUE_DEPTH, REQUEST_LATENCY, WEBSOCKET_CLIENTS, render_metrics, stage_timer
+from profiling import profiler
+from rasters import LAYER_NAME, RasterStore, zones_from_points
+from registry import ModelRegistry
+from riskmap import ALERT_THRESHOLD, RiskMap
+from scenarios import parse_perturbations, scenario_count, scenario_stream, select_baseline
+from satellite import GRID_BOUNDS, GRID_DTYPES, MAX_GRID_SIZE, current_grid, encode_grid, grid_payload, grid_window, parse_bbox
+from tuning import run_search_job
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
@@ -21,18 +42,190 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 MODEL_DIR = "../models"
 DATA_PATH = "../data/conflict_dataset.csv"
+DATASET_DIR = "../data/store"
+
+# Micro-batching of concurrent /predict calls
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "3"))
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "64"))
+
+# How often each worker checks CURRENT for a version activated by another worker
+MODEL_WATCH_SECONDS = float(os.environ.get("MODEL_WATCH_SECONDS", "2"))
+
+# Encoded value for unseen COUNTRY/ADMIN1 labels ("error" rejects them instead)
+UNKNOWN_CATEGORY = os.environ.get("UNKNOWN_CATEGORY_CODE", "-1")
+UNKNOWN_CATEGORY_CODE = None if UNKNOWN_CATEGORY == "error" else int(UNKNOWN_CATEGORY)
+
+# "sklearn", "compiled" (flat-array forest traversal, see forest.py) or "auto"
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "sklearn")
+
+# Rows read, scored and written per step when processing uploads
+UPLOAD_CHUNK_ROWS = int(os.environ.get("UPLOAD_CHUNK_ROWS", "50000"))
+
+# Background batch-scoring jobs
+JOBS_DIR = "../data/jobs"
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+
+# Cached /predict and batch results (0 entries disables the cache; a
+# redis:// URL shares hits between workers)
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", "3600"))
+PREDICTION_CACHE_URL = os.environ.get("PREDICTION_CACHE_URL")
+
+# Region risk table rescored on this schedule (and after each model activation)
+RISK_MAP_PATH = "../data/risk_map.json"
+RISK_REFRESH_SECONDS = float(os.environ.get("RISK_REFRESH_SECONDS", "3600"))
+
+# Environmental raster layers that fill rainfall/drought/temperature in batch files
+RASTER_DIR = "../data/rasters"
+
+# Keep global feature importances in each model version's directory
+EXPLAIN_PERSIST_GLOBAL = os.environ.get("EXPLAIN_PERSIST_GLOBAL", "1") == "1"
+
+# Largest regions x scenarios sweep accepted by /api/scenarios
+SCENARIO_MAX_ROWS = int(os.environ.get("SCENARIO_MAX_ROWS", "2000000"))
+
+# Per-client websocket send queue and the time a single send may take before
+# the client is dropped
+WS_QUEUE_SIZE = int(os.environ.get("WS_QUEUE_SIZE", "256"))
+WS_SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", "10"))
+
+# Read-heavy dashboard routes answered from the response cache: TTL in seconds
+# and the query parameters that are part of the key (others are ignored)
+RESPONSE_CACHE_ROUTES = {
+    "/api/visualization-data": {"ttl": 300, "params": ["time_range", "region"]},
+    "/api/regions": {"ttl": 600},
+    "/api/model-performance": {"ttl": 3600},
+    "/api/system-status": {"ttl": 10},
+    "/api/satellite-feed": {"ttl": 5, "params": ["grid_size", "grid_format", "dtype"]}
+}
+# Entry count (0 disables the cache), total bytes including compressed copies,
+# and the largest body that is stored
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(2 * 1024 * 1024)))
+
+# Token required by the /api/admin routes (unset disables them)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
 
 # Create necessary directories
 os.makedirs(MODEL_DIR, exist_ok=True)
 os.makedirs("../data", exist_ok=True)
 
-# Load model components
-try:
-    model, scaler, label_encoders = load_model_components(MODEL_DIR)
-    print("Model loaded successfully")
-except Exception as e:
-    print(f"Error loading model: {str(e)}")
-    model, scaler, label_encoders = None, None, None
+# Versioned model artifacts; requests read the active bundle once and keep it
+registry = ModelRegistry(MODEL_DIR, load_options={
+    "unknown_category_code": UNKNOWN_CATEGORY_CODE,
+    "backend": INFERENCE_BACKEND
+})
+
+prediction_cache = None
+if PREDICTION_CACHE_SIZE > 0:
+    prediction_cache = build_prediction_cache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_URL)
+    registry.listeners.append(prediction_cache.invalidate)
+
+# Load model components in the background; /health/ready reports when done
+registry.start_background_load()
+registry.start_watching(MODEL_WATCH_SECONDS)
+
+
+def score_records(records):
+    # Resolved at call time so a batch always scores with the current model
+    bundle = registry.active()
+    if bundle is None:
+        raise RuntimeError("Model not loaded. Please train the model first.")
+    return predict_batch(records, bundle.model, bundle.scaler, bundle.label_encoders)
+
+
+batcher = PredictionBatcher(score_records, window_ms=BATCH_WINDOW_MS, max_batch_size=BATCH_MAX_SIZE)
+
+
+async def publish_job_update(job):
+    # Progress goes to the same websocket clients as training updates
+    update = {key: value for key, value in job.items() if key != "summary"}
+    # A client that falls behind only gets the latest state of each job
+    manager.publish({"type": "job", **update}, key=("job", job["job_id"]))
+
+
+def diff_alerts(table):
+    # An update can also enter or leave a subscriber's filter; those variants
+    # are serialized up front too, at most once per event
+    messages = []
+    for event in alert_feed.update(table):
+        kinds = [event["event"]] + (["entered_filter", "left_filter"] if "previous" in event else [])
+        for kind in kinds:
+            messages.append((json.dumps({**event, "event": kind}), (kind, event)))
+    return messages
+
+
+async def publish_alert_events(table):
+    # Diffed and serialized off the event loop; each variant is only queued for
+    # the subscribers that see the event that way
+    for message, data in await run_in_threadpool(diff_alerts, table):
+        alert_manager.publish(message, data=data)
+
+
+dataset_store = DatasetStore(DATASET_DIR)
+raster_store = RasterStore(RASTER_DIR)
+
+# Tree-path explanations; explainers are rebuilt for each activated version
+explanations = Explanations(persist=EXPLAIN_PERSIST_GLOBAL)
+registry.listeners.append(explanations.invalidate)
+
+# Precomputed per-region risk served by the dashboard routes
+risk_map = RiskMap(registry, DATASET_DIR, DATA_PATH, RISK_MAP_PATH, interval=RISK_REFRESH_SECONDS,
+                   explanations=explanations)
+registry.listeners.append(risk_map.request_refresh)
+
+# New, changed and resolved alerts pushed to /ws/alerts after each risk map run
+alert_feed = AlertFeed(history_size=ALERT_HISTORY_SIZE)
+if risk_map.table is not None:
+    alert_feed.update(risk_map.table, announce=False)
+risk_map.listeners.append(publish_alert_events)
+
+job_manager = JobManager(JOBS_DIR, max_workers=JOB_WORKERS, on_update=publish_job_update)
+
+# Gauges read at scrape time
+QUEUE_DEPTH.set_function(lambda: {
+    "predict_batcher": batcher.get_stats()["queue_depth"],
+    "jobs": sum(job["status"] in ("queued", "running") for job in job_manager.list())
+})
+WEBSOCKET_CLIENTS.set_function(lambda: len(manager.subscribers) + len(alert_manager.subscribers))
+
+
+def response_cache_state():
+    # Cached dashboard responses are only valid for one model and one risk map run
+    bundle = registry.active()
+    table = risk_map.table
+    return (bundle.version if bundle else None, table.created_at if table else None)
+
+
+# Added before the latency middleware so that one still times cache hits
+if RESPONSE_CACHE_SIZE > 0:
+    response_cache = ResponseCache(RESPONSE_CACHE_ROUTES, state=response_cache_state, max_entries=RESPONSE_CACHE_SIZE,
+                                   max_bytes=RESPONSE_CACHE_MAX_BYTES, max_entry_bytes=RESPONSE_CACHE_MAX_ENTRY_BYTES)
+    app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/api/jobs/{job_id}), not the raw path
+        route = request.scope.get("route")
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            method=request.method, route=route.path if route is not None else "unmatched", status=status
+        )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text-format metrics"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -41,7 +234,7 @@ def home(request: Request):
 
 
 @app.post("/predict", response_class=HTMLResponse)
-def predict(
+async def predict(
     request: Request,
     country: str = Form(...),
     region: str = Form(...),
@@ -56,7 +249,7 @@ def predict(
     past_conflicts_3mo: int = Form(...)
 ):
     # Check if model is loaded
-    if model is None:
+    if registry.active() is None:
         return templates.TemplateResponse("index.html", {
             "request": request,
             "error": "Model not loaded. Please train the model first."
@@ -78,7 +271,20 @@ def predict(
     
     # Make prediction
     try:
-        pred, prob = predict_single(input_dict, model, scaler, label_encoders)
+        bundle = registry.active()
+        cache_key, cached = prediction_cache.get(input_dict, bundle.version) if prediction_cache else (None, None)
+        if cached is not None:
+            pred, prob = cached
+        elif profiler.should_capture("/predict"):
+            # Profiled requests skip the micro-batcher so the profile holds only this request
+            pred, prob = await run_in_threadpool(
+                profiler.run_profiled, "/predict", predict_single, dict(input_dict),
+                bundle.model, bundle.scaler, bundle.label_encoders
+            )
+        else:
+            pred, prob = await batcher.submit(input_dict)
+        if cached is None and prediction_cache is not None:
+            prediction_cache.put(cache_key, pred, prob)
         
         # Get current timestamp
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -98,89 +304,245 @@ def predict(
         })
 
 
+def score_with_cache(records, bundle):
+    # Look every record up first and send only the misses to the model
+    if prediction_cache is None:
+        BATCH_SIZE.observe(len(records), source="api")
+        return predict_batch(records, bundle.model, bundle.scaler, bundle.label_encoders)
+
+    preds = np.empty(len(records), dtype=np.int64)
+    probs = np.empty(len(records), dtype=np.float64)
+    misses, keys = [], []
+    for i, record in enumerate(records):
+        key, cached = prediction_cache.get(record, bundle.version)
+        if cached is None:
+            misses.append(i)
+            keys.append(key)
+        else:
+            preds[i], probs[i] = cached
+
+    if misses:
+        BATCH_SIZE.observe(len(misses), source="api")
+        miss_preds, miss_probs = predict_batch(
+            [records[i] for i in misses], bundle.model, bundle.scaler, bundle.label_encoders
+        )
+        preds[misses], probs[misses] = miss_preds, miss_probs
+        for key, pred, prob in zip(keys, miss_preds, miss_probs):
+            prediction_cache.put(key, pred, prob)
+    return preds, probs
+
+
+@app.post("/api/predict/batch")
+def predict_batch_api(payload: Union[List[Dict[str, Any]], Dict[str, Any]] = Body(...)):
+    """Score many records in one vectorized pass"""
+    bundle = registry.active()
+    if bundle is None:
+        raise HTTPException(status_code=400, detail="Model not loaded. Please train the model first.")
+
+    # Accept either a bare list of records or {"records": [...]}
+    records = payload.get("records") if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not records:
+        raise HTTPException(status_code=400, detail="Expected a non-empty list of records")
+
+    start_time = time.perf_counter()
+    try:
+        preds, probs = score_with_cache(records, bundle)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Prediction error: {str(e)}")
+    processing_time = (time.perf_counter() - start_time) * 1000  # milliseconds
+
+    with stage_timer("serialize"):
+        predictions = [
+            {
+                "prediction": int(pred),
+                "confidence": float(prob),
+                "result": "Conflict Likely" if pred == 1 else "No Conflict Expected"
+            }
+            for pred, prob in zip(preds, probs)
+        ]
+
+    return {
+        "total_records": len(predictions),
+        "conflicts_predicted": int(np.sum(preds == 1)),
+        "processing_time_ms": processing_time,
+        "model_version": bundle.version,
+        "predictions": predictions
+    }
+
+
+@app.post("/api/explain")
+def explain_prediction(record: Dict[str, Any] = Body(...), top_k: int = 5):
+    """Per-feature contributions to one prediction (tree-path decomposition of the forest)"""
+    bundle = registry.active()
+    if bundle is None:
+        raise HTTPException(status_code=400, detail="Model not loaded. Please train the model first.")
+    try:
+        explanation = explanations.explain_records([record], bundle, top_k=top_k)[0]
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Explanation error: {str(e)}")
+    return {"model_version": bundle.version, **explanation}
+
+
+@app.post("/api/explain/batch")
+def explain_batch(payload: Union[List[Dict[str, Any]], Dict[str, Any]] = Body(...), top_k: int = 5):
+    """Explanations for many records, vectorised across rows and trees"""
+    bundle = registry.active()
+    if bundle is None:
+        raise HTTPException(status_code=400, detail="Model not loaded. Please train the model first.")
+
+    records = payload.get("records") if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not records:
+        raise HTTPException(status_code=400, detail="Expected a non-empty list of records")
+
+    start_time = time.perf_counter()
+    try:
+        results = explanations.explain_records(records, bundle, top_k=top_k)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Explanation error: {str(e)}")
+    return {
+        "total_records": len(results),
+        "processing_time_ms": (time.perf_counter() - start_time) * 1000,
+        "model_version": bundle.version,
+        "explanations": results
+    }
+
+
+@app.get("/api/explain/global")
+def explain_global(refresh: bool = False):
+    """Global feature importances of the active model, cached per version"""
+    bundle = registry.active()
+    if bundle is None:
+        raise HTTPException(status_code=400, detail="Model not loaded. Please train the model first.")
+    return explanations.global_importance(bundle, reference=risk_map.latest_snapshot(), refresh=refresh)
+
+
+@app.get("/api/inference-stats")
+def get_inference_stats():
+    """Micro-batcher queue depth, batch size and wait time, plus prediction cache hit rate"""
+    stats = batcher.get_stats()
+    stats["cache"] = prediction_cache.get_stats() if prediction_cache else None
+    return stats
+
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Only CSV files are supported")
+    if os.path.splitext(file.filename)[1].lower() not in FILE_FORMATS:
+        raise HTTPException(status_code=400, detail="Only CSV, Parquet and Arrow/Feather files are supported")
     
-    if model is None:
+    bundle = registry.active()
+    if bundle is None:
         raise HTTPException(status_code=400, detail="Model not loaded. Please train the model first.")
     
     # Create data directory if it doesn't exist
     os.makedirs("../data", exist_ok=True)
     
+    # Save the uploaded file (never outside ../data, whatever the client sent)
+    file_path = f"../data/{os.path.basename(file.filename)}"
+    with open(file_path, "wb") as buffer:
+        await run_in_threadpool(shutil.copyfileobj, file.file, buffer)
+    
+    # Process the file and make predictions
+    start_time = time.perf_counter()
+    base, ext = os.path.splitext(file_path)
+    output_path = f"{base}_predicted{ext}"
+    
+    # Score in chunks so memory stays flat; the summary keeps running totals
     try:
-        # Save the uploaded file
-        file_path = f"../data/{file.filename}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Process the file and make predictions
-        start_time = datetime.now()
-        
-        # Use a simplified prediction if the real one isn't working
-        try:
-            df = predict_from_csv(file_path, model, scaler, label_encoders)
-        except Exception as e:
-            # Fallback to mock predictions for demonstration
-            print(f"Error in predict_from_csv: {str(e)}")
-            df = pd.read_csv(file_path)
-            # Add prediction columns with random values
-            df['prediction'] = np.random.randint(0, 2, size=len(df))
-            df['probability'] = np.random.uniform(0, 1, size=len(df))
-            df['result'] = df['prediction'].apply(
-                lambda x: "Conflict Likely" if x == 1 else "No Conflict Expected"
-            )
-            
-        end_time = datetime.now()
-        
-        # Calculate processing time
-        processing_time = (end_time - start_time).total_seconds() * 1000  # milliseconds
-        
-        # Save results
-        output_path = file_path.replace(".csv", "_predicted.csv")
-        df.to_csv(output_path, index=False)
-        
-        # Prepare batch results summary
-        total_records = len(df)
-        conflicts_predicted = int(df['prediction'].sum()) if 'prediction' in df.columns else 0
-        safe_regions = total_records - conflicts_predicted
-        
-        # Prepare sample results for display (first 100 rows)
-        # Make sure we only include necessary columns to avoid serialization issues
-        columns_to_include = ['COUNTRY', 'ADMIN1', 'prediction', 'probability', 'result'] 
-        columns_to_include = [col for col in columns_to_include if col in df.columns]
-        
-        if len(columns_to_include) < 3:
-            # Add minimum columns if they don't exist
-            if 'Country' not in df.columns and 'COUNTRY' not in df.columns:
-                df['Country'] = "Sample Country"
-            if 'Region' not in df.columns and 'ADMIN1' not in df.columns:
-                df['Region'] = "Sample Region"
-            if 'prediction' not in df.columns:
-                df['prediction'] = np.random.randint(0, 2, size=len(df))
-            if 'probability' not in df.columns:
-                df['probability'] = np.random.uniform(0.5, 1.0, size=len(df))
-            if 'result' not in df.columns:
-                df['result'] = df['prediction'].apply(
-                    lambda x: "Conflict Likely" if x == 1 else "No Conflict Expected"
-                )
-            columns_to_include = ['Country', 'Region', 'prediction', 'probability', 'result']
-        
-        results_sample = df[columns_to_include].head(100).to_dict(orient='records')
-        
-        return {
-            "message": "Prediction complete",
-            "output_file": output_path,
-            "processing_time_ms": processing_time,
-            "total_records": total_records,
-            "conflicts_predicted": conflicts_predicted,
-            "safe_regions": safe_regions,
-            "results_sample": results_sample
-        }
-        
+        summary = await run_in_threadpool(
+            profiler.run, "/upload", predict_file_chunked,
+            file_path, output_path, bundle.model, bundle.scaler, bundle.label_encoders,
+            chunksize=UPLOAD_CHUNK_ROWS,
+            sample_columns=['COUNTRY', 'ADMIN1', 'prediction', 'confidence'],
+            transform=raster_store.assemble_features if raster_store.layers() else None
+        )
     except Exception as e:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        # Unreadable files, missing columns and unknown categories are the client's
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=f"Could not score file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+        
+    # Calculate processing time
+    processing_time = (time.perf_counter() - start_time) * 1000  # milliseconds
+    
+    total_records = summary["total_records"]
+    conflicts_predicted = summary["conflicts_predicted"]
+    safe_regions = total_records - conflicts_predicted
+    results_sample = summary["results_sample"]
+    
+    return {
+        "message": "Prediction complete",
+        "output_file": output_path,
+        "processing_time_ms": processing_time,
+        "model_version": bundle.version,
+        "total_records": total_records,
+        "conflicts_predicted": conflicts_predicted,
+        "safe_regions": safe_regions,
+        "results_sample": results_sample
+    }
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    """Queue a batch file for background scoring and return its job ID immediately"""
+    if os.path.splitext(file.filename)[1].lower() not in FILE_FORMATS:
+        raise HTTPException(status_code=400, detail="Only CSV, Parquet and Arrow/Feather files are supported")
+    
+    bundle = registry.active()
+    if bundle is None:
+        raise HTTPException(status_code=400, detail="Model not loaded. Please train the model first.")
+    
+    job_id = job_manager.new_job_id()
+    input_path, output_path = job_manager.job_paths(job_id, file.filename)
+    with open(input_path, "wb") as buffer:
+        await run_in_threadpool(shutil.copyfileobj, file.file, buffer)
+    
+    options = {
+        "chunksize": UPLOAD_CHUNK_ROWS,
+        "unknown_category_code": UNKNOWN_CATEGORY_CODE,
+        "backend": INFERENCE_BACKEND,
+        "sample_columns": ['COUNTRY', 'ADMIN1', 'prediction', 'confidence'],
+        "raster_root": RASTER_DIR
+    }
+    # Workers load the exact version that was active when the job was submitted
+    job = await job_manager.submit(job_id, input_path, output_path, bundle.path, options)
+    
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result"
+    }
+
+
+@app.get("/api/jobs")
+def list_jobs():
+    """List batch-scoring jobs, newest first"""
+    return {"jobs": [
+        {key: value for key, value in job.items() if key != "summary"}
+        for job in job_manager.list()
+    ]}
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status, progress and (when complete) summary of a batch-scoring job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/result")
+def download_job_result(job_id: str):
+    """Download the scored file of a completed job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "complete":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return FileResponse(job["output_file"], filename=os.path.basename(job["output_file"]))
 
 
 @app.post("/retrain")
@@ -192,6 +554,9 @@ async def retrain(
     try:
         global training_status
         
+        if training_status["status"] == "training":
+            raise HTTPException(status_code=409, detail="A training run is already in progress")
+        
         # Parse training parameters if provided
         params = {}
         if training_params:
@@ -208,32 +573,63 @@ async def retrain(
         }
         
         # Notify all clients
-        await manager.broadcast(json.dumps(training_status))
+        training_stream.reset(training_status)
         
-        # Add a background task to simulate training with real updates
+        # Train in a separate process; progress streams over /ws/training
         background_tasks.add_task(run_model_training, params)
         
         return JSONResponse(content=training_status)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error starting training: {str(e)}")
 
 
+@app.post("/api/data/ingest")
+async def ingest_data(file: UploadFile = File(...)):
+    """Append labelled rows to the month/country partitioned dataset store"""
+    if os.path.splitext(file.filename)[1].lower() not in FILE_FORMATS:
+        raise HTTPException(status_code=400, detail="Only CSV, Parquet and Arrow/Feather files are supported")
+    
+    os.makedirs("../data/incoming", exist_ok=True)
+    file_path = f"../data/incoming/{os.path.basename(file.filename)}"
+    with open(file_path, "wb") as buffer:
+        await run_in_threadpool(shutil.copyfileobj, file.file, buffer)
+    
+    try:
+        df = await run_in_threadpool(read_table, file_path)
+        written = await run_in_threadpool(dataset_store.append, df)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error ingesting file: {str(e)}")
+    finally:
+        os.remove(file_path)
+    
+    return {"rows": sum(part["rows"] for part in written), "partitions": written, "store": dataset_store.summary()}
+
+
+@app.get("/api/data/store")
+def get_dataset_store():
+    """Months, countries and partition count of the dataset store"""
+    return dataset_store.summary()
+
+
 @app.get("/api/training-status")
 async def get_training_status():
     """Get the current status of model training"""
     # In a real application, this would check a database or file for status
     # For demonstration, we'll return mock data
-    global model
-    
-    if model is None:
+    bundle = registry.active()
+    if bundle is None:
         return {"status": "not_trained", "progress": 0}
     
-    # Mock training status - would come from a real tracking system
+    # Metrics recorded when the active version was trained (mock values for
+    # versions adopted from before the registry existed)
     return {
         "status": "complete",
         "progress": 100,
-        "metrics": {
+        "model_version": bundle.version,
+        "metrics": bundle.metadata.get("metrics") or {
             "accuracy": 0.874,
             "precision": 0.863,
             "recall": 0.923,
@@ -242,7 +638,118 @@ async def get_training_status():
     }
 
 
-@app.get("/api/visualization-data")
+@app.get("/health/live")
+def liveness():
+    """The process is up and serving HTTP"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def readiness():
+    """Ready once a model bundle is active; 503 while loading or after a failed load"""
+    bundle = registry.active()
+    body = {
+        "status": "ready" if bundle is not None else registry.status,
+        "model_version": bundle.version if bundle else None,
+        "error": registry.error
+    }
+    return JSONResponse(content=body, status_code=200 if bundle is not None else 503)
+
+
+@app.get("/api/models")
+def list_models():
+    """List registered model versions and the one serving traffic"""
+    bundle = registry.active()
+    return {
+        "active_version": bundle.version if bundle else None,
+        "history": registry.history(),
+        "versions": registry.list_versions()
+    }
+
+
+@app.post("/api/models/{version}/activate")
+async def activate_model(version: str):
+    """Load and pre-warm a version off the event loop, then swap it in"""
+    if registry.read_metadata(version) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown model version '{version}'")
+    try:
+        bundle = await run_in_threadpool(registry.activate, version)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error activating model: {str(e)}")
+    return {"active_version": bundle.version, "history": registry.history()}
+
+
+@app.post("/api/models/rollback")
+async def rollback_model():
+    """Reactivate the previously active version"""
+    try:
+        bundle = await run_in_threadpool(registry.rollback)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rolling back model: {str(e)}")
+    return {"active_version": bundle.version, "history": registry.history()}
+
+
+def require_admin(token):
+    # Admin routes do not exist unless ADMIN_TOKEN is configured
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token is None or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/api/admin/profiling")
+def get_profiling(x_admin_token: Optional[str] = Header(None)):
+    """Profiler configuration and the profiles in the ring buffer"""
+    require_admin(x_admin_token)
+    return {"config": profiler.config, "profiles": profiler.list()}
+
+
+@app.post("/api/admin/profiling")
+def configure_profiling(settings: Dict[str, Any] = Body(...), x_admin_token: Optional[str] = Header(None)):
+    """Set mode ("off", "sample" with rate, "next" with count), engine and targets"""
+    require_admin(x_admin_token)
+    allowed = ["mode", "engine", "rate", "count", "interval", "targets"]
+    try:
+        config = profiler.configure(**{key: settings[key] for key in allowed if key in settings})
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"config": config}
+
+
+@app.delete("/api/admin/profiling")
+def clear_profiling(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    profiler.clear()
+    return {"profiles": []}
+
+
+@app.get("/api/admin/profiling/{profile_id}")
+def download_profile(profile_id: str, format: str = "pstats", x_admin_token: Optional[str] = Header(None)):
+    """One profile as pstats (binary), collapsed stacks (flamegraph.pl, speedscope) or a text report"""
+    require_admin(x_admin_token)
+    entry = profiler.get(profile_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    filename = f"{entry['name'].strip('/').replace('/', '_').replace(':', '-')}-{profile_id}"
+    if format == "pstats":
+        return Response(
+            content=profiler.pstats_bytes(entry), media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.prof"'}
+        )
+    if format == "collapsed":
+        stacks = profiler.collapsed(entry)
+        if stacks is None:
+            raise HTTPException(status_code=400, detail="Collapsed stacks are only recorded by the sampler engine")
+        return PlainTextResponse(stacks, headers={"Content-Disposition": f'attachment; filename="{filename}.collapsed"'})
+    if format == "text":
+        return PlainTextResponse(profiler.summary(entry))
+    raise HTTPException(status_code=400, detail="format must be pstats, collapsed or text")
+
+
+@app.get("/api/visualization-data", response_class=FastJSONResponse)
 def get_visualization_data(time_range: int = 30, region: str = "all"):
     """API endpoint to provide data for dashboard visualizations"""
     try:
@@ -277,10 +784,14 @@ def get_visualization_data(time_range: int = 30, region: str = "all"):
         raise HTTPException(status_code=500, detail=f"Error generating visualization data: {str(e)}")
 
 
-@app.get("/api/regions")
+@app.get("/api/regions", response_class=FastJSONResponse)
 def get_regions():
     """Return a list of available regions for filtering"""
-    # This would typically come from your dataset
+    table = risk_map.table
+    if table is not None:
+        return {"regions": table.regions, "countries": table.countries}
+
+    # Until the first risk map run, fall back to the static list
     regions = [
         "Northern Nigeria", "Southern Nigeria", "Western Kenya", 
         "Eastern Kenya", "Northern Ethiopia", "Southern Ethiopia",
@@ -290,7 +801,7 @@ def get_regions():
     return {"regions": regions}
 
 
-@app.get("/api/model-performance")
+@app.get("/api/model-performance", response_class=FastJSONResponse)
 def get_model_performance():
     """Return model performance metrics for visualization"""
     # This would typically be stored when the model is trained
@@ -311,18 +822,25 @@ def get_model_performance():
     }
 
 
-@app.get("/api/satellite-feed")
-def get_satellite_feed():
+@app.get("/api/satellite-feed", response_class=FastJSONResponse)
+def get_satellite_feed(grid_size: int = 50, grid_format: str = "json", dtype: str = "uint8"):
     """Return simulated satellite data for visualization"""
     # In production, this would connect to a real satellite data API
+    if not 1 <= grid_size <= MAX_GRID_SIZE:
+        raise HTTPException(status_code=400, detail=f"grid_size must be between 1 and {MAX_GRID_SIZE}")
+    if grid_format not in ("json", "base64"):
+        raise HTTPException(status_code=400, detail="grid_format must be json or base64")
+    if dtype not in GRID_DTYPES:
+        raise HTTPException(status_code=400, detail=f"dtype must be one of {', '.join(GRID_DTYPES)}")
     
     # Create random data points for demonstration
     import random
     import time
     
-    # Generate hotspots with realistic parameters
-    hotspots = []
-    regions = [
+    # Hotspots are the highest-risk regions of the latest risk map run
+    table = risk_map.table
+    hotspots = table.hotspots() if table is not None else []
+    regions = [] if table is not None else [
         {"name": "North Darfur", "lat": 14.5, "lng": 25.5, "factors": ["Drought", "Resource Competition"]},
         {"name": "Eastern Congo", "lat": -1.5, "lng": 29.5, "factors": ["Conflict History", "Resource Control"]},
         {"name": "Southern Somalia", "lat": 2.5, "lng": 43.5, "factors": ["Drought", "Governance Gaps"]},
@@ -359,27 +877,13 @@ def get_satellite_feed():
         "water_body_change": round(random.uniform(-0.2, 0.1), 2)
     }
     
-    # Generate satellite data grid (would be real satellite imagery in production)
-    grid_size = 50
-    satellite_grid = []
-    
-    for i in range(grid_size):
-        row = []
-        for j in range(grid_size):
-            # Create more realistic patterns
-            # Distance from center affects values
-            dist_from_center = ((i - grid_size/2)**2 + (j - grid_size/2)**2)**0.5 / (grid_size/2)
-            
-            # Create some geographic features
-            if random.random() < 0.05:  # Water bodies
-                value = 0.1
-            elif random.random() < 0.1:  # Mountains
-                value = 0.9
-            else:  # Normal terrain with some patterns
-                value = 0.3 + dist_from_center * 0.4 + random.uniform(-0.1, 0.1)
-            
-            row.append(round(value, 2))
-        satellite_grid.append(row)
+    # Satellite data grid (would be real satellite imagery in production);
+    # large grids should use grid_format=base64 or /api/satellite-feed/grid
+    grid = current_grid(grid_size)
+    if grid_format == "base64":
+        satellite_grid = grid_payload(grid, dtype)
+    else:
+        satellite_grid = np.round(grid, 2).tolist()
     
     return {
         "timestamp": int(time.time() * 1000),  # Current time in milliseconds
@@ -407,45 +911,8 @@ def get_satellite_feed():
     }
 
 
-def simulate_model_training(params):
-    """Simulate model training process - would be replaced with real training"""
-    global model, scaler, label_encoders
-    
-    # Simulate training process
-    print("Starting simulated model training...")
-    for i in range(10):
-        print(f"Training progress: {(i+1)*10}%")
-        time.sleep(1)  # Simulate work
-    
-    # For demo purposes, let's create a mock model if one doesn't exist
-    if model is None:
-        from sklearn.ensemble import RandomForestClassifier
-        model = RandomForestClassifier(n_estimators=100, random_state=42)
-        scaler = None  # Would be a real StandardScaler
-        label_encoders = {}  # Would contain real LabelEncoders
-        
-        print("Created mock model since none existed")
-    
-    print("Model training completed")
-
-
 # WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-
-manager = ConnectionManager()
+manager = ConnectionManager(max_queue=WS_QUEUE_SIZE, send_timeout=WS_SEND_TIMEOUT)
 
 # Training status storage
 training_status = {
@@ -457,35 +924,138 @@ training_status = {
     "log_messages": []
 }
 
+# Clients get the full status once, then only what changed
+training_stream = StateStream(manager, "training", training_status)
+
 @app.websocket("/ws/training")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    subscriber = await manager.connect(websocket, snapshot=training_stream.snapshot)
     try:
-        # Send initial status
-        await websocket.send_text(json.dumps(training_status))
-        
         # Keep connection alive and handle messages
         while True:
             data = await websocket.receive_text()
             # Handle any client messages here if needed
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        manager.disconnect(subscriber)
+
+
+# Alert subscribers get their own manager so training traffic never reaches them
+alert_manager = ConnectionManager(max_queue=WS_QUEUE_SIZE, send_timeout=WS_SEND_TIMEOUT)
+
+
+@app.websocket("/ws/alerts")
+async def alerts_websocket(websocket: WebSocket, country: Optional[str] = None, region: Optional[str] = None,
+                           type: Optional[str] = None, min_severity: Optional[str] = None,
+                           since: Optional[int] = None, stream: Optional[str] = None, limit: int = 200):
+    """Early-warning alerts and hotspot changes as sequenced events
+
+    country, region and type take comma-separated lists. A client passing the
+    stream id and last seq it saw gets only the events it missed; otherwise
+    (or when those are no longer retained) it gets a snapshot first.
+    """
+    try:
+        alert_filter = AlertFilter.from_query(country, region, type, min_severity)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    subscriber = await alert_manager.connect(
+        websocket,
+        snapshot=lambda: alert_feed.snapshot_message(alert_filter, limit),
+        accepts=lambda data: alert_filter.variant(data[1]) == data[0],
+        send_snapshot=False
+    )
+    # Nothing is published between connect() and here, so there is no gap
+    # between the replay and the live events (an event being published right
+    # now can arrive twice; clients skip any seq they have already applied)
+    replay = alert_feed.replay(since, alert_filter) if since is not None and stream == alert_feed.stream else None
+    if replay is None:
+        subscriber.resync()
+    else:
+        for event in replay:
+            subscriber.offer(json.dumps(event))
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        alert_manager.disconnect(subscriber)
+
+# Training runs in its own process so the fit never blocks the event loop
+training_pool = None
+training_progress = None
+
+
+def get_training_pool():
+    global training_pool, training_progress
+    if training_pool is None:
+        training_pool = ProcessPoolExecutor(max_workers=1)
+        training_progress = multiprocessing.Manager().Queue()
+    return training_pool, training_progress
+
+
+def apply_training_event(event, learning_curves):
+    if event["event"] == "phase":
+        training_status["progress"] = event["progress"]
+        training_status["log_messages"].append(f"Starting phase: {event['name']}")
+    elif event["event"] == "log":
+        training_status["log_messages"].append(event["message"])
+    elif event["event"] == "step":
+        # One batch of trees has been added to the forest
+        trees, total = event["trees"], event["total_trees"]
+        for key in learning_curves:
+            learning_curves[key].append(event[key])
+        training_status["learning_curves"] = learning_curves
+        training_status["current_epoch"] = trees
+        training_status["total_epochs"] = total
+        training_status["progress"] = round(10 + 80 * trees / total, 1)
+        oob = f", oob_score: {event['oob_score']:.4f}" if event["oob_score"] is not None else ""
+        training_status["log_messages"].append(
+            f"Trees {trees}/{total} - train_loss: {event['training_loss']:.4f}, val_loss: {event['validation_loss']:.4f}, "
+            f"train_acc: {event['training_accuracy']:.4f}, val_acc: {event['validation_accuracy']:.4f}{oob}"
+        )
+    elif event["event"] == "profile":
+        # A training stage profiled in the worker process
+        entry = event["entry"]
+        profiler.adopt(entry)
+        training_status["log_messages"].append(f"Captured profile {entry['id']} of {entry['name']} ({entry['duration_ms']:.0f} ms)")
+    elif event["event"] == "trial":
+        # One search candidate has been fitted and scored
+        trial = {key: event[key] for key in ("trial", "params", "metrics", "rung")}
+        training_status.setdefault("trials", []).append(trial)
+        training_status["best_score"] = event["best_score"]
+        training_status["current_epoch"] = event["trial"]
+        training_status["total_epochs"] = event["total"]
+        training_status["progress"] = round(10 + 80 * event["trial"] / event["total"], 1)
+        rung = f" [rung {event['rung']}]" if event["rung"] is not None else ""
+        training_status["log_messages"].append(
+            f"Trial {event['trial']}/{event['total']}{rung} {json.dumps(event['params'])} - "
+            f"{event['metric']}: {event['metrics'][event['metric']]:.4f} (best {event['best_score']:.4f})"
+        )
+
 
 async def run_model_training(params):
-    global training_status, model, scaler, label_encoders
+    global training_status
     
     try:
-        total_epochs = params.get("n_estimators", 100)
-        
-        # Simulate different training phases
-        phases = [
-            {"name": "Data loading", "duration": 1, "progress_range": (0, 5)},
-            {"name": "Preprocessing", "duration": 2, "progress_range": (5, 15)},
-            {"name": "Feature engineering", "duration": 3, "progress_range": (15, 25)},
-            {"name": "Model training", "duration": 10, "progress_range": (25, 85)},
-            {"name": "Evaluation", "duration": 2, "progress_range": (85, 95)},
-            {"name": "Model deployment", "duration": 1, "progress_range": (95, 100)}
-        ]
+        pool, progress_queue = get_training_pool()
+        if params.get("mode") == "incremental":
+            # Add trees fitted on recent store partitions to the active model
+            bundle = registry.active()
+            if bundle is None:
+                raise RuntimeError("Incremental training needs an active model")
+            job = pool.submit(run_incremental_training_job, DATASET_DIR, MODEL_DIR, bundle.path, params, progress_queue,
+                              profiler.config)
+        elif params.get("search"):
+            # Hyperparameter search; the best candidate becomes the new version
+            job = pool.submit(run_search_job, DATA_PATH, MODEL_DIR, params, progress_queue, profiler.config)
+        else:
+            # The worker profiles its "train:<stage>" hooks with the current config
+            job = pool.submit(run_training_job, DATA_PATH, MODEL_DIR, params, progress_queue, profiler.config)
+        future = asyncio.wrap_future(job)
         
         # Track learning curves
         learning_curves = {
@@ -495,78 +1065,158 @@ async def run_model_training(params):
             "validation_accuracy": []
         }
         
-        # Simulate each phase
-        for phase in phases:
-            training_status["log_messages"].append(f"Starting phase: {phase['name']}")
-            await manager.broadcast(json.dumps(training_status))
-            
-            start_progress, end_progress = phase["progress_range"]
-            steps = phase["duration"] * 2  # 2 updates per second
-            
-            for step in range(steps):
-                # Update progress
-                progress = start_progress + (end_progress - start_progress) * (step / steps)
-                training_status["progress"] = round(progress, 1)
-                
-                if phase["name"] == "Model training":
-                    # Simulate epochs during model training
-                    epoch = int((step / steps) * total_epochs)
-                    if epoch > training_status["current_epoch"]:
-                        # Add learning curve data points
-                        epoch_fraction = epoch / total_epochs
-                        train_loss = 0.8 * (1 - epoch_fraction) + 0.2 * np.random.random()
-                        val_loss = 0.9 * (1 - epoch_fraction) + 0.3 * np.random.random()
-                        train_acc = 0.5 + 0.4 * epoch_fraction + 0.05 * np.random.random()
-                        val_acc = 0.45 + 0.35 * epoch_fraction + 0.05 * np.random.random()
-                        
-                        learning_curves["training_loss"].append(train_loss)
-                        learning_curves["validation_loss"].append(val_loss)
-                        learning_curves["training_accuracy"].append(train_acc)
-                        learning_curves["validation_accuracy"].append(val_acc)
-                        
-                        training_status["learning_curves"] = learning_curves
-                        training_status["current_epoch"] = epoch
-                        training_status["log_messages"].append(f"Epoch {epoch}/{total_epochs} - train_loss: {train_loss:.4f}, val_loss: {val_loss:.4f}, train_acc: {train_acc:.4f}, val_acc: {val_acc:.4f}")
-                
-                # Broadcast updated status
-                await manager.broadcast(json.dumps(training_status))
-                await asyncio.sleep(0.5)  # 2 updates per second
+        # Relay progress from the training process until it finishes
+        while True:
+            finished = future.done()
+            events = []
+            while True:
+                try:
+                    events.append(progress_queue.get_nowait())
+                except queue.Empty:
+                    break
+            for event in events:
+                apply_training_event(event, learning_curves)
+            if events:
+                training_stream.publish()
+            if finished:
+                break
+            await asyncio.sleep(0.5)
         
-        # Training complete
-        final_metrics = {
-            "accuracy": 0.892 + 0.02 * np.random.random(),
-            "precision": 0.878 + 0.02 * np.random.random(),
-            "recall": 0.911 + 0.02 * np.random.random(),
-            "f1_score": 0.894 + 0.02 * np.random.random()
-        }
+        result = future.result()
         
-        # Create a mock model if needed
-        if model is None:
-            from sklearn.ensemble import RandomForestClassifier
-            model = RandomForestClassifier(n_estimators=100, random_state=42)
-            scaler = None  # Would be a real StandardScaler
-            label_encoders = {}  # Would contain real LabelEncoders
+        # Pre-warm the new version off the event loop, then swap it in
+        training_status["log_messages"].append(f"Activating model version {result['version']}")
+        training_stream.publish()
+        await run_in_threadpool(registry.activate, result["version"])
         
         training_status["status"] = "complete"
         training_status["progress"] = 100
-        training_status["metrics"] = final_metrics
+        training_status["metrics"] = result["metrics"]
+        training_status["model_version"] = result["version"]
         training_status["log_messages"].append("Training completed successfully!")
-        await manager.broadcast(json.dumps(training_status))
+        training_stream.publish()
         
     except Exception as e:
         training_status["status"] = "failed"
         training_status["log_messages"].append(f"Error during training: {str(e)}")
-        await manager.broadcast(json.dumps(training_status))
+        training_stream.publish()
+
+
+# Environmental raster layers: listing, zonal statistics and admin uploads
+@app.get("/api/rasters")
+def list_rasters():
+    """Environmental raster layers and the number of region zones"""
+    return raster_store.summary()
+
+
+@app.get("/api/rasters/{name}/stats")
+def get_raster_stats(name: str, bbox: Optional[str] = None, country: Optional[str] = None,
+                     region: Optional[str] = None):
+    """Zonal statistics of a layer over a bbox or a region's zone (only the tiles it touches are read)"""
+    layer = raster_store.layer(name)
+    if layer is None:
+        raise HTTPException(status_code=404, detail=f"Raster layer {name} not found")
+    if bbox is not None:
+        try:
+            box = list(parse_bbox(bbox))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif country is not None and region is not None:
+        zones = raster_store.zones()
+        match = None if zones is None else zones[(zones["COUNTRY"] == country) & (zones["ADMIN1"] == region)]
+        if match is None or match.empty:
+            raise HTTPException(status_code=404, detail=f"No zone for {region}, {country}")
+        box = match.iloc[0][["min_lng", "min_lat", "max_lng", "max_lat"]].tolist()
+    else:
+        raise HTTPException(status_code=400, detail="Provide bbox or country and region")
+    stats = layer.zonal_stats([box], stats=("mean", "min", "max", "std", "count")).iloc[0]
+    return {
+        "layer": name,
+        "version": layer.version,
+        "units": layer.meta.get("units"),
+        "bbox": box,
+        **{key: (None if pd.isna(value) else float(value)) for key, value in stats.items()}
+    }
+
+
+@app.post("/api/admin/rasters/zones")
+async def upload_raster_zones(file: UploadFile = File(...), x_admin_token: Optional[str] = Header(None)):
+    """Region zones as CSV: COUNTRY, ADMIN1 and either min/max_lng/lat or latitude/longitude points"""
+    require_admin(x_admin_token)
+
+    def store_zones():
+        df = pd.read_csv(file.file)
+        if "min_lng" not in df.columns and {"latitude", "longitude"} <= set(df.columns):
+            df = zones_from_points(df)
+        return raster_store.set_zones(df)
+
+    try:
+        # Parsing errors (ParserError, EmptyDataError) are ValueErrors too
+        count = await run_in_threadpool(store_zones)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"zones": count}
+
+
+@app.post("/api/admin/rasters/{name}")
+async def upload_raster_layer(name: str, bounds: str, units: Optional[str] = None, file: UploadFile = File(...),
+                              x_admin_token: Optional[str] = Header(None)):
+    """Store a 2D .npy grid covering bounds (min_lng,min_lat,max_lng,max_lat) as a tiled layer"""
+    require_admin(x_admin_token)
+    if not LAYER_NAME.match(name):
+        raise HTTPException(status_code=400, detail="Layer names may only contain letters, digits, '-' and '_'")
+    try:
+        box = parse_bbox(bounds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    os.makedirs(RASTER_DIR, exist_ok=True)
+    upload_path = os.path.join(RASTER_DIR, f".upload-{secrets.token_hex(8)}.npy")
+    try:
+        with open(upload_path, "wb") as buffer:
+            await run_in_threadpool(shutil.copyfileobj, file.file, buffer)
+        array = np.load(upload_path, mmap_mode="r")
+        meta = await run_in_threadpool(raster_store.write_layer, name, array, box, units=units)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+    return meta
+
+
+@app.get("/api/satellite-feed/grid")
+def get_satellite_grid(size: int = 256, dtype: str = "uint8", tile: Optional[str] = None,
+                       tile_size: int = 256, bbox: Optional[str] = None):
+    """Raw little-endian grid bytes; shape, dtype and dequantisation are in X-Grid-* headers"""
+    if not 1 <= size <= MAX_GRID_SIZE:
+        raise HTTPException(status_code=400, detail=f"size must be between 1 and {MAX_GRID_SIZE}")
+    try:
+        window, (top, left) = grid_window(current_grid(size), tile=tile, tile_size=max(1, tile_size), bbox=bbox)
+        data, header = encode_grid(window, dtype)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=data, media_type="application/octet-stream", headers={
+        "X-Grid-Shape": ",".join(str(n) for n in header["shape"]),
+        "X-Grid-Dtype": header["dtype"],
+        "X-Grid-Scale": repr(header["scale"]),
+        "X-Grid-Offset": repr(header["offset"]),
+        "X-Grid-Origin": f"{top},{left}",
+        "X-Grid-Size": str(size),
+        "X-Grid-Bounds": ",".join(str(GRID_BOUNDS[key]) for key in ("min_lng", "min_lat", "max_lng", "max_lat")),
+        "Access-Control-Expose-Headers": "X-Grid-Shape, X-Grid-Dtype, X-Grid-Scale, X-Grid-Offset, X-Grid-Origin, X-Grid-Size, X-Grid-Bounds"
+    })
 
 
 # Add to main.py - System Integration Manager
-@app.get("/api/system-status")
+@app.get("/api/system-status", response_class=FastJSONResponse)
 def get_system_status():
     """Return the integrated status of all platform components"""
+    bundle = registry.active()
     components = {
         "model_training": {
-            "status": "online" if model is not None else "offline",
-            "last_updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S") if model else "never"
+            "status": "online" if bundle is not None else "offline",
+            "last_updated": datetime.fromtimestamp(bundle.loaded_at).strftime("%Y-%m-%d %H:%M:%S") if bundle else "never",
+            "model_version": bundle.version if bundle else None
         },
         "satellite_feed": {
             "status": "online",
@@ -598,11 +1248,25 @@ def get_system_status():
 
 # Add this to main.py
 @app.get("/api/early-warning")
-async def get_early_warning():
+async def get_early_warning(limit: int = 50):
     """Sophisticated early warning system integrating multiple data sources"""
     import random
     from datetime import datetime, timedelta
     
+    table = risk_map.table
+    if table is not None:
+        # Alerts are the regions above the alert threshold in the latest risk map run
+        return {
+            "timestamp": int(time.time()),
+            "alert_count": len(table.alerts),
+            "alerts": table.alerts[:limit],
+            "system_status": {
+                "data_freshness": f"{int((time.time() - table.created_at) // 60)} minutes ago",
+                "model_version": table.model_version,
+                "confidence_threshold": ALERT_THRESHOLD
+            }
+        }
+    
     # Simulate threat levels for different regions
     regions = [
         {"name": "Horn of Africa", "countries": ["Somalia", "Ethiopia", "Kenya"]},
@@ -767,6 +1431,96 @@ async def get_early_warning():
     }
 
 
+@app.get("/api/risk-map")
+def get_risk_map(country: Optional[str] = None, region: Optional[str] = None, limit: int = 50):
+    """Scored regions from the latest risk map run, highest risk first"""
+    table = risk_map.table
+    if table is None:
+        raise HTTPException(status_code=503, detail="The risk map has not been computed yet")
+    if country is not None and region is not None:
+        item = table.get(country, region)
+        if item is None:
+            raise HTTPException(status_code=404, detail="Region not found in the risk map")
+        regions = [item]
+    elif country is not None:
+        regions = table.by_country.get(country, [])
+    else:
+        regions = table.ranked[:limit]
+    return {**risk_map.status(), "results": regions}
+
+
+@app.post("/api/scenarios")
+def run_scenario_sweep(request: Dict[str, Any] = Body(...)):
+    """Score every combination of feature perturbations for a set of regions, streamed as NDJSON
+
+    Baseline: "records" (full feature rows), "regions" ([{country, region?}] from the
+    latest region snapshot) or the "top" N highest-risk regions (default 10).
+    Perturbations: [{"feature", "mode": scale|add|set, "values": [...] or start/stop/steps}].
+    """
+    bundle = registry.active()
+    if bundle is None:
+        raise HTTPException(status_code=400, detail="Model not loaded. Please train the model first.")
+
+    try:
+        perturbations = parse_perturbations(request.get("perturbations"))
+        threshold = float(request.get("threshold", 0.5))
+        if request.get("records"):
+            baseline = pd.DataFrame.from_records(request["records"])
+        else:
+            snapshot = risk_map.latest_snapshot()
+            if snapshot is None:
+                raise HTTPException(status_code=503, detail="No region data available for a baseline")
+            if request.get("regions"):
+                baseline = select_baseline(snapshot, request["regions"])
+            else:
+                table = risk_map.table
+                top = table.ranked[:int(request.get("top", 10))] if table is not None else []
+                baseline = select_baseline(snapshot, [{"country": item["country"], "region": item["region"]} for item in top])
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if baseline.empty:
+        raise HTTPException(status_code=404, detail="No baseline regions matched")
+    rows = len(baseline) * scenario_count(perturbations)
+    if rows > SCENARIO_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Sweep of {rows} rows exceeds the limit of {SCENARIO_MAX_ROWS}")
+
+    # A plain def endpoint: building, encoding and the first step of the
+    # stream run in the threadpool, and StreamingResponse iterates the rest
+    # there too, so a large sweep never blocks the event loop
+    stream = scenario_stream(baseline, perturbations, bundle, threshold=threshold)
+    try:
+        # The header is built eagerly so bad baselines fail before streaming starts
+        first = next(stream)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def lines():
+        yield json.dumps(first) + "\n"
+        for item in stream:
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.on_event("startup")
+async def start_risk_map():
+    risk_map.start()
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await batcher.stop()
+
+
+@app.on_event("shutdown")
+def shutdown_job_workers():
+    risk_map.stop()
+    job_manager.shutdown()
+    if training_pool is not None:
+        training_pool.shutdown(wait=False, cancel_futures=True)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
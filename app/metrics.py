@@ -0,0 +1,181 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond forest walks up to large uploads
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+# Rows per scored batch
+SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384, 65536]
+
+# Every metric created below, in exposition order
+METRICS = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# Minimal Prometheus metric types: thread-safe, labelled, rendered in the text format
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        METRICS.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            return [(f"{self.name}{_format_labels(self.labelnames, key)}", value)
+                    for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name} {_format_value(value)}" for name, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        # Called at scrape time; returns a number, or {label values: number}
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [(f"{self.name}{_format_labels(self.labelnames, key if isinstance(key, tuple) else (key,))}", item)
+                for key, item in sorted(value.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in sorted(self._values.items())]
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + [float("inf")], counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                samples.append((f"{self.name}_bucket{labels}", cumulative))
+            labels = _format_labels(self.labelnames, key)
+            samples.append((f"{self.name}_sum{labels}", total))
+            samples.append((f"{self.name}_count{labels}", count))
+        return samples
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in METRICS) + "\n"
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"]
+)
+PREDICTION_STAGE_LATENCY = Histogram(
+    "prediction_stage_duration_seconds", "Time spent in each stage of scoring",
+    ["stage"]
+)
+BATCH_SIZE = Histogram(
+    "prediction_batch_size", "Rows scored per model call",
+    ["source"], buckets=SIZE_BUCKETS
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "model_load_duration_seconds", "Time to load and pre-warm a model version",
+    buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+)
+ACTIVE_MODEL = Gauge("model_active_info", "The model version currently serving (value is always 1)", ["version"])
+WEBSOCKET_CLIENTS = Gauge("websocket_clients", "Connected /ws/training and /ws/alerts clients")
+WEBSOCKET_DROPPED = Counter(
+    "websocket_messages_dropped_total", "Queued websocket messages replaced (coalesced) or dropped on overflow",
+    ["reason"]
+)
+WEBSOCKET_EVICTIONS = Counter("websocket_evictions_total", "Websocket subscribers dropped after a failed or stuck send")
+QUEUE_DEPTH = Gauge("queue_depth", "Items waiting in internal queues", ["queue"])
+CACHE_LOOKUPS = Counter("prediction_cache_lookups_total", "Prediction cache lookups by result", ["result"])
+CACHE_ENTRIES = Gauge("prediction_cache_entries", "Entries held by the local prediction cache")
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups_total", "Cached dashboard route lookups by result (hit, miss, not_modified)",
+    ["route", "result"]
+)
+RESPONSE_CACHE_ENTRIES = Gauge("response_cache_entries", "Responses held by the dashboard response cache")
+
+
+# Time one prediction stage: assemble, encode, scale, predict_proba, explain, serialize
+def stage_timer(stage):
+    return PREDICTION_STAGE_LATENCY.time(stage=stage)
@@ -1,38 +1,273 @@
-import joblib
 import os
+import warnings
+
+import joblib
+import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report
-from preprocessing import load_and_preprocess_data
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, classification_report, log_loss
+from sklearn.model_selection import train_test_split
+from datastore import DatasetStore
+from prediction import FEATURES, encode_and_scale, load_model_components
+from preprocessing import TARGET, load_and_preprocess_data
+from profiling import profile_in_worker, profiler
+from registry import ModelRegistry
+
+# RandomForestClassifier arguments that /retrain training_params may set
+FOREST_PARAMS = ["max_depth", "min_samples_split", "min_samples_leaf", "max_features", "class_weight", "criterion"]
+
+# Rows of the training set used for the training curves (keeps each step cheap)
+CURVE_SAMPLE_ROWS = 5000
+
+
+def evaluation_metrics(y_true, y_pred):
+    return {
+        "accuracy": accuracy_score(y_true, y_pred),
+        "precision": precision_score(y_true, y_pred, zero_division=0),
+        "recall": recall_score(y_true, y_pred, zero_division=0),
+        "f1_score": f1_score(y_true, y_pred, zero_division=0)
+    }
+
+
+# Grow a forest in batches of trees (warm_start), reporting held-out metrics after each batch.
+# With base_model, its trees are kept and new ones are added up to n_estimators.
+# The out-of-bag score covers every tree, so with report_oob it is computed once
+# after the last batch rather than at each step.
+def fit_forest(X_train, y_train, X_test, y_test, n_estimators=100, trees_per_step=10,
+               n_jobs=-1, random_state=42, progress_callback=None, base_model=None, report_oob=False,
+               **forest_params):
+    if base_model is None:
+        model = RandomForestClassifier(
+            n_estimators=0, warm_start=True, oob_score=False, n_jobs=n_jobs,
+            random_state=random_state, **forest_params
+        )
+    else:
+        # Old trees were bootstrapped from other data, so OOB no longer applies;
+        # drop the base model's score so it is not reported as this run's
+        model = base_model
+        model.set_params(warm_start=True, oob_score=False, n_jobs=n_jobs, **forest_params)
+        for name in ("oob_score_", "oob_decision_function_"):
+            if hasattr(model, name):
+                delattr(model, name)
+        report_oob = False
+    labels = np.unique(y_train)
+    sample = np.random.default_rng(random_state).permutation(len(X_train))[:CURVE_SAMPLE_ROWS]
+    X_curve, y_curve = X_train[sample], np.asarray(y_train)[sample]
+
+    while model.n_estimators < n_estimators:
+        model.set_params(n_estimators=min(model.n_estimators + trees_per_step, n_estimators))
+        model.fit(X_train, y_train)
+        if report_oob and model.n_estimators == n_estimators:
+            # Refitting without new trees only computes the OOB score
+            model.set_params(oob_score=True)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                model.fit(X_train, y_train)
+
+        if progress_callback is not None:
+            train_proba = model.predict_proba(X_curve)
+            val_proba = model.predict_proba(X_test)
+            progress_callback({
+                "trees": model.n_estimators,
+                "total_trees": n_estimators,
+                "training_loss": log_loss(y_curve, train_proba, labels=labels),
+                "validation_loss": log_loss(y_test, val_proba, labels=labels),
+                "training_accuracy": accuracy_score(y_curve, model.classes_[train_proba.argmax(axis=1)]),
+                "validation_accuracy": accuracy_score(y_test, model.classes_[val_proba.argmax(axis=1)]),
+                "oob_score": getattr(model, "oob_score_", None)
+            })
+
+    # Serve single-threaded and freeze the forest once it is fully grown
+    model.set_params(warm_start=False, n_jobs=None)
+    return model
+
+
+# Turn /retrain training_params into fit_forest arguments
+def parse_training_params(params):
+    options = {
+        "n_estimators": int(params.get("n_estimators", 100)),
+        "trees_per_step": int(params.get("trees_per_step", 10)),
+        "n_jobs": int(params.get("n_jobs", -1)),
+        "test_size": float(params.get("test_size", 0.2)),
+        "report_oob": str(params.get("report_oob", False)).lower() in ("1", "true", "yes")
+    }
+    for name in FOREST_PARAMS:
+        value = params.get(name)
+        # The dashboard sends "None" for unlimited depth
+        if value in (None, "", "None", "none"):
+            continue
+        if name in ("max_depth", "min_samples_split"):
+            value = int(value)
+        elif name == "min_samples_leaf":
+            value = float(value) if "." in str(value) else int(value)
+        options[name] = value
+    return options
+
+
+# Full training run for /retrain; executed in a separate process.
+# Progress events are put on progress_queue as dicts.
+def run_training_job(data_path, model_output_path, params, progress_queue=None, profile_config=None):
+    def report(event, **fields):
+        if progress_queue is not None:
+            progress_queue.put({"event": event, **fields})
+
+    # Stages are the same "train:<stage>" profiling hooks as the CLI run
+    profile_in_worker(profile_config, progress_queue)
+    options = parse_training_params(params)
+    test_size = options.pop("test_size")
 
+    report("phase", name="Data loading and preprocessing", progress=2)
+    with profiler.capture("train:preprocess"):
+        X_train, X_test, y_train, y_test, scaler, label_encoders = load_and_preprocess_data(
+            data_path, test_size=test_size
+        )
+    report("log", message=f"Loaded {len(X_train)} training and {len(X_test)} validation rows")
 
-def train_and_evaluate_model(data_path, model_output_path):
+    report("phase", name="Model training", progress=10)
+    with profiler.capture("train:fit"):
+        model = fit_forest(
+            X_train, y_train, X_test, y_test,
+            progress_callback=lambda step: report("step", **step),
+            **options
+        )
+
+    report("phase", name="Evaluation", progress=92)
+    with profiler.capture("train:evaluate"):
+        metrics = evaluation_metrics(y_test, model.predict(X_test))
+    metrics["oob_score"] = getattr(model, "oob_score_", None)
+
+    report("phase", name="Model deployment", progress=96)
+    with profiler.capture("train:publish"):
+        registry = ModelRegistry(model_output_path)
+        version = registry.publish(model, scaler, label_encoders, metadata={
+            "metrics": metrics,
+            "params": {**params, **options},
+            "data_path": data_path
+        })
+    return {"version": version, "metrics": metrics}
+
+
+# Incremental run for /retrain with mode=incremental: add trees fitted on the
+# most recent store partitions to the active model and re-evaluate it on a
+# holdout drawn from the same rolling window
+def run_incremental_training_job(store_root, model_output_path, base_model_dir, params, progress_queue=None,
+                                 profile_config=None):
+    def report(event, **fields):
+        if progress_queue is not None:
+            progress_queue.put({"event": event, **fields})
+
+    profile_in_worker(profile_config, progress_queue)
+    window_months = int(params.get("window_months", 3))
+    new_trees = int(params.get("new_trees", 20))
+    max_trees = params.get("max_trees")
+    holdout = float(params.get("holdout_fraction", 0.2))
+
+    report("phase", name="Loading recent partitions", progress=2)
+    with profiler.capture("train:preprocess"):
+        store = DatasetStore(store_root)
+        months = store.months()[-window_months:]
+        if not months:
+            raise ValueError("The dataset store is empty; ingest data before incremental training")
+        df = store.read(months=months, columns=FEATURES + [TARGET])
+        report("log", message=f"Loaded {len(df)} rows from months {', '.join(months)}")
+
+        # Reuse the base version's encoders and scaler so old trees stay valid;
+        # unseen regions get the fallback code
+        model, scaler, label_encoders = load_model_components(base_model_dir)
+        X = encode_and_scale(df, scaler, label_encoders)
+        y = df[TARGET].to_numpy()
+        # The stratified split and the added trees need exactly the base model's classes
+        present = set(np.unique(y).tolist())
+        missing = sorted(set(model.classes_.tolist()) - present)
+        if missing:
+            raise ValueError(
+                f"Months {', '.join(months)} contain no rows of class {', '.join(str(c) for c in missing)}; "
+                "widen window_months for incremental training"
+            )
+        unknown = sorted(present - set(model.classes_.tolist()))
+        if unknown:
+            raise ValueError(f"Class {', '.join(str(c) for c in unknown)} is unknown to the base model; run a full retrain")
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=holdout, random_state=42, stratify=y
+        )
+        before = evaluation_metrics(y_test, model.predict(X_test))
+    report("log", message=f"Base model on rolling holdout - accuracy: {before['accuracy']:.4f}, f1: {before['f1_score']:.4f}")
+
+    report("phase", name="Growing forest on recent data", progress=10)
+    base_trees = model.n_estimators
+    with profiler.capture("train:fit"):
+        model = fit_forest(
+            X_train, y_train, X_test, y_test,
+            n_estimators=base_trees + new_trees,
+            trees_per_step=int(params.get("trees_per_step", 10)),
+            n_jobs=int(params.get("n_jobs", -1)),
+            progress_callback=lambda step: report("step", **step),
+            base_model=model
+        )
+
+    # Retire the oldest trees so the forest (and latency) stays bounded
+    if max_trees is not None and len(model.estimators_) > int(max_trees):
+        model.estimators_ = model.estimators_[-int(max_trees):]
+        model.n_estimators = int(max_trees)
+        report("log", message=f"Retired oldest trees, keeping {model.n_estimators}")
+
+    report("phase", name="Evaluation", progress=92)
+    with profiler.capture("train:evaluate"):
+        metrics = evaluation_metrics(y_test, model.predict(X_test))
+    metrics["holdout_before"] = before
+
+    report("phase", name="Model deployment", progress=96)
+    with profiler.capture("train:publish"):
+        raw_encoders = joblib.load(os.path.join(base_model_dir, "label_encoders.pkl"))
+        registry = ModelRegistry(model_output_path)
+        version = registry.publish(model, scaler, raw_encoders, metadata={
+            "metrics": metrics,
+            "params": params,
+            "mode": "incremental",
+            "base_version": os.path.basename(os.path.normpath(base_model_dir)),
+            "window_months": months
+        })
+    return {"version": version, "metrics": metrics}
+
+
+def train_and_evaluate_model(data_path, model_output_path, make_current=True):
+    # Each stage is a profiling hook ("train:<stage>", see profiling.py)
     # Load processed data
-    X_train, X_test, y_train, y_test, scaler, label_encoders = load_and_preprocess_data(data_path)
+    with profiler.capture("train:preprocess"):
+        X_train, X_test, y_train, y_test, scaler, label_encoders = load_and_preprocess_data(data_path)
 
     # Train the model
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
+    with profiler.capture("train:fit"):
+        model = fit_forest(X_train, y_train, X_test, y_test, n_estimators=100)
 
     # Predict
-    y_pred = model.predict(X_test)
+    with profiler.capture("train:evaluate"):
+        y_pred = model.predict(X_test)
 
     # Evaluate
     print("\nClassification Report:")
     print(classification_report(y_test, y_pred))
 
+    metrics = evaluation_metrics(y_test, y_pred)
+
     print("\nMetrics:")
-    print("Accuracy:", accuracy_score(y_test, y_pred))
-    print("Precision:", precision_score(y_test, y_pred))
-    print("Recall:", recall_score(y_test, y_pred))
-    print("F1 Score:", f1_score(y_test, y_pred))
-
-    # Save model, scaler, and encoders
-    os.makedirs(model_output_path, exist_ok=True)
-    joblib.dump(model, os.path.join(model_output_path, "conflict_model.pkl"))
-    joblib.dump(scaler, os.path.join(model_output_path, "scaler.pkl"))
-    joblib.dump(label_encoders, os.path.join(model_output_path, "label_encoders.pkl"))
-
-    print("\n✅ Model, scaler, and encoders saved.")
+    print("Accuracy:", metrics["accuracy"])
+    print("Precision:", metrics["precision"])
+    print("Recall:", metrics["recall"])
+    print("F1 Score:", metrics["f1_score"])
+
+    # Save model, scaler, and encoders as a new registry version (never in place)
+    with profiler.capture("train:publish"):
+        registry = ModelRegistry(model_output_path)
+        version = registry.publish(model, scaler, label_encoders, metadata={
+            "metrics": metrics,
+            "params": model.get_params(),
+            "data_path": data_path
+        })
+        if make_current:
+            registry.set_current(version)
+
+    print(f"\n✅ Model, scaler, and encoders saved as version {version}.")
+    return version, metrics
 
 
 if __name__ == "__main__":
@@ -3,54 +3,248 @@ import numpy as np
 import pandas as pd
 import os
 
+from forest import FOREST_DIR, CompiledForest, build_backend, has_compiled_forest
+from metrics import BATCH_SIZE, stage_timer
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet/Arrow batch files are optional
+    pa = None
+
+CATEGORICAL_COLUMNS = ['COUNTRY', 'ADMIN1']
+
+FEATURES = [
+    'COUNTRY', 'ADMIN1', 'total_events', 'total_fatalities',
+    'rainfall_mm', 'drought_index', 'temp_celsius',
+    'poverty_rate', 'literacy_rate', 'infrastructure_score',
+    'past_conflicts_3mo'
+]
+
+# Non-feature columns kept when reading columnar files (everything else is skipped)
+ID_COLUMNS = ['id', 'region_id', 'event_date', 'YEAR', 'MONTH', 'latitude', 'longitude']
+
+# Batch file formats by extension
+FILE_FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.feather': 'arrow', '.arrow': 'arrow'}
+
+# Code given to categories the encoders never saw (None raises instead)
+UNKNOWN_CATEGORY_CODE = -1
+
+
+# Precompiled replacement for a fitted LabelEncoder on the prediction path
+class CategoryLookup:
+    def __init__(self, classes, unknown_code=UNKNOWN_CATEGORY_CODE):
+        self.classes_ = np.asarray(classes)
+        self.categories = pd.Index(self.classes_)
+        self.mapping = {label: code for code, label in enumerate(self.classes_)}
+        self.unknown_code = unknown_code
+
+    def transform(self, values):
+        # Single values (form posts) are a plain dict lookup
+        if isinstance(values, (list, tuple)) and len(values) == 1:
+            code = self.mapping.get(values[0], -1)
+            if code == -1:
+                code = self._unknown(values)
+            return np.array([code])
+
+        # Batches go through the hashed category index in one pass
+        codes = self.categories.get_indexer(values)
+        unseen = codes == -1
+        if unseen.any():
+            codes[unseen] = self._unknown(np.asarray(values, dtype=object)[unseen])
+        return codes
+
+    def _unknown(self, values):
+        if self.unknown_code is None:
+            labels = ", ".join(sorted({str(v) for v in values})[:10])
+            raise ValueError(f"Unknown categories: {labels}")
+        return self.unknown_code
+
+
 # Load model components
-def load_model_components(model_dir):
-    model = joblib.load(os.path.join(model_dir, "conflict_model.pkl"))
+def load_model_components(model_dir, unknown_category_code=UNKNOWN_CATEGORY_CODE, backend="sklearn"):
+    if backend == "compiled" and has_compiled_forest(model_dir):
+        # Memory-mapped node arrays: no unpickling, shared across workers
+        model = CompiledForest.load(os.path.join(model_dir, FOREST_DIR))
+    else:
+        model = build_backend(joblib.load(os.path.join(model_dir, "conflict_model.pkl")), backend)
     scaler = joblib.load(os.path.join(model_dir, "scaler.pkl"))
     label_encoders = joblib.load(os.path.join(model_dir, "label_encoders.pkl"))
+
+    # Build lookup tables once instead of searching classes_ on every call
+    label_encoders = {
+        col: CategoryLookup(encoder.classes_, unknown_code=unknown_category_code)
+        for col, encoder in label_encoders.items()
+    }
     return model, scaler, label_encoders
 
 
+# Encode categorical columns and scale the model features of a DataFrame
+def encode_and_scale(df, scaler, label_encoders):
+    with stage_timer("encode"):
+        X = df[FEATURES].copy()
+        for col in CATEGORICAL_COLUMNS:
+            X[col] = label_encoders[col].transform(X[col])
+    with stage_timer("scale"):
+        return scaler.transform(X)
+
+
 # Predict single datapoint (from form, etc.)
 def predict_single(input_dict, model, scaler, label_encoders):
     # Convert categorical
-    for col in ['COUNTRY', 'ADMIN1']:
-        input_dict[col] = label_encoders[col].transform([input_dict[col]])[0]
-
-    # Create feature array
-    features_order = [
-        'COUNTRY', 'ADMIN1', 'total_events', 'total_fatalities',
-        'rainfall_mm', 'drought_index', 'temp_celsius',
-        'poverty_rate', 'literacy_rate', 'infrastructure_score',
-        'past_conflicts_3mo'
-    ]
-    features = np.array([input_dict[col] for col in features_order]).reshape(1, -1)
-    features_scaled = scaler.transform(features)
-
-    # Predict
-    prediction = model.predict(features_scaled)[0]
-    probability = model.predict_proba(features_scaled)[0][prediction]
-    return prediction, probability
-
-
-# Predict from uploaded CSV file
-def predict_from_csv(csv_path, model, scaler, label_encoders):
-    df = pd.read_csv(csv_path)
-
-    # Encode categorical columns
-    for col in ['COUNTRY', 'ADMIN1']:
-        df[col] = label_encoders[col].transform(df[col])
-
-    features = [
-        'COUNTRY', 'ADMIN1', 'total_events', 'total_fatalities',
-        'rainfall_mm', 'drought_index', 'temp_celsius',
-        'poverty_rate', 'literacy_rate', 'infrastructure_score',
-        'past_conflicts_3mo'
-    ]
-    X = scaler.transform(df[features])
-    preds = model.predict(X)
-    probs = model.predict_proba(X).max(axis=1)
-
-    df['prediction'] = preds
-    df['confidence'] = probs
-    return df
+    with stage_timer("encode"):
+        for col in CATEGORICAL_COLUMNS:
+            input_dict[col] = label_encoders[col].transform([input_dict[col]])[0]
+
+        # Create feature array
+        features = np.array([input_dict[col] for col in FEATURES]).reshape(1, -1)
+    with stage_timer("scale"):
+        features_scaled = scaler.transform(features)
+
+    # Predict (one forest walk; the class is the most probable column)
+    with stage_timer("predict_proba"):
+        proba = model.predict_proba(features_scaled)[0]
+    index = proba.argmax()
+    return model.classes_[index], proba[index]
+
+
+# Predict many records at once (from the JSON batch API)
+def predict_batch(records, model, scaler, label_encoders):
+    df = pd.DataFrame.from_records(records)
+    missing = [col for col in FEATURES if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+
+    X = encode_and_scale(df, scaler, label_encoders)
+    with stage_timer("predict_proba"):
+        proba = model.predict_proba(X)
+    index = proba.argmax(axis=1)
+    preds = model.classes_[index]
+    probs = proba[np.arange(len(index)), index]
+    return preds, probs
+
+
+def file_format(path):
+    fmt = FILE_FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unsupported file type, expected one of {', '.join(FILE_FORMATS)}")
+    if fmt != 'csv' and pa is None:
+        raise ValueError("Parquet/Arrow files require pyarrow to be installed")
+    return fmt
+
+
+# Yield DataFrame chunks of a batch file; columnar formats only load the
+# model features plus ID columns, straight from the memory-mapped file
+def iter_feature_chunks(path, chunksize=50000, id_columns=ID_COLUMNS):
+    fmt = file_format(path)
+    if fmt == 'csv':
+        yield from pd.read_csv(path, chunksize=chunksize)
+        return
+
+    wanted = FEATURES + [col for col in id_columns if col not in FEATURES]
+    if fmt == 'parquet':
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        columns = [col for col in wanted if col in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        with pa.memory_map(path, 'r') as source:
+            reader = pa.ipc.open_file(source)
+            columns = [col for col in wanted if col in reader.schema.names]
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(columns)
+                for start in range(0, batch.num_rows, chunksize):
+                    yield batch.slice(start, chunksize).to_pandas()
+
+
+# Read a whole batch file (CSV, Parquet or Arrow) into one DataFrame
+def read_table(path):
+    fmt = file_format(path)
+    if fmt == 'csv':
+        return pd.read_csv(path)
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_pandas()
+
+
+# Incrementally write scored chunks in the same format as the input
+class ChunkWriter:
+    def __init__(self, path):
+        self.path = path
+        self.format = file_format(path)
+        self._writer = None
+        self._schema = None
+        self._header_written = False
+
+    def write(self, chunk):
+        if self.format == 'csv':
+            chunk.to_csv(self.path, mode='a' if self._header_written else 'w',
+                         header=not self._header_written, index=False)
+            self._header_written = True
+            return
+
+        # Later chunks are coerced to the first chunk's schema
+        table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            if self.format == 'parquet':
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, self._schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Predict a CSV, Parquet or Arrow file in fixed-size chunks, appending
+# results to output_path so memory stays flat however large the input is
+def predict_file_chunked(input_path, output_path, model, scaler, label_encoders,
+                         chunksize=50000, sample_size=100, sample_columns=None,
+                         progress_callback=None, transform=None):
+    total_records = 0
+    conflicts_predicted = 0
+    results_sample = []
+
+    with ChunkWriter(output_path) as writer:
+        for chunk in iter_feature_chunks(input_path, chunksize=chunksize):
+            if transform is not None:
+                with stage_timer("assemble"):
+                    chunk = transform(chunk)
+            missing = [col for col in FEATURES if col not in chunk.columns]
+            if missing:
+                raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+            X = encode_and_scale(chunk, scaler, label_encoders)
+            BATCH_SIZE.observe(len(X), source="file")
+            with stage_timer("predict_proba"):
+                proba = model.predict_proba(X)
+            chunk['prediction'] = model.classes_[proba.argmax(axis=1)]
+            chunk['confidence'] = proba.max(axis=1)
+            with stage_timer("serialize"):
+                writer.write(chunk)
+
+            # Running totals and the first sample_size rows for display
+            total_records += len(chunk)
+            conflicts_predicted += int((chunk['prediction'] == 1).sum())
+            if len(results_sample) < sample_size:
+                columns = [col for col in (sample_columns or chunk.columns) if col in chunk.columns]
+                head = chunk[columns].head(sample_size - len(results_sample))
+                results_sample.extend(head.to_dict(orient='records'))
+
+            if progress_callback is not None:
+                progress_callback(total_records)
+
+    return {
+        "total_records": total_records,
+        "conflicts_predicted": conflicts_predicted,
+        "results_sample": results_sample
+    }
@@ -1,38 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import joblib
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 
+from prediction import CATEGORICAL_COLUMNS, FEATURES
+
+TARGET = 'label'
+
+# Bump when the cached layout or the preprocessing itself changes
+CACHE_FORMAT = 1
+
+# Explicit dtypes instead of letting pandas infer object/float64 columns
+COLUMN_DTYPES = {
+    **{col: 'category' for col in CATEGORICAL_COLUMNS},
+    **{col: 'float32' for col in FEATURES if col not in CATEGORICAL_COLUMNS},
+    TARGET: 'int64'
+}
+
+
+# SHA-256 of the file contents, remembered per (size, mtime) so unchanged
+# files are not re-hashed on every run
+def file_fingerprint(filepath, cache_dir):
+    stat = os.stat(filepath)
+    index_path = os.path.join(cache_dir, "fingerprints.json")
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+
+    entry = index.get(os.path.abspath(filepath))
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+    index[os.path.abspath(filepath)] = {
+        "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()
+    }
+    tmp_path = f"{index_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    return digest.hexdigest()
+
 
-def load_and_preprocess_data(filepath):
-    # Load dataset
-    df = pd.read_csv(filepath)
+def default_cache_dir(filepath):
+    return os.path.join(os.path.dirname(os.path.abspath(filepath)), ".feature_cache")
 
-    # Encode categorical variables
+
+# Parse, encode and scale the dataset (the uncached path)
+def build_feature_matrix(filepath):
+    df = pd.read_csv(filepath, usecols=FEATURES + [TARGET], dtype=COLUMN_DTYPES)
+
+    # Category codes match LabelEncoder: classes are the sorted unique labels
     label_encoders = {}
-    for col in ['COUNTRY', 'ADMIN1']:
+    for col in CATEGORICAL_COLUMNS:
         le = LabelEncoder()
-        df[col] = le.fit_transform(df[col])
+        le.classes_ = np.asarray(df[col].cat.categories, dtype=object)
+        df[col] = df[col].cat.codes
         label_encoders[col] = le
 
-    # Define features and target
-    features = [
-        'COUNTRY', 'ADMIN1', 'total_events', 'total_fatalities',
-        'rainfall_mm', 'drought_index', 'temp_celsius',
-        'poverty_rate', 'literacy_rate', 'infrastructure_score',
-        'past_conflicts_3mo'
-    ]
-    target = 'label'
+    # Fit the scaler in float64 so it matches an uncached fit exactly
+    X = df[FEATURES].to_numpy(dtype=np.float64)
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X).astype(np.float32)
+    y = df[TARGET].to_numpy()
+    return X_scaled, y, scaler, label_encoders
 
-    X = df[features]
-    y = df[target]
 
-    # Scale features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+# Encoded and scaled feature matrix for a data file, cached on disk as
+# memory-mappable .npy files keyed by content hash and feature list
+def load_feature_matrix(filepath, cache_dir=None, use_cache=True):
+    if not use_cache:
+        return build_feature_matrix(filepath)
+
+    cache_dir = cache_dir or default_cache_dir(filepath)
+    os.makedirs(cache_dir, exist_ok=True)
+    key_source = json.dumps({
+        "data": file_fingerprint(filepath, cache_dir),
+        "features": FEATURES,
+        "target": TARGET,
+        "format": CACHE_FORMAT
+    }, sort_keys=True)
+    entry_dir = os.path.join(cache_dir, hashlib.sha256(key_source.encode()).hexdigest()[:16])
+
+    if os.path.exists(os.path.join(entry_dir, "preprocessors.pkl")):
+        X_scaled = np.load(os.path.join(entry_dir, "X.npy"), mmap_mode='r')
+        y = np.load(os.path.join(entry_dir, "y.npy"), mmap_mode='r')
+        scaler, label_encoders = joblib.load(os.path.join(entry_dir, "preprocessors.pkl"))
+        return X_scaled, y, scaler, label_encoders
+
+    X_scaled, y, scaler, label_encoders = build_feature_matrix(filepath)
+
+    # Write to a staging directory and rename so readers never see half an entry
+    staging = os.path.join(cache_dir, f".staging-{uuid.uuid4().hex}")
+    os.makedirs(staging)
+    np.save(os.path.join(staging, "X.npy"), X_scaled)
+    np.save(os.path.join(staging, "y.npy"), y)
+    joblib.dump((scaler, label_encoders), os.path.join(staging, "preprocessors.pkl"))
+    try:
+        os.rename(staging, entry_dir)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+    return X_scaled, y, scaler, label_encoders
+
+
+def load_and_preprocess_data(filepath, test_size=0.2, cache_dir=None, use_cache=True):
+    # Encoded and scaled features (parsed once per distinct data file)
+    X_scaled, y, scaler, label_encoders = load_feature_matrix(filepath, cache_dir, use_cache)
 
     # Train-test split
     X_train, X_test, y_train, y_test = train_test_split(
-        X_scaled, y, test_size=0.2, random_state=42, stratify=y
+        X_scaled, y, test_size=test_size, random_state=42, stratify=y
     )
 
     return X_train, X_test, y_train, y_test, scaler, label_encoders
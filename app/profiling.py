@@ -0,0 +1,284 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+
+ENGINES = ["cprofile", "sampler"]
+MODES = ["off", "sample", "next"]
+
+# Hook names that can be profiled: request routes and training stages ("train:<stage>")
+TARGETS = ["/predict", "/upload", "train"]
+
+
+# Statistical sampler: reads one thread's stack via sys._current_frames at a
+# fixed interval, so unlike cProfile it adds no per-call overhead
+class StackSampler:
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def collapse_stacks(stacks):
+    """Flamegraph "collapsed" format: root;...;leaf <count> per line"""
+    lines = []
+    for stack, count in stacks.most_common():
+        names = (f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+        lines.append(f"{';'.join(names)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def stacks_to_pstats(stacks, interval):
+    # Build the dict pstats.Stats loads: one sample counts as interval seconds
+    stats = {}
+    for stack, count in stacks.items():
+        elapsed = count * interval
+        for func in dict.fromkeys(stack):
+            cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0.0, 0.0, {}))
+            stats[func] = (cc + count, nc + count, tt, ct + elapsed, callers)
+        leaf = stack[-1]
+        cc, nc, tt, ct, callers = stats[leaf]
+        stats[leaf] = (cc, nc, tt + elapsed, ct, callers)
+        for caller, callee in zip(stack, stack[1:]):
+            callers = stats[callee][4]
+            c_nc, c_cc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+            callers[caller] = (c_nc + count, c_cc + count, c_tt + (elapsed if callee == leaf else 0.0), c_ct + elapsed)
+    return stats
+
+
+# Decides which hook invocations are profiled and keeps the most recent
+# profiles in a ring buffer; everything is a no-op while the mode is "off"
+class Profiler:
+    def __init__(self, buffer_size=50, export_dir=None):
+        self.profiles = deque(maxlen=buffer_size)
+        # Also write each profile to disk (for runs like the training CLI that exit)
+        self.export_dir = export_dir
+        # Set in job processes: finished profiles go here instead of the buffer
+        self.sink = None
+        self._lock = threading.Lock()
+        self.config = {"mode": "off", "engine": "sampler", "rate": 0.01, "remaining": 0,
+                       "interval": 0.005, "targets": list(TARGETS)}
+
+    def configure(self, mode=None, engine=None, rate=None, count=None, interval=None, targets=None):
+        with self._lock:
+            config = dict(self.config)
+            if mode is not None:
+                if mode not in MODES:
+                    raise ValueError(f"Unknown profiling mode '{mode}', expected one of {MODES}")
+                config["mode"] = mode
+            if engine is not None:
+                if engine not in ENGINES:
+                    raise ValueError(f"Unknown profiling engine '{engine}', expected one of {ENGINES}")
+                config["engine"] = engine
+            if rate is not None:
+                if not 0 <= float(rate) <= 1:
+                    raise ValueError("rate must be between 0 and 1")
+                config["rate"] = float(rate)
+            if count is not None:
+                config["remaining"] = int(count)
+            if interval is not None:
+                config["interval"] = max(0.001, float(interval))
+            if targets is not None:
+                unknown = [target for target in targets if target not in TARGETS]
+                if unknown:
+                    raise ValueError(f"Unknown profiling targets: {', '.join(unknown)}")
+                config["targets"] = list(targets)
+            self.config = config
+            return dict(config)
+
+    def should_capture(self, name):
+        config = self.config
+        if config["mode"] == "off" or name.split(":")[0] not in config["targets"]:
+            return False
+        if config["mode"] == "sample":
+            return random.random() < config["rate"]
+        # "next": capture the next N matching calls, then switch off
+        with self._lock:
+            if self.config["remaining"] <= 0:
+                return False
+            self.config["remaining"] -= 1
+            if self.config["remaining"] == 0:
+                self.config["mode"] = "off"
+            return True
+
+    @contextmanager
+    def capture(self, name, force=False):
+        """Profile the enclosed block (in the current thread) if it is selected"""
+        if not force and not self.should_capture(name):
+            yield
+            return
+
+        engine, interval = self.config["engine"], self.config["interval"]
+        started_at = time.time()
+        start = time.perf_counter()
+        if engine == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+        else:
+            sampler = StackSampler(threading.get_ident(), interval)
+            sampler.start()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if engine == "cprofile":
+                profile.disable()
+                profile.create_stats()
+                entry = {"stats": profile.stats, "stacks": None}
+            else:
+                sampler.stop()
+                entry = {"stats": stacks_to_pstats(sampler.stacks, interval), "stacks": sampler.stacks}
+            entry.update({
+                "id": uuid.uuid4().hex[:12],
+                "name": name,
+                "engine": engine,
+                "started_at": started_at,
+                "duration_ms": duration * 1000,
+                "samples": sum(entry["stacks"].values()) if entry["stacks"] is not None else None
+            })
+            self._store(entry)
+
+    def run(self, name, func, *args, **kwargs):
+        # For callables handed to a threadpool: profiles the worker thread
+        with self.capture(name):
+            return func(*args, **kwargs)
+
+    def run_profiled(self, name, func, *args, **kwargs):
+        # Same, for callers that already decided with should_capture()
+        with self.capture(name, force=True):
+            return func(*args, **kwargs)
+
+    def _store(self, entry):
+        if self.sink is not None:
+            self.sink(entry)
+            return
+        with self._lock:
+            self.profiles.append(entry)
+        if self.export_dir:
+            try:
+                os.makedirs(self.export_dir, exist_ok=True)
+                base = os.path.join(self.export_dir, f"{entry['id']}-{entry['name'].strip('/').replace('/', '_').replace(':', '-')}")
+                with open(f"{base}.prof", "wb") as f:
+                    f.write(self.pstats_bytes(entry))
+                if entry["stacks"] is not None:
+                    with open(f"{base}.collapsed", "w") as f:
+                        f.write(collapse_stacks(entry["stacks"]))
+            except OSError as e:
+                print(f"Could not export profile {entry['id']}: {str(e)}")
+
+    def adopt(self, entry):
+        """Store a profile captured in a job process; it counts toward a "next" budget"""
+        with self._lock:
+            if self.config["mode"] == "next" and self.config["remaining"] > 0:
+                self.config["remaining"] -= 1
+                if self.config["remaining"] == 0:
+                    self.config["mode"] = "off"
+        self._store(entry)
+
+    def list(self):
+        with self._lock:
+            entries = list(self.profiles)
+        return [
+            {key: value for key, value in entry.items() if key not in ("stats", "stacks")}
+            for entry in reversed(entries)
+        ]
+
+    def get(self, profile_id):
+        with self._lock:
+            for entry in self.profiles:
+                if entry["id"] == profile_id:
+                    return entry
+        return None
+
+    def clear(self):
+        with self._lock:
+            self.profiles.clear()
+
+    @staticmethod
+    def pstats_bytes(entry):
+        """The profile in the marshal format pstats.Stats, snakeviz etc. load"""
+        return marshal.dumps(entry["stats"])
+
+    @staticmethod
+    def collapsed(entry):
+        if entry["stacks"] is None:
+            return None
+        return collapse_stacks(entry["stacks"])
+
+    @staticmethod
+    def summary(entry, limit=30):
+        # Text report sorted by cumulative time, as printed by pstats
+        stream = io.StringIO()
+        stats = pstats.Stats(_LoadedStats(entry["stats"]), stream=stream)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+
+# pstats.Stats accepts any object with create_stats() and a stats dict
+class _LoadedStats:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profile_in_worker(config, progress_queue):
+    """Run a job process's hooks with the API's profiler config
+
+    Profiles are sent back as {"event": "profile"} progress events, which the
+    parent hands to Profiler.adopt so they land in its ring buffer.
+    """
+    if config is None:
+        return
+    profiler.config = dict(config)
+    if progress_queue is not None:
+        profiler.sink = lambda entry: progress_queue.put({"event": "profile", "entry": entry})
+
+
+def profiler_from_env():
+    profiler = Profiler(
+        buffer_size=int(os.environ.get("PROFILE_BUFFER_SIZE", "50")),
+        export_dir=os.environ.get("PROFILE_DIR") or None
+    )
+    targets = os.environ.get("PROFILE_TARGETS")
+    profiler.configure(
+        mode=os.environ.get("PROFILE_MODE", "off"),
+        engine=os.environ.get("PROFILE_ENGINE", "sampler"),
+        rate=os.environ.get("PROFILE_RATE", "0.01"),
+        count=os.environ.get("PROFILE_COUNT", "0"),
+        targets=targets.split(",") if targets else None
+    )
+    return profiler
+
+
+# Process-wide profiler shared by the API and the training stages
+profiler = profiler_from_env()
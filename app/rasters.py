@@ -0,0 +1,315 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from prediction import CATEGORICAL_COLUMNS
+
+# Edge of the square chunks a layer is stored in
+TILE_SIZE = 256
+
+# Model features assembled from raster layers: feature -> (layer, statistic)
+LAYER_FEATURES = {
+    "rainfall_mm": ("rainfall", "mean"),
+    "drought_index": ("drought", "mean"),
+    "temp_celsius": ("temperature", "mean")
+}
+
+ZONAL_STATISTICS = ["mean", "min", "max", "std", "count"]
+
+# Zones are lon/lat boxes per (COUNTRY, ADMIN1)
+ZONE_COLUMNS = CATEGORICAL_COLUMNS + ["min_lng", "min_lat", "max_lng", "max_lat"]
+
+# Half-width in degrees of the box drawn around a point (rows with coordinates, or
+# regions built from point data)
+POINT_BUFFER_DEGREES = 0.25
+
+LAYER_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+# One environmental grid, stored tile-major so every TILE_SIZE chunk is
+# contiguous on disk and zonal statistics only page in the tiles they touch
+#
+#   <root>/<layer>/layer.json
+#   <root>/<layer>/tiles-<version>.npy   (tile_rows, tile_cols, tile, tile) float32, NaN = no data
+class RasterLayer:
+    def __init__(self, path):
+        with open(os.path.join(path, "layer.json")) as f:
+            self.meta = json.load(f)
+        self.name = self.meta["name"]
+        self.version = self.meta["version"]
+        self.rows, self.cols = self.meta["shape"]
+        self.tile_size = self.meta["tile_size"]
+        self.bounds = self.meta["bounds"]
+        self.tiles = np.load(os.path.join(path, self.meta["tiles"]), mmap_mode="r")
+
+    def pixel_windows(self, boxes):
+        """Clipped (top, bottom, left, right) pixel windows for (N, 4) lon/lat boxes; row 0 is north"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        west, south, east, north = self.bounds
+        x_res = (east - west) / self.cols
+        y_res = (north - south) / self.rows
+        top = np.floor((north - boxes[:, 3]) / y_res)
+        bottom = np.ceil((north - boxes[:, 1]) / y_res)
+        left = np.floor((boxes[:, 0] - west) / x_res)
+        right = np.ceil((boxes[:, 2] - west) / x_res)
+        windows = np.stack([
+            np.clip(top, 0, self.rows), np.clip(bottom, 0, self.rows),
+            np.clip(left, 0, self.cols), np.clip(right, 0, self.cols)
+        ], axis=1)
+        return np.nan_to_num(windows).astype(np.int64)
+
+    def tile_index(self, windows):
+        """Spatial index of the windows: (tile_row, tile_col) -> indices of the windows touching it"""
+        ts = self.tile_size
+        index = {}
+        for i, (top, bottom, left, right) in enumerate(windows.tolist()):
+            if bottom <= top or right <= left:
+                continue
+            for tr in range(top // ts, (bottom - 1) // ts + 1):
+                for tc in range(left // ts, (right - 1) // ts + 1):
+                    index.setdefault((tr, tc), []).append(i)
+        return {key: np.array(value) for key, value in index.items()}
+
+    def zonal_stats(self, boxes, stats=("mean",)):
+        """Statistics of every (N, 4) lon/lat box, visiting each intersecting tile once"""
+        windows = self.pixel_windows(boxes)
+        n = len(windows)
+        # Sums of valid-pixel count, value and value^2 per zone
+        sums = np.zeros((3, n))
+        want_squares = "std" in stats
+        want_extremes = "min" in stats or "max" in stats
+        mins = np.full(n, np.inf)
+        maxs = np.full(n, -np.inf)
+
+        ts = self.tile_size
+        for (tr, tc), zones in sorted(self.tile_index(windows).items()):
+            block = np.asarray(self.tiles[tr, tc], dtype=np.float64)
+            valid = ~np.isnan(block)
+            has_nodata = not valid.all()
+            values = np.where(valid, block, 0.0) if has_nodata else block
+
+            top, bottom, left, right = windows[zones].T
+            r0 = np.clip(top - tr * ts, 0, ts)
+            r1 = np.clip(bottom - tr * ts, 0, ts)
+            c0 = np.clip(left - tc * ts, 0, ts)
+            c1 = np.clip(right - tc * ts, 0, ts)
+
+            # Summed-area tables of only the planes needed: any window inside the
+            # tile is then four lookups. Without nodata the count is the window area.
+            planes = [values] + ([values * values] if want_squares else []) + ([valid] if has_nodata else [])
+            table = np.zeros((len(planes), ts + 1, ts + 1))
+            np.cumsum(np.stack(planes), axis=1, out=table[:, 1:, 1:])
+            np.cumsum(table[:, 1:, 1:], axis=2, out=table[:, 1:, 1:])
+            window_sums = table[:, r1, c1] - table[:, r0, c1] - table[:, r1, c0] + table[:, r0, c0]
+
+            sums[1, zones] += window_sums[0]
+            if want_squares:
+                sums[2, zones] += window_sums[1]
+            sums[0, zones] += window_sums[-1] if has_nodata else (r1 - r0) * (c1 - c0)
+
+            if want_extremes:
+                for zone, a, b, c, d in zip(zones, r0, r1, c0, c1):
+                    window = block[a:b, c:d]
+                    if valid[a:b, c:d].any():
+                        mins[zone] = min(mins[zone], np.nanmin(window))
+                        maxs[zone] = max(maxs[zone], np.nanmax(window))
+
+        count, total, squares = sums
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, total / count, np.nan)
+            variance = np.where(count > 0, squares / count - mean * mean, np.nan)
+        result = {
+            "mean": mean,
+            "min": np.where(count > 0, mins, np.nan),
+            "max": np.where(count > 0, maxs, np.nan),
+            "std": np.sqrt(np.clip(variance, 0, None)),
+            "count": count.astype(np.int64)
+        }
+        return pd.DataFrame({stat: result[stat] for stat in stats})
+
+
+def write_tiles(path, array, tile_size=TILE_SIZE):
+    """Write a 2D array as a tile-major, NaN-padded .npy without holding a second copy"""
+    rows, cols = array.shape
+    tile_rows, tile_cols = -(-rows // tile_size), -(-cols // tile_size)
+    tiles = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float32, shape=(tile_rows, tile_cols, tile_size, tile_size)
+    )
+    tiles[:] = np.nan
+    for tr in range(tile_rows):
+        for tc in range(tile_cols):
+            chunk = array[tr * tile_size:(tr + 1) * tile_size, tc * tile_size:(tc + 1) * tile_size]
+            tiles[tr, tc, :chunk.shape[0], :chunk.shape[1]] = chunk
+    tiles.flush()
+    del tiles
+
+
+# One (COUNTRY, ADMIN1) box per region, centred on its mean coordinates
+def zones_from_points(df, buffer=POINT_BUFFER_DEGREES):
+    centres = df.groupby(CATEGORICAL_COLUMNS, sort=True, observed=True)[["longitude", "latitude"]].mean().reset_index()
+    return pd.DataFrame({
+        "COUNTRY": centres["COUNTRY"].astype(str),
+        "ADMIN1": centres["ADMIN1"].astype(str),
+        "min_lng": centres["longitude"] - buffer,
+        "min_lat": centres["latitude"] - buffer,
+        "max_lng": centres["longitude"] + buffer,
+        "max_lat": centres["latitude"] + buffer
+    })
+
+
+# Environmental raster layers plus the region zones their statistics are taken over
+#
+#   <root>/<layer>/...       see RasterLayer
+#   <root>/zones.csv         COUNTRY, ADMIN1, min_lng, min_lat, max_lng, max_lat
+class RasterStore:
+    def __init__(self, root):
+        self.root = root
+        self._layers = {}
+        self._zones = None
+        self._region_stats = {}
+        self._lock = threading.Lock()
+
+    @property
+    def zones_path(self):
+        return os.path.join(self.root, "zones.csv")
+
+    def layers(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.exists(os.path.join(self.root, name, "layer.json")))
+
+    def layer(self, name):
+        """The layer, reopened only when a new version has been written"""
+        path = os.path.join(self.root, name)
+        meta_path = os.path.join(path, "layer.json")
+        if not os.path.exists(meta_path):
+            return None
+        mtime = os.path.getmtime(meta_path)
+        with self._lock:
+            cached = self._layers.get(name)
+            if cached is None or cached[0] != mtime:
+                cached = self._layers[name] = (mtime, RasterLayer(path))
+            return cached[1]
+
+    def write_layer(self, name, array, bounds, tile_size=TILE_SIZE, units=None):
+        if not LAYER_NAME.match(name):
+            raise ValueError("Layer names may only contain letters, digits, '-' and '_'")
+        array = np.asarray(array) if not isinstance(array, np.ndarray) else array
+        if array.ndim != 2:
+            raise ValueError("A raster layer must be a 2D array")
+        west, south, east, north = bounds
+        if west >= east or south >= north:
+            raise ValueError("Layer bounds must be min_lng,min_lat,max_lng,max_lat")
+
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        tiles_name = f"tiles-{version}.npy"
+        write_tiles(os.path.join(path, tiles_name), array, tile_size)
+        meta = {
+            "name": name,
+            "version": version,
+            "shape": list(array.shape),
+            "bounds": [float(west), float(south), float(east), float(north)],
+            "tile_size": tile_size,
+            "tiles": tiles_name,
+            "units": units,
+            "created_at": time.time()
+        }
+        # Swap the metadata atomically, then drop tiles no reader can reach any more
+        # (open memory maps of the old file stay valid until they are released)
+        tmp_path = os.path.join(path, f".layer-{version}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(path, "layer.json"))
+        for old in os.listdir(path):
+            if old.startswith("tiles-") and old != tiles_name:
+                os.remove(os.path.join(path, old))
+        return meta
+
+    def zones(self):
+        if not os.path.exists(self.zones_path):
+            return None
+        mtime = os.path.getmtime(self.zones_path)
+        with self._lock:
+            if self._zones is None or self._zones[0] != mtime:
+                zones = pd.read_csv(self.zones_path, dtype={"COUNTRY": str, "ADMIN1": str})
+                self._zones = (mtime, zones)
+            return self._zones[1]
+
+    def set_zones(self, zones):
+        missing = [col for col in ZONE_COLUMNS if col not in zones.columns]
+        if missing:
+            raise ValueError(f"Zones are missing columns: {', '.join(missing)}")
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.zones_path}.{uuid.uuid4().hex}.tmp"
+        zones[ZONE_COLUMNS].drop_duplicates(CATEGORICAL_COLUMNS, keep="last").to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.zones_path)
+        return len(zones)
+
+    def region_stats(self, name, stats=("mean",)):
+        """Zonal statistics of a layer for every zone, computed once per layer and zones version"""
+        layer, zones = self.layer(name), self.zones()
+        if layer is None or zones is None:
+            return None
+        key = (name, layer.version, os.path.getmtime(self.zones_path), tuple(stats))
+        cached = self._region_stats.get(key)
+        if cached is None:
+            cached = layer.zonal_stats(zones[ZONE_COLUMNS[2:]].to_numpy(), stats=stats)
+            cached.index = pd.MultiIndex.from_frame(zones[CATEGORICAL_COLUMNS])
+            # Only the current versions are worth keeping
+            self._region_stats = {k: v for k, v in self._region_stats.items() if k[0] != name}
+            self._region_stats[key] = cached
+        return cached
+
+    def assemble_features(self, df, overwrite=False):
+        """Fill raster-backed feature columns of a batch from zonal statistics
+
+        Values already present are kept unless overwrite is set. Rows are matched to
+        zones by (COUNTRY, ADMIN1); rows that match no zone but carry
+        latitude/longitude use a box around their point instead.
+        """
+        for feature, (name, stat) in LAYER_FEATURES.items():
+            layer = self.layer(name)
+            if layer is None:
+                continue
+            current = pd.to_numeric(df[feature], errors="coerce") if feature in df.columns \
+                else pd.Series(np.nan, index=df.index)
+            missing = np.ones(len(df), dtype=bool) if overwrite else current.isna().to_numpy()
+            if not missing.any():
+                continue
+
+            values = np.full(len(df), np.nan)
+            by_region = self.region_stats(name, stats=(stat,))
+            if by_region is not None:
+                keys = pd.MultiIndex.from_arrays([df[col].astype(str) for col in CATEGORICAL_COLUMNS])
+                values = by_region[stat].reindex(keys).to_numpy(dtype=np.float64, copy=True)
+
+            unresolved = missing & np.isnan(values)
+            if unresolved.any() and "latitude" in df.columns and "longitude" in df.columns:
+                lng = pd.to_numeric(df["longitude"], errors="coerce").to_numpy()[unresolved]
+                lat = pd.to_numeric(df["latitude"], errors="coerce").to_numpy()[unresolved]
+                boxes = np.stack([lng - POINT_BUFFER_DEGREES, lat - POINT_BUFFER_DEGREES,
+                                  lng + POINT_BUFFER_DEGREES, lat + POINT_BUFFER_DEGREES], axis=1)
+                values[unresolved] = layer.zonal_stats(boxes, stats=(stat,))[stat].to_numpy()
+
+            fill = missing & ~np.isnan(values)
+            filled = current.to_numpy(dtype=np.float64, copy=True)
+            filled[fill] = values[fill]
+            df[feature] = filled
+        return df
+
+    def summary(self):
+        layers = []
+        for name in self.layers():
+            layer = self.layer(name)
+            layers.append({key: layer.meta[key] for key in ("name", "version", "shape", "bounds", "tile_size", "units")})
+        zones = self.zones()
+        return {"layers": layers, "zones": 0 if zones is None else len(zones)}
@@ -0,0 +1,330 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import joblib
+import numpy as np
+
+from forest import save_compiled_forest
+from metrics import ACTIVE_MODEL, MODEL_LOAD_SECONDS
+from prediction import FEATURES, load_model_components
+
+ARTIFACTS = ["conflict_model.pkl", "scaler.pkl", "label_encoders.pkl"]
+
+# Created (O_EXCL) by the one worker importing legacy pickles; the others wait
+IMPORT_LOCK = ".import.lock"
+
+# Staging directories and import locks older than this belong to dead processes
+STALE_SECONDS = 600
+
+
+# Everything needed to score with one model version; never mutated after load
+@dataclass(frozen=True)
+class ModelBundle:
+    version: str
+    path: str
+    model: object
+    scaler: object
+    label_encoders: dict
+    metadata: dict = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.time)
+
+
+# Versioned model artifacts with an atomically swapped active bundle
+#
+#   <root>/versions/v1/{conflict_model,scaler,label_encoders}.pkl + metadata.json
+#   <root>/versions/v1/forest/*.npy   flat node arrays, memory-mapped at load
+#   <root>/CURRENT    name of the version every worker serves
+#   <root>/HISTORY    JSON list of previously active versions, for rollback
+#
+# Workers share CURRENT and HISTORY: an activation or rollback in one worker
+# rewrites them, and the others pick the change up through start_watching.
+class ModelRegistry:
+    def __init__(self, root, load_options=None):
+        self.root = root
+        self.versions_dir = os.path.join(root, "versions")
+        self.current_file = os.path.join(root, "CURRENT")
+        self.history_file = os.path.join(root, "HISTORY")
+        # Keyword arguments for load_model_components (backend, unknown code)
+        self.load_options = load_options or {}
+        self._lock = threading.Lock()
+        # Held for a whole activation so a local switch and a synced one never interleave
+        self._switch_lock = threading.Lock()
+        self._active = None
+        # Callbacks run with the new bundle after every activation
+        self.listeners = []
+        # Startup load state reported by the readiness probe
+        self.status = "idle"
+        self.error = None
+        self._remove_stale_staging()
+
+    def _remove_stale_staging(self):
+        # Left behind by processes that died between staging and commit
+        if not os.path.isdir(self.versions_dir):
+            return
+        cutoff = time.time() - STALE_SECONDS
+        for name in os.listdir(self.versions_dir):
+            path = os.path.join(self.versions_dir, name)
+            try:
+                if name.startswith(".staging-") and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def version_path(self, version):
+        return os.path.join(self.versions_dir, version)
+
+    def list_versions(self):
+        if not os.path.isdir(self.versions_dir):
+            return []
+        versions = []
+        for name in os.listdir(self.versions_dir):
+            metadata = self.read_metadata(name)
+            if metadata is not None:
+                versions.append(metadata)
+        return sorted(versions, key=lambda item: item.get("created_at", 0))
+
+    def read_metadata(self, version):
+        path = os.path.join(self.version_path(version), "metadata.json")
+        if version.startswith(".") or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _next_version(self):
+        numbers = [
+            int(item["version"][1:]) for item in self.list_versions()
+            if item["version"][1:].isdigit()
+        ]
+        return f"v{max(numbers, default=0) + 1}"
+
+    def publish(self, model, scaler, label_encoders, metadata=None):
+        """Write a new immutable version directory and return its name"""
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+        # Stage in a hidden directory so readers never see a partial version
+        staging = os.path.join(self.versions_dir, f".staging-{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        try:
+            joblib.dump(model, os.path.join(staging, "conflict_model.pkl"))
+            joblib.dump(scaler, os.path.join(staging, "scaler.pkl"))
+            joblib.dump(label_encoders, os.path.join(staging, "label_encoders.pkl"))
+            self._compile(model, staging)
+            return self._commit_staging(staging, metadata)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def _compile(self, model, path):
+        # The compiled layout is an optimisation; the pickle stays authoritative
+        try:
+            save_compiled_forest(model, path)
+        except Exception as e:
+            print(f"Could not store compiled forest for {path}: {str(e)}")
+
+    def _commit_staging(self, staging, metadata):
+        while True:
+            version = self._next_version()
+            info = {**(metadata or {}), "version": version, "created_at": time.time()}
+            with open(os.path.join(staging, "metadata.json"), "w") as f:
+                json.dump(info, f, indent=2, default=str)
+            try:
+                # Atomic on POSIX; fails if another process took the name first
+                os.rename(staging, self.version_path(version))
+                return version
+            except OSError:
+                if not os.path.exists(self.version_path(version)):
+                    raise
+
+    def import_legacy(self):
+        """Adopt pickles saved directly in the model directory as a version"""
+        if not all(os.path.exists(os.path.join(self.root, name)) for name in ARTIFACTS):
+            return None
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging = os.path.join(self.versions_dir, f".staging-{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        try:
+            for name in ARTIFACTS:
+                shutil.copy2(os.path.join(self.root, name), os.path.join(staging, name))
+            self._compile(joblib.load(os.path.join(staging, "conflict_model.pkl")), staging)
+            return self._commit_staging(staging, {"source": "legacy model directory"})
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def _initial_version(self, poll_seconds=0.2):
+        """The newest version, importing the legacy pickles once across all workers
+
+        Workers starting together race for the import lock; the winner imports
+        and writes CURRENT, the others re-read CURRENT until it appears.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        lock_path = os.path.join(self.root, IMPORT_LOCK)
+        while True:
+            version = self.current_version()
+            if version is None:
+                versions = self.list_versions()
+                version = versions[-1]["version"] if versions else None
+            if version is not None:
+                return version
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > STALE_SECONDS:
+                        # Its owner died mid-import
+                        os.remove(lock_path)
+                except OSError:
+                    pass
+                time.sleep(poll_seconds)
+                continue
+            os.close(fd)
+            try:
+                # Another worker may have finished between our check and the claim
+                if self.current_version() is not None or self.list_versions():
+                    continue
+                version = self.import_legacy()
+                if version is not None:
+                    self.set_current(version)
+                return version
+            finally:
+                os.remove(lock_path)
+
+    def _replace(self, path, text):
+        # Replace a pointer file in one step so it is never half-written
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def set_current(self, version):
+        self._replace(self.current_file, version)
+
+    def current_version(self):
+        if os.path.exists(self.current_file):
+            with open(self.current_file) as f:
+                return f.read().strip() or None
+        return None
+
+    def load(self, version):
+        """Load and pre-warm a bundle without making it active"""
+        metadata = self.read_metadata(version)
+        if metadata is None:
+            raise KeyError(f"Unknown model version '{version}'")
+        path = self.version_path(version)
+        with MODEL_LOAD_SECONDS.time():
+            # Published versions are never written to: one without stored arrays
+            # (published before the flat layout existed) is compiled in memory
+            model, scaler, label_encoders = load_model_components(path, **self.load_options)
+            bundle = ModelBundle(version, path, model, scaler, label_encoders, metadata)
+            self._prewarm(bundle)
+        return bundle
+
+    def _prewarm(self, bundle):
+        # One throwaway prediction pages in the trees before real traffic arrives
+        bundle.model.predict_proba(np.zeros((1, len(FEATURES))))
+
+    def active(self):
+        # A single attribute read: callers keep the bundle they got for the
+        # whole request, even if another version is activated meanwhile
+        return self._active
+
+    def activate(self, version, bundle=None, record_history=True):
+        bundle = bundle or self.load(version)
+        with self._switch_lock:
+            previous = self.current_version()
+            if record_history and previous is not None and previous != bundle.version:
+                self._replace(self.history_file, json.dumps(self.history() + [previous]))
+            self.set_current(bundle.version)
+            return self._swap(bundle)
+
+    def _swap(self, bundle):
+        # Only this process: other workers follow CURRENT through sync()
+        with self._lock:
+            self._active = bundle
+            ACTIVE_MODEL.clear()
+            ACTIVE_MODEL.set(1, version=bundle.version)
+        for listener in self.listeners:
+            try:
+                listener(bundle)
+            except Exception as e:
+                print(f"Error in model activation listener: {str(e)}")
+        return bundle
+
+    def rollback(self):
+        history = self.history()
+        if not history:
+            raise ValueError("No previous model version to roll back to")
+        version = history[-1]
+        # Load first: if the version cannot be loaded it stays in the history
+        bundle = self.load(version)
+        with self._switch_lock:
+            history = self.history()
+            if not history or history[-1] != version:
+                raise ValueError("Model history changed during rollback, try again")
+            self._replace(self.history_file, json.dumps(history[:-1]))
+            self.set_current(version)
+            return self._swap(bundle)
+
+    def history(self):
+        if not os.path.exists(self.history_file):
+            return []
+        with open(self.history_file) as f:
+            return json.load(f)
+
+    def sync(self):
+        """Activate the version in CURRENT if another worker switched to it"""
+        version = self.current_version()
+        active = self._active
+        if version is None or active is None or version == active.version:
+            return None
+        bundle = self.load(version)
+        with self._switch_lock:
+            # A newer switch may have landed while this one was loading
+            if self.current_version() != version:
+                return None
+            print(f"Model {version} activated by another worker")
+            return self._swap(bundle)
+
+    def load_current(self):
+        """Activate the version named in CURRENT (or the legacy pickles)"""
+        version = self._initial_version()
+        if version is None:
+            raise FileNotFoundError(f"No model versions found in {self.root}")
+        return self.activate(version)
+
+    def start_background_load(self):
+        """Load the current version on a thread so the server starts serving at once"""
+        self.status = "loading"
+
+        def run():
+            try:
+                bundle = self.load_current()
+                self.status = "ready"
+                print(f"Model {bundle.version} loaded successfully")
+            except Exception as e:
+                self.status = "failed"
+                self.error = str(e)
+                print(f"Error loading model: {str(e)}")
+
+        thread = threading.Thread(target=run, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def start_watching(self, interval):
+        """Poll CURRENT on a thread so other workers' activations and rollbacks apply here"""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"Error syncing model version: {str(e)}")
+
+        thread = threading.Thread(target=run, name="model-watcher", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+
+from datastore import DatasetStore
+from prediction import CATEGORICAL_COLUMNS, FEATURES, encode_and_scale
+
+# Risk change between runs below which a region counts as stable
+TREND_THRESHOLD = 0.05
+
+# Probability at which a region becomes an early-warning alert, and severity bands
+ALERT_THRESHOLD = 0.6
+SEVERITY_LEVELS = [(0.8, "critical"), (0.6, "high"), (0.4, "medium"), (0.0, "low")]
+
+# Optional coordinate columns carried through from the snapshot
+COORDINATE_COLUMNS = {"latitude": "lat", "longitude": "lng"}
+
+# Driving factors: feature, the quantile of the snapshot that marks it, direction
+FACTOR_RULES = [
+    ("past_conflicts_3mo", 0.75, "high", "Conflict History"),
+    ("total_fatalities", 0.75, "high", "Recent Fatalities"),
+    ("drought_index", 0.75, "high", "Drought"),
+    ("rainfall_mm", 0.25, "low", "Water Scarcity"),
+    ("temp_celsius", 0.75, "high", "Heat Stress"),
+    ("poverty_rate", 0.75, "high", "Poverty"),
+    ("literacy_rate", 0.25, "low", "Low Literacy"),
+    ("infrastructure_score", 0.25, "low", "Infrastructure Gaps")
+]
+
+
+def severity_of(risk):
+    return next(level for bound, level in SEVERITY_LEVELS if risk >= bound)
+
+
+# Most recent feature row for every (COUNTRY, ADMIN1) pair: the store's
+# latest months when it has data, otherwise the training dataset
+def load_snapshot(store_root, data_path, window_months=3):
+    store = DatasetStore(store_root)
+    months = store.months()[-window_months:]
+    if months:
+        df = store.read(months=months)
+    elif os.path.exists(data_path):
+        df = pd.read_csv(data_path)
+    else:
+        return None
+
+    order = [col for col in ("event_date", "YEAR", "MONTH") if col in df.columns]
+    if order:
+        df = df.sort_values(order, kind="stable")
+    columns = FEATURES + [col for col in COORDINATE_COLUMNS if col in df.columns]
+    return df[columns].groupby(CATEGORICAL_COLUMNS, sort=False, observed=True).tail(1).reset_index(drop=True)
+
+
+def driving_factors(snapshot):
+    # One vectorised comparison per rule instead of a loop over regions
+    flags = []
+    for col, quantile, direction, label in FACTOR_RULES:
+        cutoff = snapshot[col].quantile(quantile)
+        hit = snapshot[col] >= cutoff if direction == "high" else snapshot[col] <= cutoff
+        flags.append(np.where(hit.to_numpy(), label, ""))
+    return [[label for label in row if label] for row in zip(*flags)]
+
+
+# One scored run: an indexed table plus the payload pieces the endpoints serve
+class RiskTable:
+    def __init__(self, records, model_version, created_at=None):
+        self.records = records
+        self.model_version = model_version
+        self.created_at = created_at or time.time()
+        self.index = {(item["country"], item["region"]): item for item in records}
+        self.by_country = {}
+        for item in records:
+            self.by_country.setdefault(item["country"], []).append(item)
+        # Precomputed once per run; requests only slice these
+        self.ranked = sorted(records, key=lambda item: item["risk"], reverse=True)
+        self.regions = sorted({item["region"] for item in records})
+        self.countries = sorted(self.by_country)
+        self.alerts = [build_alert(item, self.created_at) for item in self.ranked if item["risk"] >= ALERT_THRESHOLD]
+
+    def get(self, country, region):
+        return self.index.get((country, region))
+
+    def hotspots(self, limit=10):
+        return [
+            {
+                "region": item["region"],
+                "country": item["country"],
+                "lat": item.get("lat"),
+                "lng": item.get("lng"),
+                "risk": item["risk"],
+                "factors": item["factors"],
+                "trend": item["trend"],
+                "prediction_confidence": item["confidence"]
+            }
+            for item in self.ranked[:limit]
+        ]
+
+    def to_json(self):
+        return {"model_version": self.model_version, "created_at": self.created_at, "records": self.records}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["records"], data["model_version"], data["created_at"])
+
+
+def build_alert(item, created_at):
+    severity = severity_of(item["risk"])
+    # Higher risk is expected to materialise sooner
+    days_ahead = int(round(3 + (1 - item["risk"]) * 27))
+    timeline = {
+        "critical": "Immediate (0-48 hours)",
+        "high": "Urgent (3-7 days)",
+        "medium": "High priority (1-2 weeks)",
+        "low": "Standard (2-4 weeks)"
+    }[severity]
+    return {
+        "id": f"risk-{item['country']}-{item['region']}".replace(" ", "_"),
+        "region": item["region"],
+        "countries": [item["country"]],
+        "type": "conflict",
+        "severity": severity,
+        "risk": item["risk"],
+        "trend": item["trend"],
+        "confidence": item["confidence"],
+        "forecasted_date": (datetime.fromtimestamp(created_at) + timedelta(days=days_ahead)).strftime("%Y-%m-%d"),
+        "days_to_impact": days_ahead,
+        "driving_factors": item["factors"][:3],
+        "explanation": item.get("explanation"),
+        "humanitarian_impact": {
+            "affected_population": None,
+            "severity": severity,
+            "sectors": ["protection", "health"],
+            "vulnerable_groups": ["displaced populations"]
+        },
+        "response_recommendations": [
+            "Increase monitoring of conflict events in the region",
+            "Pre-position protection and health response capacity"
+        ],
+        "recommended_timeline": timeline,
+        "data_sources": ["conflict_events_database", "climate_models", "model_predictions"]
+    }
+
+
+def score_snapshot(snapshot, bundle, previous=None, explainer=None):
+    """Score every region of the snapshot in one predict_proba call
+
+    With an explainer, regions at alert level also get their strongest
+    per-feature contributions.
+    """
+    # Only regions the model's encoders know; others would all share the unknown code
+    known = np.ones(len(snapshot), dtype=bool)
+    for col in CATEGORICAL_COLUMNS:
+        known &= snapshot[col].astype(str).isin(bundle.label_encoders[col].classes_).to_numpy()
+    dropped = int((~known).sum())
+    if dropped:
+        print(f"Risk map: skipped {dropped} of {len(snapshot)} regions unknown to model {bundle.version}")
+    snapshot = snapshot[known].reset_index(drop=True)
+    if snapshot.empty:
+        # e.g. a new model trained on another country set; an empty run, not a failing one
+        return RiskTable([], bundle.version)
+
+    X = encode_and_scale(snapshot, bundle.scaler, bundle.label_encoders)
+    proba = bundle.model.predict_proba(X)
+    positive = list(bundle.model.classes_).index(1) if 1 in bundle.model.classes_ else proba.shape[1] - 1
+    risk = proba[:, positive]
+    factors = driving_factors(snapshot)
+
+    explanations = {}
+    if explainer is not None:
+        alerting = np.flatnonzero(risk >= ALERT_THRESHOLD)
+        if alerting.size:
+            contributions = explainer.contributions(X[alerting])
+            top = np.argsort(-np.abs(contributions), axis=1)[:, :3]
+            for i, row, order in zip(alerting, contributions, top):
+                explanations[i] = [{"feature": FEATURES[j], "contribution": round(float(row[j]), 4)} for j in order]
+
+    records = []
+    for i, row in enumerate(snapshot.itertuples(index=False)):
+        country, region = str(row.COUNTRY), str(row.ADMIN1)
+        item = {
+            "country": country,
+            "region": region,
+            "risk": round(float(risk[i]), 4),
+            "prediction": int(risk[i] >= 0.5),
+            "confidence": round(float(max(risk[i], 1 - risk[i])), 4),
+            "factors": factors[i],
+            "explanation": explanations.get(i),
+            "previous_risk": None,
+            "change": None,
+            "trend": "new"
+        }
+        for col, key in COORDINATE_COLUMNS.items():
+            if col in snapshot.columns:
+                item[key] = float(getattr(row, col))
+        last = previous.get(country, region) if previous is not None else None
+        if last is not None:
+            change = item["risk"] - last["risk"]
+            item["previous_risk"] = last["risk"]
+            item["change"] = round(change, 4)
+            item["trend"] = ("increasing" if change > TREND_THRESHOLD
+                             else "decreasing" if change < -TREND_THRESHOLD else "stable")
+        records.append(item)
+    return RiskTable(records, bundle.version)
+
+
+# Holds the current risk table and refreshes it on a schedule (and after
+# model activations); readers get the table object in one attribute read
+class RiskMap:
+    def __init__(self, registry, store_root, data_path, state_path, interval=3600, window_months=3,
+                 explanations=None):
+        self.registry = registry
+        self.explanations = explanations
+        self.store_root = store_root
+        self.data_path = data_path
+        self.state_path = state_path
+        self.interval = interval
+        self.window_months = window_months
+        self.table = None
+        # Coroutine functions awaited on the event loop with every new table
+        self.listeners = []
+        # Feature rows the table was scored from (scenario sweeps start from these)
+        self.snapshot = None
+        self.last_error = None
+        self._wake = None
+        self._loop = None
+        self._task = None
+        self._load_state()
+
+    def _load_state(self):
+        # The last run survives restarts so trends continue across deploys
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path) as f:
+                    self.table = RiskTable.from_json(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not load risk table: {str(e)}")
+
+    def _save_state(self, table):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(table.to_json(), f)
+        os.replace(tmp_path, self.state_path)
+
+    def refresh(self):
+        """Score the latest snapshot with the active model and swap in the new table"""
+        bundle = self.registry.active()
+        if bundle is None:
+            return None
+        snapshot = load_snapshot(self.store_root, self.data_path, self.window_months)
+        if snapshot is None or snapshot.empty:
+            return None
+        explainer = self.explanations.explainer(bundle) if self.explanations is not None else None
+        table = score_snapshot(snapshot, bundle, previous=self.table, explainer=explainer)
+        self._save_state(table)
+        self.snapshot = snapshot
+        self.table = table
+        print(f"Risk map refreshed: {len(table.records)} regions with model {bundle.version}")
+        return table
+
+    def latest_snapshot(self):
+        # Loaded on demand when no refresh has run in this process yet
+        if self.snapshot is None:
+            self.snapshot = load_snapshot(self.store_root, self.data_path, self.window_months)
+        return self.snapshot
+
+    def request_refresh(self, bundle=None):
+        # Safe from any thread (registry listeners run on worker threads)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                table = await run_in_threadpool(self.refresh)
+                self.last_error = None
+                if table is not None:
+                    await self._notify(table)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error refreshing risk map: {str(e)}")
+            # Retry soon while there is no table yet (e.g. the model is still loading)
+            timeout = self.interval if self.table is not None else min(self.interval, 10)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _notify(self, table):
+        for listener in self.listeners:
+            try:
+                await listener(table)
+            except Exception as e:
+                print(f"Error in risk map listener: {str(e)}")
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def status(self):
+        table = self.table
+        return {
+            "regions": len(table.records) if table else 0,
+            "model_version": table.model_version if table else None,
+            "updated_at": table.created_at if table else None,
+            "interval_seconds": self.interval,
+            "error": self.last_error
+        }
@@ -0,0 +1,102 @@
+import base64
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Largest grid edge served, and the geographic extent the grid covers
+MAX_GRID_SIZE = 1024
+GRID_BOUNDS = {"min_lng": -20.0, "min_lat": -35.0, "max_lng": 55.0, "max_lat": 38.0}
+
+# Grids are regenerated once per period so tiles of one grid stay consistent
+GRID_REFRESH_SECONDS = 300
+
+GRID_DTYPES = ["uint8", "float16", "float32"]
+
+
+@lru_cache(maxsize=4)
+def _cached_grid(size, epoch):
+    grid = generate_grid(size, seed=epoch)
+    grid.setflags(write=False)
+    return grid
+
+
+def current_grid(size):
+    """The grid for the current refresh period (read-only, shared by requests)"""
+    return _cached_grid(size, int(time.time() // GRID_REFRESH_SECONDS))
+
+
+# Synthetic terrain in [0, 1]: values rise with distance from the centre,
+# with scattered water bodies (0.1) and mountains (0.9)
+def generate_grid(size, seed=None):
+    rng = np.random.default_rng(seed)
+    rows, cols = np.indices((size, size), dtype=np.float32)
+    half = size / 2
+    dist_from_center = np.sqrt((rows - half) ** 2 + (cols - half) ** 2) / half
+
+    terrain = 0.3 + dist_from_center * 0.4 + rng.uniform(-0.1, 0.1, (size, size)).astype(np.float32)
+    water = rng.random((size, size)) < 0.05
+    mountains = rng.random((size, size)) < 0.1
+    return np.where(water, np.float32(0.1), np.where(mountains, np.float32(0.9), terrain))
+
+
+def parse_bbox(bbox):
+    values = [float(part) for part in bbox.split(",")]
+    if len(values) != 4:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    min_lng, min_lat, max_lng, max_lat = values
+    if min_lng >= max_lng or min_lat >= max_lat:
+        raise ValueError("bbox minimums must be below its maximums")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+# Cut a tile ("row,col" of tile_size cells) or a lon/lat bbox out of the grid.
+# Returns the window and its (row, col) offset; row 0 is the northern edge.
+def grid_window(grid, tile=None, tile_size=256, bbox=None):
+    size = grid.shape[0]
+    if tile is not None:
+        row, col = (int(part) for part in tile.split(","))
+        if not (0 <= row * tile_size < size and 0 <= col * tile_size < size):
+            raise ValueError(f"Tile {tile} is outside a {size}x{size} grid")
+        top, left = row * tile_size, col * tile_size
+        return grid[top:top + tile_size, left:left + tile_size], (top, left)
+    if bbox is not None:
+        min_lng, min_lat, max_lng, max_lat = parse_bbox(bbox)
+        bounds = GRID_BOUNDS
+        lng_span = bounds["max_lng"] - bounds["min_lng"]
+        lat_span = bounds["max_lat"] - bounds["min_lat"]
+        left = int(np.floor((min_lng - bounds["min_lng"]) / lng_span * size))
+        right = int(np.ceil((max_lng - bounds["min_lng"]) / lng_span * size))
+        top = int(np.floor((bounds["max_lat"] - max_lat) / lat_span * size))
+        bottom = int(np.ceil((bounds["max_lat"] - min_lat) / lat_span * size))
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, size), min(bottom, size)
+        if left >= right or top >= bottom:
+            raise ValueError("bbox does not overlap the grid")
+        return grid[top:bottom, left:right], (top, left)
+    return grid, (0, 0)
+
+
+# Quantize a [0, 1] grid for transport: value = stored * scale + offset
+def encode_grid(window, dtype="uint8"):
+    if dtype == "uint8":
+        scale, offset = 1 / 255, 0.0
+        data = np.clip(np.rint(window * 255), 0, 255).astype(np.uint8)
+    elif dtype == "float16":
+        scale, offset = 1.0, 0.0
+        data = window.astype(np.float16)
+    elif dtype == "float32":
+        scale, offset = 1.0, 0.0
+        data = window.astype(np.float32)
+    else:
+        raise ValueError(f"dtype must be one of {', '.join(GRID_DTYPES)}")
+    # Little-endian, row-major: what typed arrays in the browser expect
+    data = np.ascontiguousarray(data.astype(data.dtype.newbyteorder("<")))
+    header = {"shape": list(data.shape), "dtype": dtype, "scale": scale, "offset": offset, "byte_order": "little"}
+    return data.tobytes(), header
+
+
+def grid_payload(window, dtype="uint8", origin=(0, 0)):
+    """The grid as a JSON-safe dict with base64 data plus its decoding header"""
+    data, header = encode_grid(window, dtype)
+    return {**header, "origin": list(origin), "encoding": "base64", "data": base64.b64encode(data).decode("ascii")}
@@ -0,0 +1,179 @@
+import time
+
+import numpy as np
+
+from metrics import BATCH_SIZE, stage_timer
+from prediction import CATEGORICAL_COLUMNS, FEATURES
+
+NUMERIC_FEATURES = [col for col in FEATURES if col not in CATEGORICAL_COLUMNS]
+
+# How a perturbation value combines with the baseline value of its feature
+OPERATIONS = {
+    "scale": np.multiply,  # rainfall_mm x 0.7 is a 30% drop
+    "add": np.add,  # drought_index + 0.2
+    "set": lambda base, value: np.broadcast_to(value, np.broadcast(base, value).shape)
+}
+
+# Range perturbed values are clipped to; other features are counts or levels floored at 0
+FEATURE_LIMITS = {
+    "poverty_rate": (0.0, 1.0),
+    "literacy_rate": (0.0, 1.0),
+    "infrastructure_score": (0.0, 1.0),
+    "temp_celsius": (None, None)
+}
+
+# Rows scored per predict_proba call; larger sweeps are split on region boundaries
+SCENARIO_CHUNK_ROWS = 250000
+
+# Steps allowed in one {start, stop, steps} range
+MAX_STEPS = 1000
+
+
+def parse_perturbations(specs):
+    """Validate [{feature, mode, values | start/stop/steps}] into (feature, mode, values) triples"""
+    if not specs:
+        raise ValueError("At least one perturbation is required")
+    parsed = []
+    for spec in specs:
+        feature = spec.get("feature")
+        if feature not in NUMERIC_FEATURES:
+            raise ValueError(f"Cannot perturb {feature!r}; expected one of {', '.join(NUMERIC_FEATURES)}")
+        mode = spec.get("mode", "scale")
+        if mode not in OPERATIONS:
+            raise ValueError(f"Unknown mode {mode!r} for {feature}; expected one of {', '.join(OPERATIONS)}")
+        if "values" in spec:
+            values = np.asarray(spec["values"], dtype=np.float64).reshape(-1)
+        else:
+            steps = int(spec.get("steps", 2))
+            if not 1 <= steps <= MAX_STEPS:
+                raise ValueError(f"steps for {feature} must be between 1 and {MAX_STEPS}")
+            values = np.linspace(float(spec["start"]), float(spec["stop"]), steps)
+        if values.size == 0 or not np.isfinite(values).all():
+            raise ValueError(f"Perturbation values for {feature} must be finite numbers")
+        parsed.append((feature, mode, values))
+    return parsed
+
+
+def scenario_count(perturbations):
+    return int(np.prod([len(values) for _, _, values in perturbations]))
+
+
+def expand_scenarios(perturbations):
+    """Every combination of perturbation values as an (S, D) array, last dimension fastest"""
+    grids = np.meshgrid(*[values for _, _, values in perturbations], indexing="ij")
+    return np.stack([grid.reshape(-1) for grid in grids], axis=1)
+
+
+# Raw (R, F) feature matrix of the baseline, categorical columns already encoded
+def encode_baseline(baseline, label_encoders):
+    missing = [col for col in FEATURES if col not in baseline.columns]
+    if missing:
+        raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+    X = baseline[FEATURES].copy()
+    for col in CATEGORICAL_COLUMNS:
+        X[col] = label_encoders[col].transform(X[col])
+    return X.to_numpy(dtype=np.float64)
+
+
+def build_batch(base, perturbations, combos):
+    """(R * S, F) matrix: every baseline row under every scenario, scenarios of a row adjacent"""
+    rows, count = len(base), len(combos)
+    X = np.repeat(base, count, axis=0)
+    for d, (feature, mode, _) in enumerate(perturbations):
+        j = FEATURES.index(feature)
+        column = OPERATIONS[mode](X[:, j].reshape(rows, count), combos[None, :, d])
+        low, high = FEATURE_LIMITS.get(feature, (0.0, None))
+        if low is not None or high is not None:
+            column = np.clip(column, low, high)
+        X[:, j] = column.reshape(-1)
+    return X
+
+
+def positive_column(model):
+    classes = list(model.classes_)
+    return classes.index(1) if 1 in classes else len(classes) - 1
+
+
+def run_scenarios(base, perturbations, bundle, chunk_rows=SCENARIO_CHUNK_ROWS):
+    """Yield (row index, baseline risk, risk per scenario) for every encoded baseline row
+
+    Each chunk of regions x scenarios is scaled and scored with a single
+    predict_proba call.
+    """
+    combos = expand_scenarios(perturbations)
+    count = len(combos)
+    positive = positive_column(bundle.model)
+
+    with stage_timer("predict_proba"):
+        baseline_risk = bundle.model.predict_proba(bundle.scaler.transform(base))[:, positive]
+
+    regions_per_chunk = max(1, chunk_rows // count)
+    for start in range(0, len(base), regions_per_chunk):
+        stop = min(start + regions_per_chunk, len(base))
+        X = build_batch(base[start:stop], perturbations, combos)
+        with stage_timer("scale"):
+            X = bundle.scaler.transform(X)
+        BATCH_SIZE.observe(len(X), source="scenario")
+        with stage_timer("predict_proba"):
+            risk = bundle.model.predict_proba(X)[:, positive].reshape(stop - start, count)
+        for offset in range(stop - start):
+            yield start + offset, float(baseline_risk[start + offset]), risk[offset]
+
+
+def scenario_stream(baseline, perturbations, bundle, threshold=0.5, chunk_rows=SCENARIO_CHUNK_ROWS):
+    """NDJSON lines: a header, one risk surface per region, then a summary"""
+    started = time.perf_counter()
+    shape = [len(values) for _, _, values in perturbations]
+    combos = expand_scenarios(perturbations)
+    base = encode_baseline(baseline, bundle.label_encoders)
+    yield {
+        "type": "scenarios",
+        "model_version": bundle.version,
+        "dimensions": [{"feature": feature, "mode": mode, "values": values.tolist()}
+                       for feature, mode, values in perturbations],
+        "shape": shape,
+        "scenario_count": len(combos),
+        "region_count": len(baseline),
+        "threshold": threshold
+    }
+
+    countries = baseline["COUNTRY"].astype(str).tolist()
+    regions = baseline["ADMIN1"].astype(str).tolist()
+    names = [feature for feature, _, _ in perturbations]
+    for index, baseline_risk, risk in run_scenarios(base, perturbations, bundle, chunk_rows=chunk_rows):
+        worst = int(risk.argmax())
+        yield {
+            "type": "region",
+            "country": countries[index],
+            "region": regions[index],
+            "baseline_risk": round(baseline_risk, 4),
+            "min_risk": round(float(risk.min()), 4),
+            "mean_risk": round(float(risk.mean()), 4),
+            "max_risk": round(float(risk.max()), 4),
+            "share_above_threshold": round(float((risk >= threshold).mean()), 4),
+            "worst_scenario": dict(zip(names, combos[worst].tolist())),
+            "risk": np.round(risk, 4).reshape(shape).tolist()
+        }
+
+    elapsed = time.perf_counter() - started
+    rows = len(baseline) * (len(combos) + 1)
+    yield {
+        "type": "summary",
+        "rows_scored": rows,
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "rows_per_second": round(rows / elapsed) if elapsed > 0 else None
+    }
+
+
+# Baseline rows for {country, region} selections out of a region snapshot;
+# a selection without region takes every region of the country
+def select_baseline(snapshot, selections):
+    countries = snapshot["COUNTRY"].astype(str)
+    regions = snapshot["ADMIN1"].astype(str)
+    mask = np.zeros(len(snapshot), dtype=bool)
+    for item in selections:
+        hit = (countries == str(item.get("country"))).to_numpy()
+        if item.get("region") is not None:
+            hit = hit & (regions == str(item["region"])).to_numpy()
+        mask |= hit
+    return snapshot[mask].reset_index(drop=True)
@@ -102,6 +102,28 @@ function initializeCrisisSimulator() {
         </div>
         <div id="intervention-log" class="intervention-log"></div>
       </div>
+      
+      <div class="intervention-panel scenario-panel">
+        <h3>Model What-If Sweep</h3>
+        <p class="simulator-description">
+          Scores every combination of rainfall change and drought increase for the highest-risk regions with the trained model.
+        </p>
+        <div class="simulator-controls">
+          <div class="control-group">
+            <label for="sweep-country">Country (blank = top regions):</label>
+            <input type="text" id="sweep-country" placeholder="e.g. Sudan">
+          </div>
+          <div class="control-group">
+            <label for="sweep-steps">Steps per factor:</label>
+            <input type="number" id="sweep-steps" value="21" min="2" max="101">
+          </div>
+          <div class="control-buttons">
+            <button id="run-sweep" class="btn primary">Run Sweep</button>
+          </div>
+        </div>
+        <div id="sweep-status" class="intervention-log"></div>
+        <div id="sweep-chart" class="chart-container"></div>
+      </div>
     </div>
   `;
   
@@ -118,6 +140,7 @@ function initializeCrisisSimulator() {
   // Add event listeners
   document.getElementById('start-simulation').addEventListener('click', toggleSimulation);
   document.getElementById('reset-simulation').addEventListener('click', resetSimulation);
+  document.getElementById('run-sweep').addEventListener('click', runScenarioSweep);
   
   // Range input listeners
   document.getElementById('drought-severity').addEventListener('input', function() {
@@ -577,6 +600,110 @@ function addToInterventionLog(message) {
   log.scrollTop = log.scrollHeight;
 }
 
+// Run a server-side scenario sweep and render results as they stream in (NDJSON)
+async function runScenarioSweep() {
+  const status = document.getElementById('sweep-status');
+  const button = document.getElementById('run-sweep');
+  const country = document.getElementById('sweep-country').value.trim();
+  const steps = Math.max(2, Math.min(101, parseInt(document.getElementById('sweep-steps').value, 10) || 21));
+  
+  const request = {
+    perturbations: [
+      {feature: 'rainfall_mm', mode: 'scale', start: 0.4, stop: 1.2, steps: steps},
+      {feature: 'drought_index', mode: 'add', start: 0, stop: 1, steps: steps}
+    ]
+  };
+  if (country) {
+    request.regions = [{country: country}];
+  } else {
+    request.top = 10;
+  }
+  
+  button.disabled = true;
+  status.textContent = 'Running sweep...';
+  const regions = [];
+  let header = null;
+  
+  try {
+    const response = await fetch('/api/scenarios', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify(request)
+    });
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || response.statusText);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    while (true) {
+      const {value, done} = await reader.read();
+      if (done) break;
+      buffered += decoder.decode(value, {stream: true});
+      const lines = buffered.split('\n');
+      buffered = lines.pop();
+      for (const line of lines) {
+        if (!line) continue;
+        const message = JSON.parse(line);
+        if (message.type === 'scenarios') {
+          header = message;
+        } else if (message.type === 'region') {
+          regions.push(message);
+          status.textContent = `${regions.length} / ${header.region_count} regions scored`;
+          if (regions.length === 1) renderSweepSurface(header, message);
+        } else if (message.type === 'summary') {
+          status.textContent = `${header.scenario_count * header.region_count} scenarios across ` +
+            `${header.region_count} regions in ${Math.round(message.elapsed_ms)} ms`;
+        }
+      }
+    }
+    renderSweepRegions(header, regions);
+  } catch (error) {
+    status.textContent = `Sweep failed: ${error.message}`;
+  } finally {
+    button.disabled = false;
+  }
+}
+
+function renderSweepSurface(header, region) {
+  if (!window.Plotly) return;
+  const [rainfall, drought] = header.dimensions;
+  
+  Plotly.newPlot('sweep-chart', [{
+    x: rainfall.values.map(v => `${Math.round((v - 1) * 100)}%`),
+    y: drought.values.map(v => `+${v.toFixed(2)}`),
+    // risk is indexed [rainfall][drought]; the heatmap wants rows of y
+    z: drought.values.map((_, j) => region.risk.map(row => row[j])),
+    type: 'heatmap',
+    colorscale: 'YlOrRd',
+    zmin: 0,
+    zmax: 1
+  }], {
+    title: `Conflict risk: ${region.region}, ${region.country}`,
+    xaxis: { title: 'Rainfall change' },
+    yaxis: { title: 'Drought index increase' },
+    height: 300,
+    margin: { t: 40, b: 50, l: 70, r: 10 }
+  });
+}
+
+function renderSweepRegions(header, regions) {
+  const status = document.getElementById('sweep-status');
+  if (!status || !regions.length) return;
+  
+  regions.sort((a, b) => b.max_risk - a.max_risk);
+  const rows = regions.slice(0, 10).map(region => {
+    const worst = region.worst_scenario;
+    return `<div class="log-entry">${region.region}, ${region.country}: ` +
+      `baseline ${(region.baseline_risk * 100).toFixed(0)}%, worst ${(region.max_risk * 100).toFixed(0)}% ` +
+      `(rainfall x${worst.rainfall_mm.toFixed(2)}, drought +${worst.drought_index.toFixed(2)}), ` +
+      `${(region.share_above_threshold * 100).toFixed(0)}% of scenarios above ${header.threshold}</div>`;
+  });
+  status.innerHTML += rows.join('');
+}
+
 // Initialize when document is ready
 document.addEventListener('DOMContentLoaded', function() {
   setTimeout(initializeCrisisSimulator, 1000);
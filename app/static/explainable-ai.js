@@ -59,7 +59,6 @@ class ExplainableAI {
   
   async loadExplanationData() {
     try {
-      // In production, fetch from endpoint
       this.featureImportance = {
         "drought_index": 0.28,
         "past_conflicts_3mo": 0.24,
@@ -135,6 +134,20 @@ class ExplainableAI {
         }
       ];
       
+      // Importances of the active model replace the defaults once available
+      const response = await fetch('/api/explain/global');
+      if (response.ok) {
+        const data = await response.json();
+        const importance = data.mean_abs_contribution || data.impurity;
+        if (importance) {
+          const total = Object.values(importance).reduce((sum, value) => sum + value, 0) || 1;
+          this.featureImportance = {};
+          for (const [feature, value] of Object.entries(importance)) {
+            this.featureImportance[feature] = value / total;
+          }
+        }
+      }
+      
     } catch (error) {
       console.error("Error loading explanation data:", error);
     }
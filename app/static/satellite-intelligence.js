@@ -112,7 +112,7 @@ class SatelliteIntelligenceSystem {
     this.ctx = this.canvas.getContext('2d');
     
     // Render initial view
-    this.loadSatelliteImages().then(() => {
+    Promise.all([this.loadSatelliteImages(), this.loadSatelliteGrid()]).then(() => {
       this.renderView();
       this.renderHotspots();
       this.renderForecastChart();
@@ -317,6 +317,12 @@ class SatelliteIntelligenceSystem {
         this.ctx.globalAlpha = 0.2;
         this.ctx.drawImage(this.images.temperature, 0, 0, this.canvas.width, this.canvas.height);
       }
+      if (this.gridCanvas) {
+        this.ctx.globalAlpha = 0.35;
+        this.ctx.imageSmoothingEnabled = false;
+        this.ctx.drawImage(this.gridCanvas, 0, 0, this.canvas.width, this.canvas.height);
+        this.ctx.imageSmoothingEnabled = true;
+      }
       this.ctx.globalAlpha = 1.0;
     } else if (activeLayer === 'drought' && this.images.drought) {
       this.ctx.globalAlpha = 0.7;
@@ -336,6 +342,82 @@ class SatelliteIntelligenceSystem {
     }
   }
   
+  // Fetch the satellite grid as raw bytes (uint8 by default: one byte per cell
+  // instead of a JSON number) and turn it into an offscreen image
+  async loadSatelliteGrid(size = 256, dtype = 'uint8') {
+    try {
+      const response = await fetch(`/api/satellite-feed/grid?size=${size}&dtype=${dtype}`);
+      if (!response.ok) return;
+      const grid = this.decodeGrid(await response.arrayBuffer(), response.headers);
+      this.satelliteGrid = grid;
+      this.gridCanvas = this.buildGridCanvas(grid);
+    } catch (error) {
+      console.error('Satellite grid error:', error);
+    }
+  }
+  
+  // Typed-array view over the payload; values are stored * scale + offset
+  decodeGrid(buffer, headers) {
+    const [rows, cols] = headers.get('X-Grid-Shape').split(',').map(Number);
+    const dtype = headers.get('X-Grid-Dtype');
+    const scale = parseFloat(headers.get('X-Grid-Scale'));
+    const offset = parseFloat(headers.get('X-Grid-Offset'));
+    
+    let stored;
+    if (dtype === 'uint8') {
+      stored = new Uint8Array(buffer);
+    } else if (dtype === 'float16') {
+      stored = this.float16ToFloat32(new Uint16Array(buffer));
+    } else {
+      stored = new Float32Array(buffer);
+    }
+    
+    const values = new Float32Array(rows * cols);
+    for (let i = 0; i < values.length; i++) {
+      values[i] = stored[i] * scale + offset;
+    }
+    return {rows, cols, values};
+  }
+  
+  // IEEE half precision to single precision (no Float16Array in most browsers yet)
+  float16ToFloat32(halves) {
+    const out = new Float32Array(halves.length);
+    for (let i = 0; i < halves.length; i++) {
+      const h = halves[i];
+      const sign = h & 0x8000 ? -1 : 1;
+      const exponent = (h >> 10) & 0x1f;
+      const fraction = h & 0x03ff;
+      if (exponent === 0) {
+        out[i] = sign * Math.pow(2, -14) * (fraction / 1024);
+      } else if (exponent === 0x1f) {
+        out[i] = fraction ? NaN : sign * Infinity;
+      } else {
+        out[i] = sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+      }
+    }
+    return out;
+  }
+  
+  buildGridCanvas(grid) {
+    const canvas = document.createElement('canvas');
+    canvas.width = grid.cols;
+    canvas.height = grid.rows;
+    const ctx = canvas.getContext('2d');
+    const image = ctx.createImageData(grid.cols, grid.rows);
+    
+    // Low values (water) blue, mid terrain green, high values (mountains, arid) brown
+    for (let i = 0; i < grid.values.length; i++) {
+      const v = grid.values[i];
+      const p = i * 4;
+      image.data[p] = Math.round(60 + v * 140);
+      image.data[p + 1] = Math.round(v < 0.2 ? 90 : 170 - v * 90);
+      image.data[p + 2] = Math.round(v < 0.2 ? 200 : 60);
+      image.data[p + 3] = 255;
+    }
+    ctx.putImageData(image, 0, 0);
+    return canvas;
+  }
+  
   renderConflictRiskLayer() {
     if (!this.ctx) return;
     
@@ -795,11 +877,9 @@ class SatelliteIntelligenceSystem {
     // Update live metrics periodically
     setInterval(() => this.updateLiveMetrics(), 5000);
     
-    // Simulate satellite data updates
+    // Refresh the satellite grid
     setInterval(() => {
-      // In a real implementation, this would fetch fresh satellite data
-      // For demo, just make small adjustments to the rendered view
-      this.renderView();
+      this.loadSatelliteGrid().then(() => this.renderView());
     }, 30000);
   }
   
@@ -2,6 +2,10 @@
 let trainingSocket;
 let learningCurvesChart;
 
+// Training status as last received; deltas are applied on top of it
+let trainingState = null;
+let trainingSeq = 0;
+
 // Initialize websocket connection to training backend
 function initializeTrainingMonitor() {
   // Close existing connection if any
@@ -22,7 +26,20 @@ function initializeTrainingMonitor() {
   
   trainingSocket.onmessage = function(event) {
     const data = JSON.parse(event.data);
-    updateTrainingUI(data);
+    // Batch-scoring job progress shares this socket; only training updates drive this UI
+    if (data.type === 'job') return;
+    
+    if (data.type === 'training_snapshot') {
+      trainingState = data.state;
+      trainingSeq = data.seq;
+      updateTrainingUI(trainingState);
+    } else if (data.type === 'training_delta') {
+      // Deltas already contained in the snapshot we hold are skipped
+      if (!trainingState || data.seq <= trainingSeq) return;
+      const newLogLines = applyTrainingDelta(trainingState, data);
+      trainingSeq = data.seq;
+      updateTrainingUI(trainingState, newLogLines);
+    }
   };
   
   trainingSocket.onclose = function(event) {
@@ -45,8 +62,25 @@ function initializeTrainingMonitor() {
   };
 }
 
-// Update the UI based on training status
-function updateTrainingUI(data) {
+// Apply set/append fields of a delta to the held state; returns the new log lines
+function applyTrainingDelta(state, delta) {
+  Object.assign(state, delta.set || {});
+  for (const [key, items] of Object.entries(delta.append || {})) {
+    if (Array.isArray(items)) {
+      state[key] = (state[key] || []).concat(items);
+    } else {
+      // Dict of lists, e.g. learning_curves
+      state[key] = state[key] || {};
+      for (const [name, values] of Object.entries(items)) {
+        state[key][name] = (state[key][name] || []).concat(values);
+      }
+    }
+  }
+  return (delta.append && delta.append.log_messages) || [];
+}
+
+// Update the UI based on training status; with newLogLines only those are added to the log
+function updateTrainingUI(data, newLogLines) {
   // Update progress bar
   const progressBar = document.getElementById('progress-bar');
   const progressPercent = document.getElementById('progress-percent');
@@ -71,7 +105,12 @@ function updateTrainingUI(data) {
   
   // Update training log
   const trainingLog = document.getElementById('training-log');
-  if (trainingLog && data.log_messages) {
+  if (trainingLog && newLogLines) {
+    if (newLogLines.length) {
+      trainingLog.insertAdjacentHTML('beforeend', newLogLines.map(msg => `<div>${msg}</div>`).join(''));
+      trainingLog.scrollTop = trainingLog.scrollHeight;
+    }
+  } else if (trainingLog && data.log_messages) {
     trainingLog.innerHTML = data.log_messages.map(msg => `<div>${msg}</div>`).join('');
     trainingLog.scrollTop = trainingLog.scrollHeight;
   }
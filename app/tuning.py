@@ -0,0 +1,199 @@
+import itertools
+import os
+import random
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from model import evaluation_metrics
+from preprocessing import load_and_preprocess_data
+from profiling import profile_in_worker, profiler
+from registry import ModelRegistry
+
+STRATEGIES = ["grid", "random", "halving"]
+
+# Searched when /retrain asks for a search without giving a space
+DEFAULT_SPACE = {
+    "n_estimators": [100, 200, 400],
+    "max_depth": [None, 10, 20, 30],
+    "min_samples_leaf": [1, 2, 5],
+    "max_features": ["sqrt", "log2", 0.5]
+}
+
+# Training matrices mapped read-only, once per trial worker process
+_shared = {}
+
+
+def _shared_matrices(data_dir):
+    if data_dir not in _shared:
+        _shared.clear()
+        _shared[data_dir] = tuple(
+            np.load(os.path.join(data_dir, f"{name}.npy"), mmap_mode='r')
+            for name in ("X_train", "y_train", "X_test", "y_test")
+        )
+    return _shared[data_dir]
+
+
+# Save the split once so every trial maps the same pages instead of
+# receiving its own pickled copy of the data
+def share_matrices(X_train, y_train, X_test, y_test):
+    data_dir = tempfile.mkdtemp(prefix="search-")
+    arrays = {"X_train": X_train, "y_train": y_train, "X_test": X_test, "y_test": y_test}
+    for name, array in arrays.items():
+        np.save(os.path.join(data_dir, f"{name}.npy"), np.ascontiguousarray(array))
+    return data_dir
+
+
+# One trial: fit a candidate single-threaded and score it on the validation split
+def run_trial(data_dir, params, random_state=42):
+    X_train, y_train, X_test, y_test = _shared_matrices(data_dir)
+    model = RandomForestClassifier(n_jobs=1, random_state=random_state, **params)
+    model.fit(X_train, y_train)
+    return evaluation_metrics(y_test, model.predict(X_test))
+
+
+def candidates(strategy, space, n_trials=20, seed=42):
+    """Parameter dicts to try: the whole grid, or n_trials distinct draws from it"""
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    if strategy == "grid":
+        return grid
+    return random.Random(seed).sample(grid, min(n_trials, len(grid)))
+
+
+# Successive halving: (candidates, trees) per rung, keeping the best 1/eta
+# of the candidates and multiplying the trees by eta at every rung
+def halving_schedule(n_candidates, eta=3, min_trees=25, max_trees=200):
+    schedule = [(n_candidates, min_trees)]
+    while schedule[-1][0] > 1 and schedule[-1][1] < max_trees:
+        count, trees = schedule[-1]
+        schedule.append((max(1, count // eta), min(trees * eta, max_trees)))
+    return schedule
+
+
+# Turn /retrain training_params["search"] into run_search arguments
+def parse_search_params(search):
+    options = {
+        "strategy": search.get("strategy", "random"),
+        "space": search.get("space") or DEFAULT_SPACE,
+        "n_trials": int(search.get("n_trials", 20)),
+        "metric": search.get("metric", "f1_score"),
+        "eta": int(search.get("eta", 3)),
+        "min_trees": int(search.get("min_trees", 25)),
+        "max_trees": int(search.get("max_trees", 200)),
+        "max_workers": int(search["max_workers"]) if search.get("max_workers") else None
+    }
+    if options["strategy"] not in STRATEGIES:
+        raise ValueError(f"Unknown search strategy '{options['strategy']}', expected one of {STRATEGIES}")
+    if options["eta"] < 2:
+        raise ValueError("eta must be at least 2")
+    return options
+
+
+# Score candidates across the pool; on_trial(result) runs as each one finishes
+def _run_rung(pool, data_dir, batch, results, on_trial, rung=None):
+    futures = {pool.submit(run_trial, data_dir, params): params for params in batch}
+    finished = []
+    for future in as_completed(futures):
+        result = {"trial": len(results) + 1, "params": futures[future], "metrics": future.result(), "rung": rung}
+        results.append(result)
+        finished.append(result)
+        on_trial(result)
+    return finished
+
+
+def run_search(X_train, y_train, X_test, y_test, strategy="random", space=None, n_trials=20,
+               metric="f1_score", eta=3, min_trees=25, max_trees=200, max_workers=None, on_trial=None):
+    """Search RandomForest parameters in a process pool and return the best candidate and all trials"""
+    space = space or DEFAULT_SPACE
+    on_trial = on_trial or (lambda result: None)
+    data_dir = share_matrices(X_train, y_train, X_test, y_test)
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            if strategy == "halving":
+                # The forest size is the budget, so it is not part of the space
+                space = {name: values for name, values in space.items() if name != "n_estimators"}
+                survivors = candidates("random", space, n_trials)
+                for rung, (_, trees) in enumerate(halving_schedule(len(survivors), eta, min_trees, max_trees)):
+                    batch = [{**params, "n_estimators": trees} for params in survivors]
+                    final = _run_rung(pool, data_dir, batch, results, on_trial, rung)
+                    final.sort(key=lambda item: item["metrics"][metric], reverse=True)
+                    survivors = [
+                        {k: v for k, v in item["params"].items() if k != "n_estimators"}
+                        for item in final[:max(1, len(final) // eta)]
+                    ]
+            else:
+                final = _run_rung(pool, data_dir, candidates(strategy, space, n_trials), results, on_trial)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    best = max(final, key=lambda item: item["metrics"][metric])
+    return best, results
+
+
+# Hyperparameter search for /retrain with a "search" section; executed in
+# the training process like run_training_job, with trial events on progress_queue
+def run_search_job(data_path, model_output_path, params, progress_queue=None, profile_config=None):
+    def report(event, **fields):
+        if progress_queue is not None:
+            progress_queue.put({"event": event, **fields})
+
+    profile_in_worker(profile_config, progress_queue)
+    options = parse_search_params(params["search"])
+    if options["strategy"] == "halving":
+        space = {name: values for name, values in options["space"].items() if name != "n_estimators"}
+        n_candidates = len(candidates("random", space, options["n_trials"]))
+        total = sum(count for count, _ in halving_schedule(
+            n_candidates, options["eta"], options["min_trees"], options["max_trees"]
+        ))
+    else:
+        total = len(candidates(options["strategy"], options["space"], options["n_trials"]))
+
+    report("phase", name="Data loading and preprocessing", progress=2)
+    with profiler.capture("train:preprocess"):
+        X_train, X_test, y_train, y_test, scaler, label_encoders = load_and_preprocess_data(
+            data_path, test_size=float(params.get("test_size", 0.2))
+        )
+    report("log", message=f"Searching {total} trials ({options['strategy']}) on {len(X_train)} training rows")
+
+    report("phase", name="Hyperparameter search", progress=10)
+    best_score = [None]
+
+    def on_trial(result):
+        score = result["metrics"][options["metric"]]
+        if best_score[0] is None or score > best_score[0]:
+            best_score[0] = score
+        report("trial", total=total, metric=options["metric"], best_score=best_score[0], **result)
+
+    with profiler.capture("train:search"):
+        best, trials = run_search(X_train, y_train, X_test, y_test, on_trial=on_trial, **options)
+    report("log", message=f"Best parameters: {best['params']} ({options['metric']}: {best['metrics'][options['metric']]:.4f})")
+
+    # Refit the winner with every core and publish it like any other run
+    report("phase", name="Refitting best candidate", progress=92)
+    with profiler.capture("train:fit"):
+        model = RandomForestClassifier(n_jobs=-1, random_state=42, **best["params"])
+        model.fit(X_train, y_train)
+        model.set_params(n_jobs=None)
+    with profiler.capture("train:evaluate"):
+        metrics = evaluation_metrics(y_test, model.predict(X_test))
+
+    report("phase", name="Model deployment", progress=96)
+    with profiler.capture("train:publish"):
+        registry = ModelRegistry(model_output_path)
+        version = registry.publish(model, scaler, label_encoders, metadata={
+            "metrics": metrics,
+            "params": best["params"],
+            "data_path": data_path,
+            "mode": "search",
+            "search": {
+                "strategy": options["strategy"],
+                "metric": options["metric"],
+                "trials": [{k: item[k] for k in ("params", "metrics", "rung")} for item in trials]
+            }
+        })
+    return {"version": version, "metrics": metrics}
@@ -0,0 +1,185 @@
+# Micro-benchmarks for the prediction path, with a stored baseline
+#
+#   python locust/benchmarks.py                    # run and compare with the baseline
+#   python locust/benchmarks.py --save-baseline    # run and record a new baseline
+#
+# Covers what the request paths call: predict_single (/predict), predict_batch
+# (the JSON batch API and the micro-batcher) and predict_file_chunked on CSV
+# and Parquet (/upload and batch jobs).
+#
+# Exits non-zero when a benchmark is slower than the baseline by more than
+# --tolerance, so it can gate a performance change. Best-of-N timings are
+# compared as ratios to a fixed numpy/Python reference workload timed in the
+# same run, which absorbs a uniformly faster or slower machine. It does not
+# absorb differences in CPU count, cache size or library builds: the baseline
+# records the machine it was made on and must be regenerated (--save-baseline)
+# on the machine that runs the gate. On shared/virtualised hosts the file
+# benchmarks still vary by 20-30% between runs; raise --tolerance there.
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from payloads import MODEL_DIR, csv_payload, random_record  # noqa: E402
+from prediction import load_model_components, pa, predict_batch, predict_file_chunked, predict_single  # noqa: E402
+
+BASELINE_PATH = os.path.join(HERE, "benchmark_baseline.json")
+
+# Benchmark every other one is measured against
+REFERENCE = "reference"
+
+# Statistic compared with the baseline; the fastest round is the least
+# disturbed by other load on the machine
+STAT = "min_ms"
+
+
+def reference_workload():
+    # Fixed mix of vectorised and interpreted work, independent of the model
+    values = np.random.default_rng(0).random(200000)
+    np.sort(values)
+    sum(i * i for i in range(100000))
+
+
+def measure(func, repeat, warmup=1):
+    """Wall-clock seconds of each call after warmup calls"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        "rounds": len(timings),
+        "mean_ms": statistics.mean(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": timings[0] * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000
+    }
+
+
+def run_benchmarks(model_dir, repeat, batch_sizes, file_rows):
+    model, scaler, label_encoders = load_model_components(model_dir)
+    rng = random.Random(0)
+    records = [random_record(rng) for _ in range(max([256] + batch_sizes))]
+    position = [0]
+    results = {}
+    reference_timings = []
+
+    def bench(name, func, rounds):
+        # Reference rounds are interleaved so it sees the same machine load
+        reference_timings.extend(measure(reference_workload, 3))
+        results[name] = summarize(measure(func, rounds))
+
+    def single():
+        # predict_single mutates its input, so hand it a fresh copy
+        position[0] = (position[0] + 1) % len(records)
+        predict_single(dict(records[position[0]]), model, scaler, label_encoders)
+
+    bench("load_model_components", lambda: load_model_components(model_dir), max(3, repeat // 10))
+    bench("predict_single", single, repeat)
+
+    for size in batch_sizes:
+        batch = records[:size]
+        rounds = max(3, repeat // max(1, size // 100))
+        bench(f"predict_batch[{size}]", lambda: predict_batch(batch, model, scaler, label_encoders), rounds)
+
+    formats = ["csv"] + (["parquet"] if pa is not None else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in file_rows:
+            df = pd.read_csv(io.BytesIO(csv_payload(rows, seed=rows)))
+            rounds = max(3, repeat // max(1, rows // 100))
+            for fmt in formats:
+                path = os.path.join(tmp, f"bench_{rows}.{fmt}")
+                output_path = os.path.join(tmp, f"bench_{rows}_predicted.{fmt}")
+                if fmt == "csv":
+                    df.to_csv(path, index=False)
+                else:
+                    df.to_parquet(path, index=False)
+                bench(f"predict_file_chunked[{fmt},{rows}]", lambda: predict_file_chunked(
+                    path, output_path, model, scaler, label_encoders
+                ), rounds)
+
+    results[REFERENCE] = summarize(reference_timings)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Regressions in time relative to the reference workload of each run"""
+    regressions = []
+    reference = results[REFERENCE][STAT]
+    base_reference = baseline.get("results", {}).get(REFERENCE, {}).get(STAT)
+    if base_reference is None:
+        print("Baseline has no reference workload; regenerate it with --save-baseline")
+        return [REFERENCE]
+    print(f"reference workload: {reference:.3f} ms (baseline {base_reference:.3f} ms)")
+    print(f"{'benchmark':40} {STAT:>10} {'baseline':>10} {'change':>8}")
+    for name, stats in results.items():
+        if name == REFERENCE:
+            continue
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:40} {stats[STAT]:10.3f} {'-':>10} {'new':>8}")
+            continue
+        change = (stats[STAT] / reference) / (base[STAT] / base_reference) - 1
+        flag = " <-- slower" if change > tolerance else ""
+        print(f"{name:40} {stats[STAT]:10.3f} {base[STAT]:10.3f} {change:+8.1%}{flag}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prediction path micro-benchmarks")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--repeat", type=int, default=200, help="rounds for predict_single")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 256])
+    parser.add_argument("--file-rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.model_dir, args.repeat, args.batch_sizes, args.file_rows)
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                            "cpus": os.cpu_count()},
+                "results": results
+            }, f, indent=2)
+        for name, stats in results.items():
+            print(f"{name:40} {stats[STAT]:10.3f} ms")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Slower than baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# Load tests for the conflict prediction service
+#
+#   locust -f locust/locustfile.py --host http://localhost:8000
+#
+# Payloads are built from the encoder vocabularies and scaler in models/,
+# so predictions exercise real categories (plus a few unseen regions).
+# /ws/training subscribers need the websocket-client package.
+import json
+import random
+import time
+
+from locust import HttpUser, User, between, events, task
+
+from payloads import csv_payload, form_payload, random_record
+
+try:
+    import websocket
+except ImportError:  # WebSocket subscribers are skipped without websocket-client
+    websocket = None
+
+# Rows per generated upload file, with how often each size is uploaded
+UPLOAD_SIZES = {100: 6, 1000: 3, 10000: 1}
+
+# Upload files are generated once per Locust process, not per request
+UPLOAD_FILES = {}
+
+
+@events.test_start.add_listener
+def build_upload_files(environment, **kwargs):
+    for rows in UPLOAD_SIZES:
+        UPLOAD_FILES[rows] = csv_payload(rows, seed=rows)
+
+
+# Analysts on the dashboard: mostly single predictions and the polled /api views
+class DashboardUser(HttpUser):
+    wait_time = between(1, 3)
+    weight = 8
+
+    @task(10)
+    def predict_form(self):
+        self.client.post("/predict", data=form_payload(random_record()), name="/predict")
+
+    @task(3)
+    def predict_batch(self):
+        records = [random_record() for _ in range(random.choice([10, 50, 200]))]
+        self.client.post("/api/predict/batch", json={"records": records}, name="/api/predict/batch")
+
+    @task(6)
+    def satellite_feed(self):
+        # advanced.js polls this every 5 seconds
+        self.client.get("/api/satellite-feed")
+
+    @task(3)
+    def early_warning(self):
+        self.client.get("/api/early-warning")
+
+    @task(2)
+    def regions(self):
+        self.client.get("/api/regions")
+
+    @task(2)
+    def system_status(self):
+        self.client.get("/api/system-status")
+
+    @task(1)
+    def visualization_data(self):
+        self.client.get("/api/visualization-data")
+
+    @task(1)
+    def model_performance(self):
+        self.client.get("/api/model-performance")
+
+    @task(1)
+    def training_status(self):
+        self.client.get("/api/training-status")
+
+    @task(1)
+    def inference_stats(self):
+        self.client.get("/api/inference-stats")
+
+    @task(1)
+    def models(self):
+        self.client.get("/api/models")
+
+    @task(1)
+    def home(self):
+        self.client.get("/")
+
+
+# Batch scoring through /upload with small, medium and large files
+class UploadUser(HttpUser):
+    wait_time = between(5, 15)
+    weight = 1
+
+    @task
+    def upload_csv(self):
+        rows = random.choices(list(UPLOAD_SIZES), weights=list(UPLOAD_SIZES.values()))[0]
+        if rows not in UPLOAD_FILES:
+            UPLOAD_FILES[rows] = csv_payload(rows, seed=rows)
+        files = {"file": (f"load_{rows}.csv", UPLOAD_FILES[rows], "text/csv")}
+        self.client.post("/upload", files=files, name=f"/upload [{rows} rows]")
+
+
+if websocket is not None:
+    # Training monitor tabs: hold a /ws/training connection and read broadcasts
+    class TrainingSubscriber(User):
+        wait_time = between(0, 1)
+        weight = 1
+
+        def on_start(self):
+            url = self.host.replace("http", "ws", 1).rstrip("/") + "/ws/training"
+            start = time.perf_counter()
+            try:
+                self.ws = websocket.create_connection(url, timeout=10)
+                self.ws.recv()  # initial status snapshot
+                self._fire("connect", start, 0)
+            except Exception as e:
+                self.ws = None
+                self._fire("connect", start, 0, e)
+
+        def on_stop(self):
+            if self.ws is not None:
+                self.ws.close()
+
+        def _fire(self, name, start, length, exception=None):
+            self.environment.events.request.fire(
+                request_type="WS", name=f"/ws/training {name}",
+                response_time=(time.perf_counter() - start) * 1000,
+                response_length=length, exception=exception, context={}
+            )
+
+        @task
+        def receive(self):
+            if self.ws is None:
+                self.on_start()
+                return
+            self.ws.settimeout(5)
+            start = time.perf_counter()
+            try:
+                message = self.ws.recv()
+                json.loads(message)
+                self._fire("message", start, len(message))
+            except websocket.WebSocketTimeoutException:
+                # Idle between training runs is normal, not a failure
+                pass
+            except Exception as e:
+                self._fire("message", start, 0, e)
+                self.ws = None
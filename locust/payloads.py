@@ -0,0 +1,87 @@
+# Request payloads shared by the Locust suite and the benchmarks, built from
+# the encoder vocabularies and the scaler's training statistics so they
+# exercise real categories and in-distribution feature values
+import io
+import os
+import random
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from prediction import CATEGORICAL_COLUMNS, FEATURES  # noqa: E402
+from scenarios import FEATURE_LIMITS  # noqa: E402
+
+MODEL_DIR = os.environ.get("LOCUST_MODEL_DIR", os.path.join(os.path.dirname(__file__), "..", "models"))
+
+# Share of generated records that use a region the encoders never saw
+UNKNOWN_REGION_RATE = 0.02
+
+# Whole-number features; fatalities are heavy-tailed, so drawn exponentially
+COUNT_FEATURES = ["total_events", "total_fatalities", "past_conflicts_3mo"]
+HEAVY_TAILED_FEATURES = ["total_fatalities"]
+
+
+def load_vocabularies(model_dir=MODEL_DIR):
+    encoders = joblib.load(os.path.join(model_dir, "label_encoders.pkl"))
+    return {col: [str(label) for label in encoder.classes_] for col, encoder in encoders.items()}
+
+
+def load_feature_distributions(model_dir=MODEL_DIR):
+    """(mean, standard deviation) of each numeric feature in the training data"""
+    scaler = joblib.load(os.path.join(model_dir, "scaler.pkl"))
+    return {
+        col: (float(mean), float(std))
+        for col, mean, std in zip(FEATURES, scaler.mean_, scaler.scale_)
+        if col not in CATEGORICAL_COLUMNS
+    }
+
+
+VOCABULARIES = load_vocabularies()
+DISTRIBUTIONS = load_feature_distributions()
+
+
+def random_value(col, rng=random):
+    mean, std = DISTRIBUTIONS[col]
+    value = rng.expovariate(1 / mean) if col in HEAVY_TAILED_FEATURES and mean > 0 else rng.gauss(mean, std)
+    # Clipped like scenario perturbations: rates to 0-1, everything else floored at 0
+    low, high = FEATURE_LIMITS.get(col, (0.0, None))
+    if low is not None:
+        value = max(value, low)
+    if high is not None:
+        value = min(value, high)
+    return int(round(value)) if col in COUNT_FEATURES else round(value, 3)
+
+
+def random_record(rng=random):
+    """One feature record drawn around the training data's feature distributions"""
+    region = rng.choice(VOCABULARIES["ADMIN1"])
+    if rng.random() < UNKNOWN_REGION_RATE:
+        region = f"Unmapped Region {rng.randint(1, 999)}"
+    record = {"COUNTRY": rng.choice(VOCABULARIES["COUNTRY"]), "ADMIN1": region}
+    for col in DISTRIBUTIONS:
+        record[col] = random_value(col, rng)
+    return record
+
+
+def form_payload(record):
+    # /predict takes the dashboard's form field names
+    return {
+        "country": record["COUNTRY"],
+        "region": record["ADMIN1"],
+        **{key: value for key, value in record.items() if key not in ("COUNTRY", "ADMIN1")}
+    }
+
+
+def csv_payload(rows, seed=0):
+    rng = random.Random(seed)
+    df = pd.DataFrame([random_record(rng) for _ in range(rows)])
+    df.insert(0, "id", np.arange(rows))
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False)
+    return buffer.getvalue()